@@ -0,0 +1,64 @@
+"""
+bench_calibration.py — Compare the row-wise apply calibration with the
+vectorized engine in src/calibrations.py.
+
+Usage: python benchmarks/bench_calibration.py [--rows 1000000 10000000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.calibrations import CALIBRATION, apply_calibration
+
+
+def make_frame(n_rows, seed=42):
+    "Random readings across all calibrated types plus one uncalibrated type."
+    rng = np.random.default_rng(seed)
+    reading_types = list(CALIBRATION) + ["pressure"]
+    return pd.DataFrame({
+        "reading_type": pd.Categorical(rng.choice(reading_types, n_rows)),
+        "value": rng.normal(30, 10, n_rows),
+    })
+
+
+def apply_path(df):
+    "The previous transform_dataframe implementation."
+    def normalize(row):
+        params = CALIBRATION.get(row["reading_type"], {"multiplier": 1, "offset": 0})
+        return row["value"] * params["multiplier"] + params["offset"]
+
+    return df.apply(normalize, axis=1).to_numpy()
+
+
+def vectorized_path(df):
+    return apply_calibration(df["reading_type"], df["value"].to_numpy())
+
+
+def timed(fn, df):
+    start = time.perf_counter()
+    result = fn(df)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'apply (s)':>12} {'vectorized (s)':>15} {'speedup':>10}")
+    for n_rows in args.rows:
+        df = make_frame(n_rows)
+        expected, apply_secs = timed(apply_path, df)
+        actual, vec_secs = timed(vectorized_path, df)
+        np.testing.assert_allclose(actual, expected)
+        print(f"{n_rows:>12,} {apply_secs:>12.3f} {vec_secs:>15.4f} {apply_secs / vec_secs:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
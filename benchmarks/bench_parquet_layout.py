@@ -0,0 +1,101 @@
+"""
+bench_parquet_layout.py — File size, write time and query time of transformed
+data written with pandas' to_parquet defaults vs the writer configuration in
+src/parquet_writer.py (sorted, sized row groups, statistics/page index,
+per-column encodings, zstd).
+
+Queries: one sensor's readings, and one hour of all sensors, with pyarrow
+filters and with DuckDB. "groups" is how many row groups the min/max
+statistics leave to read.
+
+Usage: python benchmarks/bench_parquet_layout.py [--sensors 200] [--days 2] [--freq 1min]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import duckdb
+import pandas as pd
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from synthetic import generate_day
+from src.parquet_writer import write_frame
+from src.transform import clean_dataframe, transform_dataframe
+
+LAYOUTS = {
+    "to_parquet defaults": lambda df, path: df.to_parquet(path, index=False),
+    "tuned, snappy": lambda df, path: write_frame(df, path, compression="snappy", compression_level=None),
+    "tuned, zstd": write_frame,
+}
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def groups_to_read(path, column, low, high):
+    "Row groups whose min/max statistics overlap [low, high]."
+    meta = pq.ParquetFile(path).metadata
+    index = pq.ParquetFile(path).schema_arrow.get_field_index(column)
+    count = 0
+    for i in range(meta.num_row_groups):
+        stats = meta.row_group(i).column(index).statistics
+        if stats is None or not stats.has_min_max or (stats.min <= high and stats.max >= low):
+            count += 1
+    return f"{count}/{meta.num_row_groups}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sensors", type=int, default=200)
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("--freq", default="1min")
+    args = parser.parse_args()
+
+    raw = pd.concat([generate_day(day, sensors=args.sensors, freq=args.freq)
+                     for day in pd.date_range("2025-06-01", periods=args.days)], ignore_index=True)
+    df = transform_dataframe(clean_dataframe(raw))
+    # Shuffle so the untuned layout sees rows in arrival order, not the transform's sort
+    df = df.sample(frac=1.0, random_state=0).reset_index(drop=True)
+    print(f"{len(df):,} transformed rows, {args.sensors} sensors, {args.days} day(s)\n")
+
+    sensor = "sensor_0007"
+    hour_start = pd.Timestamp("2025-06-01 12:00", tz="UTC")
+    hour_end = hour_start + pd.Timedelta("1h")
+    print(f"{'layout':<22}{'MB':>8}{'write s':>9}{'sensor s':>10}{'groups':>9}{'hour s':>9}{'groups':>9}"
+          f"{'duckdb sensor':>15}{'duckdb hour':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, write in LAYOUTS.items():
+            path = os.path.join(tmp, name.replace(" ", "_").replace(",", "") + ".parquet")
+            write_s = timed(lambda: write(df, path), repeat=1)
+            size_mb = os.path.getsize(path) / 1e6
+
+            sensor_s = timed(lambda: pq.read_table(path, filters=[("sensor_id", "==", sensor)]))
+            hour_s = timed(lambda: pq.read_table(path, filters=[("timestamp", ">=", hour_start),
+                                                                ("timestamp", "<", hour_end)]))
+            con = duckdb.connect()
+            duck_sensor = timed(lambda: con.execute(
+                "SELECT AVG(value) FROM read_parquet(?) WHERE sensor_id = ?", [path, sensor]).fetchall())
+            duck_hour = timed(lambda: con.execute(
+                "SELECT AVG(value) FROM read_parquet(?) WHERE timestamp >= ? AND timestamp < ?",
+                [path, hour_start.to_pydatetime(), hour_end.to_pydatetime()]).fetchall())
+            con.close()
+
+            print(f"{name:<22}{size_mb:8.1f}{write_s:9.2f}{sensor_s:10.3f}"
+                  f"{groups_to_read(path, 'sensor_id', sensor, sensor):>9}{hour_s:9.3f}"
+                  f"{groups_to_read(path, 'timestamp', hour_start, hour_end):>9}"
+                  f"{duck_sensor:15.3f}{duck_hour:13.3f}")
+
+
+if __name__ == "__main__":
+    main()
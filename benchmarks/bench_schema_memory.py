@@ -0,0 +1,81 @@
+"""
+bench_schema_memory.py — Per-stage in-memory size of sensor frames with the
+legacy dtypes (object strings, float64, string timestamps) and with the
+compact schema in src/schema.py.
+
+Usage: python benchmarks/bench_schema_memory.py [--rows 1000000]
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pyarrow as pa
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.schema import enforce_schema, to_frame
+from src.transform import clean_dataframe, transform_dataframe
+
+
+def make_raw_table(n_rows, n_sensors=200, seed=42):
+    "Raw readings as ingestion receives them: string ids/types, float64 values."
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2025-06-01T00:00:00", "us")
+    return pa.table({
+        "sensor_id": [f"sensor_{i:04d}" for i in rng.integers(0, n_sensors, n_rows)],
+        "timestamp": start + rng.integers(0, 86_400, n_rows).astype("timedelta64[s]"),
+        "reading_type": rng.choice(["temperature", "humidity", "soil_moisture", "light_intensity"], n_rows),
+        "value": rng.normal(30, 10, n_rows),
+        "battery_level": rng.uniform(0, 100, n_rows),
+    })
+
+
+def legacy_frame(table):
+    "The dtypes every stage used before: Python object strings and float64."
+    df = table.to_pandas()
+    for col in ["sensor_id", "reading_type"]:
+        df[col] = df[col].astype(object)
+    return df
+
+
+def megabytes(data):
+    if isinstance(data, pa.Table):
+        return data.nbytes / 1e6
+    return data.memory_usage(deep=True).sum() / 1e6
+
+
+def run(n_rows):
+    raw = make_raw_table(n_rows)
+    stages = {}
+
+    legacy = legacy_frame(raw)
+    compact = to_frame(enforce_schema(raw))
+    stages["ingest"] = (legacy, compact)
+
+    legacy_clean, compact_clean = clean_dataframe(legacy), clean_dataframe(compact)
+    stages["clean"] = (legacy_clean, compact_clean)
+
+    # transform_dataframe adds columns in place, so give it copies
+    legacy_out, compact_out = transform_dataframe(legacy_clean.copy()), transform_dataframe(compact_clean.copy())
+    stages["transform"] = (legacy_out, compact_out)
+
+    # The loader streams Arrow batches, so measure the Arrow tables it reads
+    stages["load"] = (pa.Table.from_pandas(legacy_out, preserve_index=False),
+                      enforce_schema(pa.Table.from_pandas(compact_out, preserve_index=False)))
+
+    for stage, (before, after) in stages.items():
+        b, a = megabytes(before), megabytes(after)
+        print(f"{stage:>10}: legacy {b:9.1f} MB   compact {a:9.1f} MB   {b / a:5.1f}x smaller")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    print(f"{args.rows:,} rows")
+    run(args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+bench_sharding.py — Scaling of the sharded pipeline (src/sharding.py) over
+1/2/4/8 worker processes on synthetic raw data, against a single-node staged
+run. Every sharded run is checked to produce a byte-identical final dataset.
+
+Worker processes share this machine, so speedups are capped by its cores
+(and halo replays add work per shard); on several nodes each shard gets its own.
+
+Usage: python benchmarks/bench_sharding.py [--days 16] [--sensors 100] [--freq 5min] [--workers 1 2 4 8] [--by date]
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from synthetic import generate_dataset
+from src import ingestion, loader, validate
+from src.sharding import run_sharded
+from src.transform import clean_and_transform_all_files
+
+
+def dataset_digest(root):
+    "SHA-256 over the relative paths and bytes of every Parquet file under root."
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(f for f in filenames if f.endswith(".parquet")):
+            path = os.path.join(dirpath, name)
+            digest.update(os.path.relpath(path, root).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def use_dirs(root):
+    "Point the module-level paths of the stages at a fresh run directory."
+    dirs = {name: os.path.join(root, name) for name in ["processed", "cleaned", "transformed", "final"]}
+    ingestion.CHECKPOINT_FILE = os.path.join(root, "last_ingested.txt")
+    loader.TRANSFORMED_DIR = validate.TRANSFORMED_DIR = dirs["transformed"]
+    loader.FINAL_OUTPUT_DIR = dirs["final"]
+    validate.REPORT_PATH = os.path.join(root, "report.csv")
+    return dirs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=16)
+    parser.add_argument("--sensors", type=int, default=100)
+    parser.add_argument("--freq", default="5min")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--by", choices=["date", "sensor"], default="date")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        generate_dataset(raw_dir, days=args.days, sensors=args.sensors, freq=args.freq)
+
+        dirs = use_dirs(os.path.join(tmp, "single"))
+        start = time.perf_counter()
+        ingestion.ingest_data(raw_dir=raw_dir, processed_dir=dirs["processed"])
+        clean_and_transform_all_files(raw_dir=raw_dir, cleaned_dir=dirs["cleaned"],
+                                      transformed_dir=dirs["transformed"])
+        validate.run_data_quality_validation()
+        loader.load_and_partition()
+        baseline = time.perf_counter() - start
+        expected = dataset_digest(dirs["final"])
+
+        rows = [("single node", baseline, True)]
+        for workers in args.workers:
+            dirs = use_dirs(os.path.join(tmp, f"sharded-{workers}"))
+            start = time.perf_counter()
+            run_sharded(shards=workers, by=args.by, workers=workers, raw_dir=raw_dir,
+                        processed_dir=dirs["processed"], cleaned_dir=dirs["cleaned"],
+                        transformed_dir=dirs["transformed"])
+            rows.append((f"{workers} worker(s)", time.perf_counter() - start,
+                         dataset_digest(dirs["final"]) == expected))
+
+    print(f"\n{args.days} day(s) x {args.sensors} sensors at {args.freq}, shards by {args.by}, "
+          f"{os.cpu_count()} CPU(s)")
+    print(f"{'run':<14}{'seconds':>10}{'speedup':>10}{'identical':>11}")
+    for name, seconds, identical in rows:
+        print(f"{name:<14}{seconds:10.2f}{baseline / seconds:10.2f}{str(identical):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+bench_stages.py — pytest-benchmark suite for clean_dataframe,
+transform_dataframe, run_data_quality_validation and load_and_partition on
+synthetic data (benchmarks/synthetic.py) at several scales.
+
+Not collected by the default `pytest` run (tests live in tests/). Run it
+explicitly and keep baselines under benchmarks/.benchmarks:
+
+    pytest benchmarks/bench_stages.py --benchmark-storage=benchmarks/.benchmarks --benchmark-autosave
+    pytest benchmarks/bench_stages.py --benchmark-storage=benchmarks/.benchmarks \
+        --benchmark-compare --benchmark-compare-fail=mean:20%
+
+BENCH_SCALES picks the scales (default "small,medium"; also "large").
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from synthetic import generate_dataset
+from src.loader import load_and_partition
+from src.schema import read_sensor_frame
+from src.transform import clean_and_transform_file, clean_dataframe, transform_dataframe
+from src.validate import run_data_quality_validation
+
+# Rows per scale are about sensors x 4 reading types x readings per day x days
+SCALES = {
+    "small": dict(sensors=10, days=2, freq="10min"),      # ~11.5k rows
+    "medium": dict(sensors=100, days=3, freq="5min"),     # ~350k rows
+    "large": dict(sensors=500, days=7, freq="1min"),      # ~20M rows
+}
+SELECTED = [s.strip() for s in os.environ.get("BENCH_SCALES", "small,medium").split(",") if s.strip()]
+
+
+@pytest.fixture(scope="module", params=SELECTED)
+def dataset(request, tmp_path_factory):
+    "Raw and transformed files of one scale, generated once per module."
+    scale = request.param
+    base = tmp_path_factory.mktemp(scale)
+    raw_paths = generate_dataset(str(base / "raw"), **SCALES[scale])
+    for sub in ("cleaned", "transformed"):
+        (base / sub).mkdir()
+    for path in raw_paths:
+        name = os.path.basename(path).replace(".parquet", "")
+        clean_and_transform_file(path, str(base / "cleaned" / f"{name}_cleaned.parquet"),
+                                 str(base / "transformed" / f"{name}_transformed.parquet"))
+    return {"scale": scale, "base": base, "raw": raw_paths}
+
+
+def _copies(frame):
+    "pedantic() setup: a fresh copy per round, since the stages modify their input."
+    return lambda: ((frame.copy(),), {})
+
+
+def test_clean_dataframe(benchmark, dataset):
+    raw = read_sensor_frame(dataset["raw"][0])
+    benchmark.extra_info["rows"] = len(raw)
+    benchmark.pedantic(clean_dataframe, setup=_copies(raw), rounds=5)
+
+
+def test_transform_dataframe(benchmark, dataset):
+    cleaned = clean_dataframe(read_sensor_frame(dataset["raw"][0]))
+    benchmark.extra_info["rows"] = len(cleaned)
+    benchmark.pedantic(transform_dataframe, setup=_copies(cleaned), rounds=5)
+
+
+def test_run_data_quality_validation(benchmark, dataset, monkeypatch):
+    base = dataset["base"]
+    monkeypatch.setattr("src.validate.TRANSFORMED_DIR", str(base / "transformed"))
+    monkeypatch.setattr("src.validate.REPORT_PATH", str(base / "data_quality_report.csv"))
+    benchmark.pedantic(run_data_quality_validation, rounds=3)
+
+
+def test_load_and_partition(benchmark, dataset, monkeypatch):
+    base = dataset["base"]
+    monkeypatch.setattr("src.loader.TRANSFORMED_DIR", str(base / "transformed"))
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(base / "final_parquet"))
+    benchmark.pedantic(load_and_partition, rounds=3)
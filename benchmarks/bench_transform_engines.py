@@ -0,0 +1,57 @@
+"""
+bench_transform_engines.py — Time the pandas, streaming and DuckDB clean +
+transform engines on one synthetic raw file.
+
+Usage: python benchmarks/bench_transform_engines.py [--rows 1000000] [--engines pandas duckdb]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.transform import ENGINES
+
+
+def make_raw_file(path, n_rows, n_sensors=200, seed=42):
+    "Hourly readings for n_sensors x 2 reading types, time-ordered per series."
+    rng = np.random.default_rng(seed)
+    per_series = max(1, n_rows // (n_sensors * 2))
+    timestamps = pd.date_range("2025-06-05", periods=per_series, freq="min").astype(str)
+    frames = []
+    for reading_type, mean in [("temperature", 28.0), ("humidity", 60.0)]:
+        frames.append(pd.DataFrame({
+            "sensor_id": np.repeat([f"s{i}" for i in range(n_sensors)], per_series),
+            "timestamp": np.tile(timestamps, n_sensors),
+            "reading_type": reading_type,
+            "value": rng.normal(mean, 3, n_sensors * per_series),
+            "battery_level": rng.uniform(20, 100, n_sensors * per_series),
+        }))
+    pd.concat(frames, ignore_index=True).to_parquet(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--engines", nargs="+", default=sorted(ENGINES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_path = os.path.join(tmp, "raw.parquet")
+        make_raw_file(raw_path, args.rows)
+
+        print(f"{'engine':>10} {'rows':>12} {'seconds':>10}")
+        for engine in args.engines:
+            start = time.perf_counter()
+            ENGINES[engine](raw_path, os.path.join(tmp, f"{engine}_c.parquet"),
+                            os.path.join(tmp, f"{engine}_t.parquet"))
+            print(f"{engine:>10} {args.rows:>12,} {time.perf_counter() - start:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
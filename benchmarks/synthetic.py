@@ -0,0 +1,107 @@
+"""
+synthetic.py — Synthetic raw sensor data, one YYYYMMDD.parquet file per day,
+in the layout the pipeline downloads from Drive.
+
+Every (sensor, reading type) series is sampled at a fixed rate. On top of
+that the generator injects:
+  null_rate       fraction of readings with a null value
+  outlier_rate    fraction of readings pushed 8-12 standard deviations out
+  duplicate_rate  fraction of readings written twice
+  gap_rate        probability that a series loses a block of 1-6 hours per day
+
+Usage: python benchmarks/synthetic.py OUT_DIR [--sensors 50] [--days 7] [--freq 10min] ...
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.calibrations import EXPECTED_RANGES
+
+READING_TYPES = list(EXPECTED_RANGES)
+
+
+def generate_day(day, sensors=50, reading_types=READING_TYPES, freq="10min", null_rate=0.01,
+                 outlier_rate=0.001, duplicate_rate=0.005, gap_rate=0.05, seed=0):
+    "Raw readings of one day (a pandas Timestamp or 'YYYY-MM-DD') as a DataFrame."
+    day = pd.Timestamp(day)
+    rng = np.random.default_rng([seed, day.toordinal()])
+    times = pd.date_range(day, day + pd.Timedelta("1D"), freq=freq, inclusive="left")
+    n_series, n_times = sensors * len(reading_types), len(times)
+
+    series = np.repeat(np.arange(n_series), n_times)
+    slot = np.tile(np.arange(n_times), n_series)
+    sensor_ids = np.array([f"sensor_{i:04d}" for i in range(sensors)])
+    types = np.array(reading_types)
+
+    # Normal readings around the middle of each type's expected range
+    lows = np.array([EXPECTED_RANGES[t][0] for t in reading_types], dtype=float)
+    highs = np.array([EXPECTED_RANGES[t][1] for t in reading_types], dtype=float)
+    type_idx = series % len(reading_types)
+    center, spread = (lows + highs) / 2, (highs - lows) / 10
+    values = rng.normal(center[type_idx], spread[type_idx])
+
+    outliers = rng.random(len(values)) < outlier_rate
+    values[outliers] += rng.choice([-1, 1], outliers.sum()) * rng.uniform(8, 12, outliers.sum()) * spread[type_idx[outliers]]
+    values[rng.random(len(values)) < null_rate] = np.nan
+
+    # Gaps: drop a block of 1-6 hours from some series
+    keep = np.ones(len(values), dtype=bool)
+    per_hour = max(1, int(pd.Timedelta("1h") / pd.Timedelta(freq)))
+    for s in np.flatnonzero(rng.random(n_series) < gap_rate):
+        length = rng.integers(1, 7) * per_hour
+        start = rng.integers(0, max(1, n_times - length))
+        keep[(series == s) & (slot >= start) & (slot < start + length)] = False
+
+    df = pd.DataFrame({
+        "sensor_id": sensor_ids[series // len(reading_types)],
+        "timestamp": times[slot].strftime("%Y-%m-%d %H:%M:%S"),
+        "reading_type": types[type_idx],
+        "value": values,
+        "battery_level": np.round(rng.uniform(20, 100, len(values)), 1),
+    })[keep]
+
+    duplicates = df.sample(frac=duplicate_rate, random_state=int(rng.integers(2**31)))
+    return pd.concat([df, duplicates], ignore_index=True)
+
+
+def generate_dataset(out_dir, days=7, start="2025-06-01", **params):
+    "Write `days` daily raw files into out_dir; returns their paths."
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for day in pd.date_range(start, periods=days, freq="D"):
+        path = os.path.join(out_dir, f"{day:%Y%m%d}.parquet")
+        generate_day(day, **params).to_parquet(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic raw sensor files.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--start", default="2025-06-01")
+    parser.add_argument("--sensors", type=int, default=50)
+    parser.add_argument("--reading-types", nargs="+", default=READING_TYPES)
+    parser.add_argument("--freq", default="10min", help="sampling interval per series")
+    parser.add_argument("--null-rate", type=float, default=0.01)
+    parser.add_argument("--outlier-rate", type=float, default=0.001)
+    parser.add_argument("--duplicate-rate", type=float, default=0.005)
+    parser.add_argument("--gap-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_dataset(args.out_dir, args.days, args.start, sensors=args.sensors,
+                             reading_types=args.reading_types, freq=args.freq, null_rate=args.null_rate,
+                             outlier_rate=args.outlier_rate, duplicate_rate=args.duplicate_rate,
+                             gap_rate=args.gap_rate, seed=args.seed)
+    rows = sum(pd.read_parquet(p, columns=["value"]).shape[0] for p in paths)
+    print(f"Wrote {len(paths)} file(s), {rows:,} rows, to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
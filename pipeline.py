@@ -3,35 +3,122 @@ pipeline.py — Master orchestrator for the data processing pipeline
 Flow: Ingestion → Transformation → Validation → Loading
 """
 
+import os
 import sys
-from src.download_from_drive import download_from_drive_folder
-from src.ingestion import ingest_data
-from src.transform import clean_and_transform_all_files
-from src.validate import run_data_quality_validation
-from src.loader import load_and_partition
+from src import metrics
 
-def run_pipeline():
+MODES = ["staged", "fused", "async", "sharded"]
+
+def run_pipeline(transform_engine="pandas", transform_workers=1, incremental=True,
+                 mode="staged", persist_intermediate=False, anomaly_method=None, profile_stage=None,
+                 queue_size=None, load_mode="rebuild", shards=2, shard_by="date"):
+    """
+    transform_engine: "pandas" (default), "streaming" or "duckdb".
+    transform_workers: number of processes for the per-file transform.
+    incremental: only process new/changed files, tracked in the shared manifest
+                 (not supported in fused and sharded mode, which always run in full).
+    mode: "staged" runs each step over Parquet files on disk; "fused" reads
+          each raw file once and goes straight to the final dataset; "async"
+          overlaps the per-file stages (src/scheduler.py); "sharded" splits
+          the run into shards on worker processes (src/sharding.py).
+    persist_intermediate: in fused mode, also write the intermediate files.
+    anomaly_method: None keeps the file-wide z-score; "welford" or "mad" use the
+                    online per-series detectors in src/anomaly.py.
+    profile_stage: profile one stage ("transform", or "transform:py-spy"), see src/metrics.py.
+    queue_size: in async mode, files allowed to wait between two stages (default src.scheduler.QUEUE_SIZE).
+    shards / shard_by: in sharded mode, number of shards (one worker process each) and
+                       how final partitions are owned, "date" ranges or "sensor" hash.
+    load_mode: "rebuild" rewrites affected partitions from their files; "upsert"
+               merges new/changed files into the stored rows by (sensor_id, timestamp, reading_type).
+    Stage timings go to the run log and Prometheus textfile in ../data/metrics.
+    Stage modules are imported on demand; python -m src.cli runs a single stage
+    with paths from a config file or the environment (src/cli.py).
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown pipeline mode '{mode}', expected one of {MODES}")
+    if mode == "sharded" and incremental:
+        raise ValueError("Sharded mode rebuilds every file and keeps no manifest; run it with incremental=False")
+    if mode == "fused" and (incremental or transform_engine != "pandas" or load_mode != "rebuild"):
+        raise ValueError("Fused mode rebuilds the final dataset in one pass with the pandas engine and keeps no "
+                         "rolling-window or daily-aggregate state; run it with incremental=False, "
+                         "transform_engine='pandas' and load_mode='rebuild'")
+    from src.download_from_drive import FOLDER_ID, download_from_drive_folder
+    from src.ingestion import ingest_data
+    from src.transform import clean_and_transform_all_files
+    from src.validate import run_data_quality_validation
+    from src.loader import load_and_partition
+    from src.manifest import MANIFEST_PATH
+    from src.windows import WINDOW_STATE_DIR
+    from src.aggregates import AGGREGATE_STATE_DIR
+
+    manifest_path = MANIFEST_PATH if incremental else None
+    previous_profile = os.environ.get(metrics.PROFILE_ENV)
+    if profile_stage:
+        os.environ[metrics.PROFILE_ENV] = profile_stage
+    run_id = metrics.start_run()
     try:
-        print("Starting Data Pipeline Execution...\n")
+        print(f"Starting Data Pipeline Execution (run {run_id})...\n")
+        # Serial incremental runs resume the rolling windows of the previous run
+        window_state_dir = WINDOW_STATE_DIR if incremental and transform_workers <= 1 else None
+        # ...and keep the daily aggregates of every file (not supported by the duckdb engine)
+        aggregate_state_dir = AGGREGATE_STATE_DIR if window_state_dir and transform_engine != "duckdb" else None
+
+        if mode == "async":
+            from src.scheduler import QUEUE_SIZE, run_scheduled
+            from src.sources import DriveSource
+            print("Steps 1-5: Download, ingest, transform, validate and load with overlapped stages...")
+            with metrics.stage("scheduled"):
+                run_scheduled(DriveSource(FOLDER_ID), engine=transform_engine, manifest_path=manifest_path,
+                              anomaly_method=anomaly_method, window_state_dir=window_state_dir,
+                              aggregate_state_dir=aggregate_state_dir,
+                              concurrency={"transform": transform_workers}, queue_size=queue_size or QUEUE_SIZE)
+            print("Pipeline completed successfully!")
+            return
 
         print("Step 1: Download raw files from Drive")
-        download_from_drive_folder()
+        with metrics.stage("download"):
+            download_from_drive_folder(manifest_path=manifest_path)
+
+        if mode == "fused":
+            from src.fused import run_fused
+            print("Steps 2-5: Ingest, transform, validate and load in one pass...")
+            with metrics.stage("fused"):
+                run_fused(persist=persist_intermediate, anomaly_method=anomaly_method)
+            print("Pipeline completed successfully!")
+            return
+
+        if mode == "sharded":
+            from src.sharding import run_sharded
+            if anomaly_method is not None:
+                raise ValueError("anomaly_method carries state across all files; not supported in sharded mode")
+            print(f"Steps 2-5: Ingest, transform, validate and load in {shards} shard(s) by {shard_by}...")
+            with metrics.stage("sharded"):
+                run_sharded(shards=shards, by=shard_by, engine=transform_engine)
+            print("Pipeline completed successfully!")
+            return
 
         
         print("Step 2: Ingesting raw data...")
-        ingest_data()
+        with metrics.stage("ingest"):
+            ingest_data(manifest_path=manifest_path)
         print("Ingestion complete.\n")
 
         print("Step 3: Transforming data...")
-        clean_and_transform_all_files()
+        with metrics.stage("transform"):
+            clean_and_transform_all_files(engine=transform_engine, workers=transform_workers,
+                                          manifest_path=manifest_path, anomaly_method=anomaly_method,
+                                          window_state_dir=window_state_dir,
+                                          aggregate_state_dir=aggregate_state_dir)
         print("Transformation complete.\n")
 
         print("Step 4: Validating data schema...")
-        run_data_quality_validation()
+        with metrics.stage("validate"):
+            run_data_quality_validation(manifest_path=manifest_path)
         print("Validation complete.\n")
 
         print("Step 5: Loading data to target...")
-        load_and_partition()
+        with metrics.stage("load"):
+            load_and_partition(manifest_path=manifest_path, mode=load_mode)
         print("Loading complete.\n")
 
         print("Pipeline completed successfully!")
@@ -39,6 +126,15 @@ def run_pipeline():
     except Exception as e:
         print(f"Pipeline failed due to: {e}")
         sys.exit(1)
+    finally:
+        if previous_profile is None:
+            os.environ.pop(metrics.PROFILE_ENV, None)
+        else:
+            os.environ[metrics.PROFILE_ENV] = previous_profile
+        summary = metrics.finish_run()
+        for name, values in summary.items():
+            print(f"  {name:<10} wall {values['wall_seconds']:8.2f}s  cpu {values['cpu_seconds']:8.2f}s  "
+                  f"rows out {values['rows_out']}")
 
 if __name__ == "__main__":
     run_pipeline()
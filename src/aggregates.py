@@ -0,0 +1,227 @@
+"""
+aggregates.py — Persistent daily aggregates per (date, sensor_id, reading_type).
+
+DailyAggregates keeps, for every source file, the value sum/count/min/max and
+first/last timestamp of each (date, sensor_id, reading_type) it contributed.
+Re-processing a file replaces its rows, so daily figures are exact when a
+UTC day spans several files, and a run only aggregates its new files
+(O(new data)) instead of re-reading history.
+
+Every change (update, remove, evict) bumps the store version. Rows that are
+removed or evicted stay as tombstones (deleted=True, values kept), so
+changes(since) tells a consumer what to add and what to subtract, until
+compact() drops the tombstones every consumer has read.
+"""
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+AGGREGATE_STATE_DIR = "../data/processed/aggregate_state"
+DAILY_KEYS = ["date", "sensor_id", "reading_type"]
+# How per-key aggregates combine across batches and files
+ROLLUP = {
+    "value_sum": "sum",
+    "value_count": "sum",
+    "value_min": "min",
+    "value_max": "max",
+    "first_timestamp": "min",
+    "last_timestamp": "max",
+}
+
+
+def daily_aggregates(df):
+    "Per (date, sensor_id, reading_type) aggregates of a frame with date, timestamp and value columns."
+    frame = pd.DataFrame({
+        "date": df["date"],
+        "sensor_id": df["sensor_id"].astype(str),
+        "reading_type": df["reading_type"].astype(str),
+        "value": df["value"].astype("float64"),
+        "timestamp": df["timestamp"],
+    })
+    grouped = frame.groupby(DAILY_KEYS, sort=False)
+    return pd.concat([
+        grouped["value"].agg(value_sum="sum", value_count="count", value_min="min", value_max="max"),
+        grouped["timestamp"].agg(first_timestamp="min", last_timestamp="max"),
+    ], axis=1).reset_index()
+
+
+def combine(*aggregates):
+    "Merge aggregate frames (e.g. of several batches) into one row per key."
+    frames = [a for a in aggregates if a is not None and len(a)]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True).groupby(DAILY_KEYS, sort=False).agg(ROLLUP).reset_index()
+
+
+def daily_avg(aggregates, df):
+    "Daily average value of every row of df, looked up in an aggregate frame."
+    avg = aggregates.set_index(DAILY_KEYS)
+    avg = avg["value_sum"] / avg["value_count"]
+    keys = pd.MultiIndex.from_arrays([df["date"], df["sensor_id"].astype(str), df["reading_type"].astype(str)])
+    return avg.reindex(keys).to_numpy()
+
+
+def _empty_rows():
+    return pd.DataFrame({
+        "source": pd.Series(dtype=str),
+        "date": pd.Series(dtype="date32[pyarrow]"),
+        "sensor_id": pd.Series(dtype=str),
+        "reading_type": pd.Series(dtype=str),
+        "value_sum": pd.Series(dtype="float64"),
+        "value_count": pd.Series(dtype="int64"),
+        "value_min": pd.Series(dtype="float64"),
+        "value_max": pd.Series(dtype="float64"),
+        "first_timestamp": pd.Series(dtype="datetime64[us, UTC]"),
+        "last_timestamp": pd.Series(dtype="datetime64[us, UTC]"),
+        "version": pd.Series(dtype="int64"),
+        "deleted": pd.Series(dtype=bool),
+    })
+
+
+class DailyAggregates:
+    """
+    Versioned per-source daily aggregates, saved between runs.
+    Rows are held per source file, with an index of the sources live on each
+    date, so an update touches only its file's rows and a lookup only the
+    files of the days it asks for.
+    """
+
+    def __init__(self, rows=None, compacted=0):
+        rows = rows if rows is not None else _empty_rows()
+        self.columns = list(_empty_rows().columns)
+        self.by_source = {source: frame.reset_index(drop=True)
+                          for source, frame in rows[self.columns].groupby("source", sort=False)}
+        self.by_date = {}
+        for source, frame in self.by_source.items():
+            self._index(source, frame)
+        self.compacted = compacted
+        self.version = max(int(rows["version"].max()) if len(rows) else 0, compacted)
+
+    def _index(self, source, frame):
+        "Record the dates `source` has live rows on."
+        for date in frame.loc[~frame["deleted"], "date"].unique():
+            self.by_date.setdefault(date, set()).add(source)
+
+    def _unindex(self, source, frame):
+        for date in frame.loc[~frame["deleted"], "date"].unique():
+            sources = self.by_date.get(date, set())
+            sources.discard(source)
+            if not sources:
+                self.by_date.pop(date, None)
+
+    def _replace(self, source, frame):
+        "Swap in the rows of one source and keep the date index in step."
+        self._unindex(source, self.by_source.get(source, _empty_rows()))
+        if len(frame):
+            self.by_source[source] = frame.reset_index(drop=True)
+            self._index(source, frame)
+        else:
+            self.by_source.pop(source, None)
+
+    @property
+    def rows(self):
+        "All rows (live and tombstones) of every source."
+        frames = list(self.by_source.values())
+        return pd.concat(frames, ignore_index=True) if frames else _empty_rows()
+
+    def update(self, aggregates, source):
+        """
+        Replace the contribution of `source` (a file name) with `aggregates`
+        (from daily_aggregates / combine). Keys it no longer has become tombstones.
+        """
+        self.version += 1
+        new = aggregates.assign(source=source, version=self.version, deleted=False)[self.columns]
+        previous = self.by_source.get(source, _empty_rows())
+        # Only one row per (source, key): the new rows replace live rows and old tombstones
+        kept = ~pd.MultiIndex.from_frame(previous[DAILY_KEYS]).isin(pd.MultiIndex.from_frame(new[DAILY_KEYS]))
+        previous = previous[kept].copy()
+        dropped = ~previous["deleted"]
+        previous.loc[dropped, "version"] = self.version
+        previous.loc[dropped, "deleted"] = True
+        self._replace(source, pd.concat([previous, new], ignore_index=True) if len(previous) else new)
+        return self.version
+
+    def _tombstone(self, source, mask):
+        "Mark the live rows of `source` selected by mask as deleted at the current version."
+        frame = self.by_source[source].copy()
+        frame.loc[mask, "deleted"] = True
+        frame.loc[mask, "version"] = self.version
+        self._replace(source, frame)
+
+    def remove(self, sources):
+        "Tombstone the rows of removed source files; returns the new version (unchanged if nothing was live)."
+        live = [s for s in sources if s in self.by_source and not self.by_source[s]["deleted"].all()]
+        if not live:
+            return self.version
+        self.version += 1
+        for source in live:
+            self._tombstone(source, ~self.by_source[source]["deleted"])
+        return self.version
+
+    def evict(self, before):
+        "Tombstone every day before `before` (retention); returns the new version."
+        before = pd.Timestamp(before).date()
+        sources = set().union(*(s for date, s in self.by_date.items() if date < before))
+        if not sources:
+            return self.version
+        self.version += 1
+        for source in sources:
+            frame = self.by_source[source]
+            self._tombstone(source, (frame["date"] < before) & ~frame["deleted"])
+        return self.version
+
+    def compact(self, before):
+        """
+        Drop the tombstones written at or before version `before`, once every
+        consumer of changes() has read past it.
+        """
+        for source, frame in list(self.by_source.items()):
+            stale = frame["deleted"] & (frame["version"] <= before)
+            if stale.any():
+                self._replace(source, frame[~stale])
+        self.compacted = max(self.compacted, before)
+
+    def changes(self, since):
+        "Rows (live and tombstones) written after version `since`."
+        if since < self.compacted:
+            raise ValueError(f"Changes up to version {self.compacted} were compacted, cannot list changes since {since}")
+        rows = self.rows
+        return rows[rows["version"] > since].reset_index(drop=True)
+
+    def totals(self, dates=None):
+        "Live aggregates per (date, sensor_id, reading_type) over all sources, optionally for some dates only."
+        columns = DAILY_KEYS + list(ROLLUP)
+        if dates is None:
+            frames = [f[~f["deleted"]] for f in self.by_source.values()]
+        else:
+            dates = set(dates)
+            sources = set().union(*(self.by_date.get(date, set()) for date in dates))
+            frames = [f[~f["deleted"] & f["date"].isin(list(dates))] for f in map(self.by_source.get, sources)]
+        frames = [f[columns] for f in frames if len(f)]
+        return combine(*frames) if frames else _empty_rows()[columns]
+
+    def daily_avg(self, df):
+        "Daily average value of every row of df over all sources; reads only the days in df."
+        return daily_avg(self.totals(df["date"].unique()), df)
+
+    def save(self, state_dir=AGGREGATE_STATE_DIR):
+        "Persist the rows to <state_dir>/daily.parquet (temp file + rename)."
+        os.makedirs(state_dir, exist_ok=True)
+        path = os.path.join(state_dir, "daily.parquet")
+        table = pa.Table.from_pandas(self.rows, preserve_index=False)
+        metadata = {**(table.schema.metadata or {}), b"compacted": str(self.compacted).encode()}
+        pq.write_table(table.replace_schema_metadata(metadata), f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, state_dir=AGGREGATE_STATE_DIR):
+        "The store saved under state_dir, or an empty one."
+        path = os.path.join(state_dir, "daily.parquet")
+        if not os.path.exists(path):
+            return cls()
+        table = pq.read_table(path)
+        compacted = int((table.schema.metadata or {}).get(b"compacted", b"0"))
+        return cls(table.to_pandas(), compacted)
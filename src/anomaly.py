@@ -0,0 +1,364 @@
+"""
+anomaly.py — Online anomaly detection per (sensor_id, reading_type) series.
+
+A detector scores every reading against the readings before it in the same
+series, then folds the batch into its state. It therefore works batch by
+batch, and its state carries across files and days (save() / make_detector()).
+
+  WelfordDetector  running mean/variance (Welford, merged per batch with
+                   Chan's formulas); flags |z| > threshold and replaces the
+                   value with the running mean. O(1) per record.
+  MadDetector      rolling median/MAD over the last `window` readings; flags
+                   0.6745 * |x - median| / MAD > threshold and replaces the
+                   value with the rolling median. O(window) per record.
+
+State is kept per source file, like the daily aggregate store: start(source)
+opens a file, its batches are scored against the other files' readings
+before them (committed state) plus its own earlier batches, and commit()
+replaces that file's contribution once its output is written. Reprocessing
+a file (or a non-incremental rerun) therefore never counts its readings
+twice, and a file that fails before commit() leaves the state untouched.
+
+Nothing is flagged until a series has min_count readings of history. Within a
+batch readings are scored in timestamp order; batches must arrive in time
+order per series, and values must be non-null (clean_dataframe drops nulls
+first).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.schema import utc_timestamps
+
+ANOMALY_STATE_DIR = "../data/processed/anomaly_state"
+SERIES_KEYS = ["sensor_id", "reading_type"]
+MOMENTS = ["count", "mean", "m2"]
+# Rows per block when the MAD detector materialises windows (bounds memory to block x window)
+MAD_BLOCK_ROWS = 8192
+
+
+def _series_codes(df):
+    "Per-row series code and the (sensor_id, reading_type) MultiIndex of the codes."
+    codes, uniques = pd.MultiIndex.from_arrays([df[k].astype(str) for k in SERIES_KEYS]).factorize()
+    return codes, pd.MultiIndex.from_tuples(list(uniques), names=SERIES_KEYS)
+
+
+class _Detector:
+    method = None
+
+    def __init__(self, threshold, min_count):
+        self.threshold = threshold
+        self.min_count = min_count
+        self.source = None
+        self._open = False
+
+    def start(self, source):
+        "Open `source` (a file name): discard any uncommitted batches and score against the other files."
+        self.source = source
+        self._open = True
+        self._start()
+
+    def commit(self):
+        "Replace the committed contribution of the open source with its processed batches."
+        if self._open:
+            self._commit()
+            self._open = False
+
+    def process(self, df):
+        """
+        Flag and correct anomalies in one batch and fold it into the open
+        source (an anonymous one when start() was not called).
+        Returns a copy of df with value corrected and an is_outlier column.
+        """
+        if not self._open:
+            self.start(self.source)
+        df = df.copy()
+        if df.empty:
+            df["is_outlier"] = pd.Series(dtype=bool)
+            return df
+        times = utc_timestamps(df["timestamp"]).astype("int64").to_numpy()
+        order = np.argsort(times, kind="stable")
+        ordered = df.iloc[order]
+        codes, keys = _series_codes(ordered)
+        values = ordered["value"].to_numpy(dtype="float64")
+
+        flags, replacement = self._score(values, codes, keys, times[order])
+
+        is_outlier = np.empty(len(df), dtype=bool)
+        is_outlier[order] = flags
+        corrected = df["value"].to_numpy(dtype="float64").copy()
+        corrected[order[flags]] = replacement[flags]
+        df["value"] = corrected.astype(df["value"].dtype)
+        df["is_outlier"] = is_outlier
+        return df
+
+    def save(self, state_dir=ANOMALY_STATE_DIR):
+        "Persist the committed state to <state_dir>/<method>.parquet (temp file + rename)."
+        os.makedirs(state_dir, exist_ok=True)
+        path = os.path.join(state_dir, f"{self.method}.parquet")
+        self.state_frame().to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+
+
+def _combine_moments(frame):
+    "One (count, mean, m2, last_timestamp) row per series from several partial rows (Chan's formulas)."
+    by = [frame[k] for k in SERIES_KEYS]
+    totals = pd.DataFrame({"count": frame["count"], "weighted": frame["count"] * frame["mean"]}).groupby(
+        by, sort=False).sum()
+    mean = totals["weighted"] / totals["count"]
+    row_mean = mean.reindex(pd.MultiIndex.from_arrays(by)).to_numpy()
+    m2 = (frame["m2"] + frame["count"] * (frame["mean"] - row_mean) ** 2).groupby(by, sort=False).sum()
+    return pd.DataFrame({
+        "count": totals["count"],
+        "mean": mean,
+        "m2": m2,
+        "last_timestamp": frame["last_timestamp"].groupby(by, sort=False).max(),
+    }).rename_axis(SERIES_KEYS).reset_index()
+
+
+def _no_moments(index=None):
+    "Zero count/mean/m2 per series of `index` (none by default)."
+    if index is None:
+        index = pd.MultiIndex.from_arrays([pd.Series(dtype=str)] * 2, names=SERIES_KEYS)
+    return pd.DataFrame(0.0, index=index, columns=MOMENTS)
+
+
+def _add_moments(a, b):
+    "Chan's combination of two count/mean/m2 frames indexed by series."
+    if not a.index.equals(b.index):
+        index = a.index.union(b.index)
+        a, b = a.reindex(index, fill_value=0.0), b.reindex(index, fill_value=0.0)
+    n = a["count"] + b["count"]
+    delta = b["mean"] - a["mean"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = (b["count"] / n).fillna(0.0)
+    return pd.DataFrame({"count": n, "mean": a["mean"] + delta * share,
+                         "m2": a["m2"] + b["m2"] + delta * delta * a["count"] * share})
+
+
+def _subtract_moments(total, part):
+    "The moments of `total` without `part` (Chan's formulas solved for the rest)."
+    part = part.reindex(total.index, fill_value=0.0)
+    n = total["count"] - part["count"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = total["mean"] + part["count"] * (total["mean"] - part["mean"]) / n
+        m2 = total["m2"] - part["m2"] - (part["mean"] - mean) ** 2 * part["count"] * n / total["count"]
+    rest = n > 0
+    return pd.DataFrame({"count": n.where(rest, 0.0), "mean": mean.where(rest, 0.0),
+                         "m2": m2.clip(lower=0).where(rest, 0.0)})
+
+
+def _empty_moments():
+    return pd.DataFrame({"sensor_id": pd.Series(dtype=str), "reading_type": pd.Series(dtype=str),
+                         "count": pd.Series(dtype="float64"), "mean": pd.Series(dtype="float64"),
+                         "m2": pd.Series(dtype="float64"), "last_timestamp": pd.Series(dtype="int64")})
+
+
+class WelfordDetector(_Detector):
+    method = "welford"
+
+    def __init__(self, threshold=3.0, min_count=10, state=None):
+        super().__init__(threshold, min_count)
+        # source / series / count / mean / m2 (sum of squared deviations) / last reading (int64 us)
+        self.state = state if state is not None else _empty_moments().assign(source=pd.Series(dtype=str))
+        # Committed moments per series combined over all source files; commit()
+        # swaps one file's contribution in, so no batch re-combines the others.
+        self._totals = _combine_moments(self.state).set_index(SERIES_KEYS)[MOMENTS] if len(self.state) \
+            else _no_moments()
+
+    def _start(self):
+        own = self.state["source"] == self.source
+        self._others = _subtract_moments(self._totals, self.state[own].set_index(SERIES_KEYS)[MOMENTS])
+        self._others_state = self.state[~own]
+        self._others_keys = pd.MultiIndex.from_frame(self._others_state[SERIES_KEYS].astype(str))
+        self._others_last = self._others_state.groupby(SERIES_KEYS)["last_timestamp"].max()
+        self._pending = _no_moments().assign(last_timestamp=pd.Series(dtype="int64"))
+
+    def _commit(self):
+        self._totals = _add_moments(self._others, self._pending[MOMENTS])
+        rows = self._pending.rename_axis(SERIES_KEYS).reset_index().assign(source=self.source)
+        self.state = pd.concat([self._others_state, rows[self.state.columns]], ignore_index=True)
+        self._start()
+
+    def _prior(self, keys, first):
+        """
+        Moments per series of the other files' readings before the batch, plus
+        this file's earlier batches. The other files' combined totals are used
+        as they are unless one of them has readings at or after the batch (a
+        reprocessed earlier file); only those series are rebuilt from the state.
+        """
+        others = self._others.reindex(keys, fill_value=0.0)
+        late = self._others_last.reindex(keys).to_numpy(dtype="float64") >= first
+        if late.any():
+            code = keys.get_indexer(self._others_keys)
+            before = code >= 0
+            before[before] = late[code[before]]
+            before[before] = self._others_state["last_timestamp"].to_numpy()[before] < first[code[before]]
+            history = self._others_state[before]
+            rebuilt = _combine_moments(history).set_index(SERIES_KEYS)[MOMENTS] if len(history) else _no_moments()
+            others[late] = rebuilt.reindex(keys[late], fill_value=0.0).to_numpy()
+        return _add_moments(others, self._pending[MOMENTS].reindex(keys, fill_value=0.0))
+
+    def _score(self, values, codes, keys, times):
+        first_rows = np.unique(codes, return_index=True)[1]
+        prior = self._prior(keys, times[first_rows])
+        # Centre each series on its prior mean, or its first value when new
+        center = np.where(prior["count"].to_numpy() > 0, prior["mean"].to_numpy(), values[first_rows])
+        n0 = prior["count"].to_numpy()[codes]
+        mean0 = center[codes]
+        m2_0 = prior["m2"].to_numpy()[codes]
+
+        # Moments of everything before each row: prior state plus the
+        # exclusive prefix of the batch.
+        d = values - mean0
+        grouped = pd.Series(d).groupby(codes)
+        s1 = grouped.cumsum().to_numpy() - d
+        s2 = pd.Series(d * d).groupby(codes).cumsum().to_numpy() - d * d
+        n = n0 + grouped.cumcount().to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = mean0 + s1 / n
+            std = np.sqrt(np.maximum(m2_0 + s2 - s1 * s1 / n, 0) / n)
+            z = np.abs(values - mean) / std
+        flags = (n >= self.min_count) & (std > 0) & (z > self.threshold)
+
+        # Fold the batch into the file's pending moments
+        count = np.bincount(codes, minlength=len(keys))
+        t1 = np.bincount(codes, weights=d, minlength=len(keys))
+        t2 = np.bincount(codes, weights=d * d, minlength=len(keys))
+        batch = pd.DataFrame({
+            "count": count.astype("float64"),
+            "mean": center + t1 / count,
+            "m2": t2 - t1 * t1 / count,
+            "last_timestamp": pd.Series(times).groupby(codes).max().to_numpy(),
+        }, index=keys)
+        last = pd.concat([self._pending["last_timestamp"], batch["last_timestamp"]]).groupby(level=[0, 1]).max()
+        self._pending = _add_moments(self._pending[MOMENTS], batch[MOMENTS]).assign(last_timestamp=last)
+        return flags, mean
+
+    def totals(self):
+        "Committed count/mean/m2 per series over all source files."
+        return self._totals[self._totals["count"] > 0]
+
+    def state_frame(self):
+        return self.state.reset_index(drop=True)
+
+    @classmethod
+    def from_frame(cls, frame, **params):
+        return cls(state=frame[["source", *SERIES_KEYS, *MOMENTS, "last_timestamp"]], **params)
+
+
+class MadDetector(_Detector):
+    method = "mad"
+
+    def __init__(self, window=50, threshold=3.5, min_count=10, tails=None):
+        super().__init__(threshold, min_count)
+        self.window = window
+        # Last `window` readings per (source, sensor_id, reading_type): (int64 us timestamps, values)
+        self.tails = tails if tails is not None else {}
+
+    def _start(self):
+        others = {}
+        for (source, *key), tail in self.tails.items():
+            if source != self.source:
+                others.setdefault(tuple(key), []).append(tail)
+        self._others = {}
+        for key, tails in others.items():
+            times = np.concatenate([t for t, _ in tails])
+            order = np.argsort(times, kind="stable")
+            self._others[key] = (times[order], np.concatenate([v for _, v in tails])[order])
+        self._pending = {}
+
+    def _commit(self):
+        self.tails = {k: v for k, v in self.tails.items() if k[0] != self.source}
+        for key, tail in self._pending.items():
+            self.tails[(self.source, *key)] = tail
+        self._start()
+
+    def _history(self, key, first):
+        "Last `window` readings of the series before `first`: other files' plus this file's earlier batches."
+        empty = (np.empty(0, dtype="int64"), np.empty(0))
+        times, values = self._others.get(key, empty)
+        cut = np.searchsorted(times, first, side="left")
+        pending_times, pending_values = self._pending.get(key, empty)
+        times = np.concatenate([times[max(0, cut - self.window):cut], pending_times])
+        values = np.concatenate([values[max(0, cut - self.window):cut], pending_values])
+        order = np.argsort(times, kind="stable")[-self.window:]
+        return times[order], values[order]
+
+    def _score(self, values, codes, keys, times):
+        median = np.full(len(values), np.nan)
+        mad = np.full(len(values), np.nan)
+        history = np.zeros(len(values), dtype=int)
+
+        order = np.argsort(codes, kind="stable")
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        for rows in np.split(order, bounds):
+            key = tuple(keys[codes[rows[0]]])
+            tail_times, tail = self._history(key, times[rows[0]])
+            series = np.concatenate([tail, values[rows]])
+            # Row i sees the `window` readings before it
+            seen = np.minimum(np.arange(len(tail), len(series)), self.window)
+            rolling = pd.Series(series).rolling(self.window, min_periods=1).median().to_numpy()
+            scored = np.flatnonzero(seen >= max(self.min_count, 1))
+            median[rows[scored]] = rolling[len(tail) + scored - 1]
+
+            # MAD needs the deviations of each window from its own median: block by block
+            padded = np.concatenate([np.full(self.window, np.nan), series[:-1]])
+            windows = sliding_window_view(padded, self.window)[len(tail):]
+            for start in range(0, len(scored), MAD_BLOCK_ROWS):
+                block = scored[start:start + MAD_BLOCK_ROWS]
+                deviations = np.abs(windows[block] - median[rows[block]][:, None])
+                full = seen[block] == self.window
+                if full.any():
+                    mad[rows[block[full]]] = np.median(deviations[full], axis=1)
+                if not full.all():
+                    mad[rows[block[~full]]] = np.nanmedian(deviations[~full], axis=1)
+            history[rows] = seen
+
+            pending_times, pending_values = self._pending.get(key, (np.empty(0, dtype="int64"), np.empty(0)))
+            self._pending[key] = (np.concatenate([pending_times, times[rows]])[-self.window:],
+                                  np.concatenate([pending_values, values[rows]])[-self.window:])
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = 0.6745 * np.abs(values - median) / mad
+        flags = (history >= self.min_count) & (mad > 0) & (score > self.threshold)
+        return flags, median
+
+    def state_frame(self):
+        return pd.DataFrame({
+            "source": [k[0] for k in self.tails],
+            "sensor_id": [k[1] for k in self.tails],
+            "reading_type": [k[2] for k in self.tails],
+            "tail_timestamp": [t.tolist() for t, _ in self.tails.values()],
+            "tail": [v.tolist() for _, v in self.tails.values()],
+        })
+
+    @classmethod
+    def from_frame(cls, frame, **params):
+        tails = {(src, s, r): (np.asarray(ts, dtype="int64"), np.asarray(t, dtype="float64"))
+                 for src, s, r, ts, t in zip(frame["source"], frame["sensor_id"], frame["reading_type"],
+                                             frame["tail_timestamp"], frame["tail"])}
+        return cls(tails=tails, **params)
+
+
+DETECTORS = {
+    "welford": WelfordDetector,
+    "mad": MadDetector,
+}
+
+
+def make_detector(method, state_dir=None, **params):
+    """
+    Detector for `method` ("welford" or "mad"), resumed from the state saved
+    under state_dir when there is one.
+    """
+    if method not in DETECTORS:
+        raise ValueError(f"Unknown anomaly method '{method}', expected one of {sorted(DETECTORS)}")
+    cls = DETECTORS[method]
+    path = os.path.join(state_dir, f"{method}.parquet") if state_dir else None
+    if path and os.path.exists(path):
+        return cls.from_frame(pd.read_parquet(path), **params)
+    return cls(**params)
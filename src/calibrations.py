@@ -1,8 +1,50 @@
 # src/calibrations.py
+import numpy as np
+import pandas as pd
 
+# --- Single source of calibration and expected-range rules per reading_type ---
+# multiplier/offset feed normalized_value in transform.py, expected_range feeds
+# the range checks in validate.py.
 CALIBRATION = {
-    "temperature": {"multiplier": 1.02, "offset": 0.5, "expected_range": (10, 50)},
-    "humidity": {"multiplier": 0.98, "offset": 1.0, "expected_range": (20, 90)},
+    "temperature": {"multiplier": 1.02, "offset": -0.5, "expected_range": (15, 40)},
+    "humidity": {"multiplier": 0.98, "offset": 0.3, "expected_range": (10, 90)},
     "soil_moisture": {"multiplier": 1.0, "offset": 0.0, "expected_range": (0, 100)},
     "light_intensity": {"multiplier": 1.1, "offset": 0.0, "expected_range": (100, 2000)},
 }
+
+# Applied to reading types that have no calibration entry (identity transform)
+DEFAULT_CALIBRATION = {"multiplier": 1.0, "offset": 0.0, "expected_range": None}
+
+EXPECTED_RANGES = {
+    reading_type: params["expected_range"]
+    for reading_type, params in CALIBRATION.items()
+    if params.get("expected_range") is not None
+}
+
+
+def calibration_arrays(categories, calibration=CALIBRATION):
+    """
+    Build multiplier/offset lookup arrays aligned with categorical codes.
+    The extra last slot holds the default, so code -1 (missing) maps to it.
+    """
+    multipliers = np.empty(len(categories) + 1, dtype="float64")
+    offsets = np.empty(len(categories) + 1, dtype="float64")
+    for i, reading_type in enumerate(list(categories) + [None]):
+        params = calibration.get(reading_type, DEFAULT_CALIBRATION)
+        multipliers[i] = params["multiplier"]
+        offsets[i] = params["offset"]
+    return multipliers, offsets
+
+
+def apply_calibration(reading_type, value, calibration=CALIBRATION):
+    "Return value * multiplier + offset per row in one vectorized pass."
+    reading_type = pd.Series(reading_type)
+    if isinstance(reading_type.dtype, pd.CategoricalDtype):
+        codes = reading_type.cat.codes.to_numpy()
+        categories = reading_type.cat.categories
+    else:
+        codes, categories = pd.factorize(reading_type)
+
+    multipliers, offsets = calibration_arrays(categories, calibration)
+    values = np.asarray(value, dtype="float64")
+    return values * multipliers[codes] + offsets[codes]
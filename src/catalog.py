@@ -0,0 +1,258 @@
+"""
+catalog.py — Persistent DuckDB catalog over the final partitioned dataset.
+
+The catalog lives next to the partitions as <dataset root>/_catalog.duckdb
+(readers of the Hive dataset skip names starting with "_") and holds:
+
+  partition_files  one row per Parquet file: partition, date, sensor_id, file, rows, bytes
+  hourly_rollup    records and value count/sum/min/max/avg per (date, sensor_id, reading_type, hour)
+  daily_rollup     the same per (date, sensor_id, reading_type), rolled up from hourly_rollup
+  readings         view over exactly the catalogued files, Hive keys as strings
+
+The loader (and fused mode / compaction) calls update_catalog() with the
+partition directories it rewrote, so only those partitions are re-read.
+Hours are UTC and stored as naive TIMESTAMPs.
+
+    from src.catalog import query_readings, query_rollup
+    query_readings("2025-06-05 00:00", "2025-06-06 00:00", sensor_ids=["s1"], iso=True)
+    query_rollup("daily", sensor_ids=["s1"], reading_types=["temperature"])
+
+Queries read the file list from partition_files, pruned by date and sensor,
+instead of globbing the dataset and parsing every footer.
+"""
+
+import os
+from urllib.parse import unquote
+
+import duckdb
+import pandas as pd
+import pyarrow.parquet as pq
+
+from src import loader
+from src.schema import iso_strings
+
+CATALOG_NAME = "_catalog.duckdb"
+ROLLUP_LEVELS = ["hourly", "daily"]
+
+_TABLES = """
+CREATE TABLE IF NOT EXISTS partition_files (
+    partition VARCHAR, date VARCHAR, sensor_id VARCHAR, file VARCHAR, rows BIGINT, bytes BIGINT
+);
+CREATE TABLE IF NOT EXISTS hourly_rollup (
+    partition VARCHAR, date VARCHAR, sensor_id VARCHAR, reading_type VARCHAR, hour TIMESTAMP,
+    records BIGINT, value_count BIGINT, value_sum DOUBLE, value_min DOUBLE, value_max DOUBLE, value_avg DOUBLE
+);
+CREATE TABLE IF NOT EXISTS daily_rollup (
+    partition VARCHAR, date VARCHAR, sensor_id VARCHAR, reading_type VARCHAR,
+    records BIGINT, value_count BIGINT, value_sum DOUBLE, value_min DOUBLE, value_max DOUBLE, value_avg DOUBLE
+);
+"""
+
+
+def catalog_path(root=None):
+    return os.path.join(root or loader.FINAL_OUTPUT_DIR, CATALOG_NAME)
+
+
+def connect(root=None, read_only=True):
+    "Connection to the catalog of the dataset under root (defaults to loader.FINAL_OUTPUT_DIR)."
+    path = catalog_path(root)
+    if read_only and not os.path.exists(path):
+        raise FileNotFoundError(f"No catalog at {path}; run the loader or update_catalog() first.")
+    con = duckdb.connect(path, read_only=read_only)
+    con.execute("SET TimeZone = 'UTC'")
+    return con
+
+
+def _key(rel_dir):
+    "Catalog key of a relative partition directory ('/'-separated)."
+    return rel_dir.replace(os.sep, "/").strip("/")
+
+
+def _scan_files(root, prefixes):
+    "One row per Parquet file at or below the given partition dirs (all of root for None)."
+    starts = [root] if prefixes is None else [os.path.join(root, p) for p in prefixes]
+    rows = []
+    for start in starts:
+        for dirpath, _, filenames in os.walk(start):
+            if dirpath == root:
+                continue
+            partition = _key(os.path.relpath(dirpath, root))
+            keys = dict(part.partition("=")[::2] for part in partition.split("/"))
+            for name in sorted(f for f in filenames if f.endswith(".parquet")):
+                path = os.path.join(dirpath, name)
+                rows.append({"partition": partition, "date": unquote(keys.get("date", "")) or None,
+                             "sensor_id": unquote(keys["sensor_id"]) if "sensor_id" in keys else None,
+                             "file": f"{partition}/{name}", "rows": pq.ParquetFile(path).metadata.num_rows,
+                             "bytes": os.path.getsize(path)})
+    return pd.DataFrame(rows, columns=["partition", "date", "sensor_id", "file", "rows", "bytes"])
+
+
+def _read_parquet(paths):
+    "read_parquet() over an explicit file list, Hive keys kept as strings."
+    listing = ", ".join("'" + p.replace("'", "''") + "'" for p in paths)
+    return (f"read_parquet([{listing}], hive_partitioning = true, hive_types_autocast = false, "
+            f"union_by_name = true, filename = true)")
+
+
+def _insert_hourly(con, root, files):
+    source = _read_parquet([os.path.join(os.path.abspath(root), f) for f in files["file"]])
+    columns = {name for name, *_ in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+    reading_type = "reading_type" if "reading_type" in columns else "NULL"
+    value = "CAST(value AS DOUBLE)" if "value" in columns else "NULL::DOUBLE"
+    hour = "date_trunc('hour', CAST(r.timestamp AS TIMESTAMPTZ))"
+    if "hour" in columns:
+        hour = f"COALESCE(r.hour, {hour})"
+    paths = pd.DataFrame({"filename": [os.path.join(os.path.abspath(root), f) for f in files["file"]],
+                          "partition": files["partition"].to_numpy()})
+    con.register("catalog_paths", paths)
+    con.execute(f"""
+        INSERT INTO hourly_rollup
+        SELECT p.partition, r.date, CAST(r.sensor_id AS VARCHAR), CAST({reading_type} AS VARCHAR),
+               CAST({hour} AS TIMESTAMP) AS hour,
+               COUNT(*), COUNT({value}), SUM({value}), MIN({value}), MAX({value}), AVG({value})
+        FROM {source} r JOIN catalog_paths p USING (filename)
+        GROUP BY ALL
+    """)
+    con.unregister("catalog_paths")
+
+
+def _refresh_view(con, root):
+    files = [row[0] for row in con.execute("SELECT file FROM partition_files ORDER BY file").fetchall()]
+    if not files:
+        con.execute("DROP VIEW IF EXISTS readings")
+        return
+    source = _read_parquet([os.path.join(os.path.abspath(root), f) for f in files])
+    con.execute(f"CREATE OR REPLACE VIEW readings AS SELECT * EXCLUDE (filename) FROM {source}")
+
+
+def update_catalog(partitions=None, root=None):
+    """
+    Bring the catalog in line with the given partition directories (relative
+    to root, as written/removed by the loader); directories that are gone are
+    dropped. With partitions=None, or when no catalog exists yet, the whole
+    dataset is catalogued. Returns the number of files catalogued.
+    """
+    root = root or loader.FINAL_OUTPUT_DIR
+    if not os.path.isdir(root):
+        return 0
+    fresh = not os.path.exists(catalog_path(root))
+    prefixes = None if partitions is None or fresh else sorted({_key(p) for p in partitions})
+    if prefixes == []:
+        return 0
+
+    files = _scan_files(root, prefixes)
+    con = connect(root, read_only=False)
+    try:
+        con.execute(_TABLES)
+        con.execute("BEGIN TRANSACTION")
+        where = "TRUE"
+        if prefixes is not None:
+            con.register("catalog_prefixes", pd.DataFrame({"prefix": prefixes}))
+            where = ("partition IN (SELECT prefix FROM catalog_prefixes) OR EXISTS (SELECT 1 FROM "
+                     "catalog_prefixes WHERE starts_with(partition, prefix || '/'))")
+        for table in ("partition_files", "hourly_rollup", "daily_rollup"):
+            con.execute(f"DELETE FROM {table} WHERE {where}")
+        if len(files):
+            con.register("catalog_new_files", files)
+            con.execute("INSERT INTO partition_files SELECT * FROM catalog_new_files")
+            con.unregister("catalog_new_files")
+            _insert_hourly(con, root, files)
+            con.register("catalog_touched", pd.DataFrame({"partition": files["partition"].unique()}))
+            con.execute("""
+                INSERT INTO daily_rollup
+                SELECT partition, date, sensor_id, reading_type, SUM(records), SUM(value_count),
+                       SUM(value_sum), MIN(value_min), MAX(value_max), SUM(value_sum) / NULLIF(SUM(value_count), 0)
+                FROM hourly_rollup WHERE partition IN (SELECT partition FROM catalog_touched)
+                GROUP BY ALL
+            """)
+            con.unregister("catalog_touched")
+        _refresh_view(con, root)
+        con.execute("COMMIT")
+    finally:
+        con.close()
+    print(f"Catalog updated: {len(files)} file(s) in {files['partition'].nunique()} partition(s).")
+    return len(files)
+
+
+# --- Query API ---
+
+def _utc(ts):
+    "A timestamp bound as a naive UTC ISO string (naive input is taken as UTC)."
+    ts = pd.Timestamp(ts)
+    return (ts.tz_convert("UTC").tz_localize(None) if ts.tzinfo else ts).isoformat()
+
+
+def _filters(start, end, sensor_ids, reading_types, time_col):
+    "WHERE clause and parameters for a [start, end) range on time_col and sensor/type lists."
+    clauses, params = [], []
+    if start is not None:
+        clauses.append(f"{time_col} >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append(f"{time_col} < ?")
+        params.append(end)
+    if sensor_ids is not None:
+        clauses.append("sensor_id IN (SELECT UNNEST(?::VARCHAR[]))")
+        params.append([str(s) for s in sensor_ids])
+    if reading_types is not None:
+        clauses.append("reading_type IN (SELECT UNNEST(?::VARCHAR[]))")
+        params.append([str(t) for t in reading_types])
+    return " AND ".join(clauses) or "TRUE", params
+
+
+def query_readings(start=None, end=None, sensor_ids=None, reading_types=None, columns=None, root=None,
+                   iso=False):
+    """
+    Readings with start <= timestamp < end (naive times are UTC) for the given
+    sensors and reading types. Only files of matching partitions are read.
+    iso=True adds timestamp_iso strings in local time (schema.LOCAL_TZ) for export.
+    """
+    root = root or loader.FINAL_OUTPUT_DIR
+    con = connect(root)
+    try:
+        # Partition dates may be local dates, so allow a day either side
+        prune, params = ["TRUE"], []
+        if start is not None:
+            prune.append("date >= ?")
+            params.append(str((pd.Timestamp(start) - pd.Timedelta("1D")).date()))
+        if end is not None:
+            prune.append("date <= ?")
+            params.append(str((pd.Timestamp(end) + pd.Timedelta("1D")).date()))
+        if sensor_ids is not None:
+            prune.append("(sensor_id IS NULL OR sensor_id IN (SELECT UNNEST(?::VARCHAR[])))")
+            params.append([str(s) for s in sensor_ids])
+        files = [row[0] for row in con.execute(
+            f"SELECT file FROM partition_files WHERE {' AND '.join(prune)} ORDER BY file", params).fetchall()]
+        if not files:
+            return pd.DataFrame(columns=columns or [])
+
+        where, params = _filters(_utc(start) if start is not None else None, _utc(end) if end is not None else None,
+                                 sensor_ids, reading_types, "CAST(timestamp AS TIMESTAMPTZ)")
+        source = _read_parquet([os.path.join(os.path.abspath(root), f) for f in files])
+        select = ", ".join(f'"{c}"' for c in columns) if columns else "* EXCLUDE (filename)"
+        df = con.execute(f"SELECT {select} FROM {source} WHERE {where}", params).df()
+    finally:
+        con.close()
+    if iso and "timestamp" in df.columns:
+        df["timestamp_iso"] = iso_strings(df["timestamp"])
+    return df
+
+
+def query_rollup(level="hourly", start=None, end=None, sensor_ids=None, reading_types=None, root=None):
+    """
+    Precomputed hourly or daily aggregates. start/end bound the hour (UTC) for
+    hourly rollups and the partition date for daily ones.
+    """
+    if level not in ROLLUP_LEVELS:
+        raise ValueError(f"Unknown rollup level '{level}', expected one of {ROLLUP_LEVELS}")
+    con = connect(root)
+    try:
+        bound = _utc if level == "hourly" else (lambda ts: str(pd.Timestamp(ts).date()))
+        time_col = "hour" if level == "hourly" else "date"
+        where, params = _filters(bound(start) if start is not None else None, bound(end) if end is not None else None,
+                                 sensor_ids, reading_types, time_col)
+        order = f"sensor_id, reading_type, {time_col}"
+        return con.execute(f"SELECT * EXCLUDE (partition) FROM {level}_rollup WHERE {where} ORDER BY {order}",
+                           params).df()
+    finally:
+        con.close()
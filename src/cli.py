@@ -0,0 +1,126 @@
+"""
+cli.py — Command-line entry point with one subcommand per pipeline stage.
+
+    python -m src.cli [--config pipeline.json] [--full] <stage> [options]
+
+Stages: download, ingest, transform, validate, load, compact. Paths come
+from the config file / PIPELINE_* environment (src/config.py). Each stage
+imports its module (and gdown, pandas, numpy, duckdb, pyarrow with it) only
+when it runs, so `--help` or a cron job for one stage starts fast; the
+startup budget is checked in tests/test_cli.py:
+
+    python -m src.cli validate
+    PIPELINE_DATA_DIR=/srv/sensor-data python -m src.cli load --mode upsert
+"""
+
+import argparse
+import sys
+
+from src import config as cfg, metrics
+
+# Seconds allowed for importing this module and parsing the arguments
+STARTUP_BUDGET_SECONDS = 0.1
+
+
+# --- Stages ---
+
+def download(config, args):
+    from src.download_from_drive import FOLDER_ID, download_files
+    from src.sources import DriveSource
+    cfg.apply(config)
+    download_files(DriveSource(FOLDER_ID), config["raw_dir"], manifest_path=args.manifest_path,
+                   cache_dir=config["cache_dir"], workers=args.workers)
+
+
+def ingest(config, args):
+    from src.ingestion import ingest_data
+    cfg.apply(config)
+    ingest_data(raw_dir=config["raw_dir"], processed_dir=config["processed_dir"],
+                manifest_path=args.manifest_path)
+
+
+def transform(config, args):
+    from src.transform import clean_and_transform_all_files
+    cfg.apply(config)
+    # Same state rules as run_pipeline: serial incremental runs resume windows and daily aggregates
+    window_state_dir = config["window_state_dir"] if args.manifest_path and args.workers <= 1 else None
+    aggregate_state_dir = config["aggregate_state_dir"] if window_state_dir and args.engine != "duckdb" else None
+    clean_and_transform_all_files(raw_dir=config["raw_dir"], cleaned_dir=config["cleaned_dir"],
+                                  transformed_dir=config["transformed_dir"], engine=args.engine,
+                                  workers=args.workers, manifest_path=args.manifest_path,
+                                  anomaly_method=args.anomaly_method,
+                                  anomaly_state_dir=config["anomaly_state_dir"],
+                                  window_state_dir=window_state_dir, aggregate_state_dir=aggregate_state_dir)
+
+
+def validate(config, args):
+    from src.validate import run_data_quality_validation
+    cfg.apply(config)
+    run_data_quality_validation(manifest_path=args.manifest_path)
+
+
+def load(config, args):
+    from src.loader import load_and_partition
+    cfg.apply(config)
+    load_and_partition(manifest_path=args.manifest_path, mode=args.mode)
+
+
+def compact(config, args):
+    from src.compact import compact_dataset
+    cfg.apply(config)
+    report = compact_dataset(config["final_dir"], args.scope, int(args.target_mb * 1024 * 1024), args.dry_run)
+    if len(report):
+        print(report.to_string(index=False))
+
+
+STAGES = {"download": download, "ingest": ingest, "transform": transform,
+          "validate": validate, "load": load, "compact": compact}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Run one stage of the sensor data pipeline.")
+    parser.add_argument("--config", default=None, help=f"JSON config file (default: ${cfg.CONFIG_ENV})")
+    parser.add_argument("--full", action="store_true",
+                        help="process every file instead of only new/changed ones (no manifest)")
+    stages = parser.add_subparsers(dest="stage", required=True, metavar="stage")
+
+    sub = stages.add_parser("download", help="download raw files from Google Drive")
+    sub.add_argument("--workers", type=int, default=4)
+    stages.add_parser("ingest", help="schema-check raw files into the processed dir")
+    sub = stages.add_parser("transform", help="clean, calibrate and add derived features")
+    sub.add_argument("--engine", choices=["pandas", "streaming", "duckdb"], default="pandas")
+    sub.add_argument("--workers", type=int, default=1)
+    sub.add_argument("--anomaly-method", choices=["welford", "mad"], default=None)
+    stages.add_parser("validate", help="data quality report over the transformed files")
+    sub = stages.add_parser("load", help="write the partitioned final dataset")
+    sub.add_argument("--mode", choices=["rebuild", "upsert"], default="rebuild")
+    sub = stages.add_parser("compact", help="merge small files of the final dataset")
+    sub.add_argument("--scope", choices=["partition", "date"], default="partition")
+    sub.add_argument("--target-mb", type=float, default=128)
+    sub.add_argument("--dry-run", action="store_true")
+    return parser
+
+
+def main(argv=None):
+    "Run the stage named in argv; returns the process exit code."
+    args = build_parser().parse_args(argv)
+    config = cfg.load_config(args.config)
+    args.manifest_path = None if args.full else config["manifest_path"]
+    cfg.apply(config)
+
+    run_id = metrics.start_run()
+    print(f"Running stage '{args.stage}' (run {run_id})...")
+    try:
+        with metrics.stage(args.stage):
+            STAGES[args.stage](config, args)
+    except Exception as e:
+        print(f"Stage '{args.stage}' failed due to: {e}")
+        return 1
+    finally:
+        metrics.finish_run()
+    print(f"Stage '{args.stage}' completed.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+compact.py — Merge small Parquet files in the final dataset into target-sized files.
+
+scope="partition" compacts each date=*/sensor_id=* directory on its own.
+scope="date" merges all sensors of a date into date=*/ files that keep
+sensor_id as a column (the layout of load_and_partition(partition_by=["date"])).
+It converts every date, because DuckDB needs the same Hive keys everywhere,
+so it is only allowed when the loader writes that layout too.
+
+Rewrites are staged next to the dataset and swapped in with renames.
+
+Usage: python -m src.compact [--scope partition|date] [--target-mb 128] [--dry-run]
+"""
+
+import argparse
+import math
+import os
+import shutil
+import uuid
+from urllib.parse import unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src import catalog, loader
+from src.parquet_writer import sort_table, write_options, write_table
+
+TARGET_FILE_BYTES = 128 * 1024 * 1024
+
+
+def _scan_groups(root, scope):
+    "Map each compaction group (relative dir) to the Parquet files under it."
+    groups = {}
+    for dirpath, _, filenames in os.walk(root):
+        files = sorted(os.path.join(dirpath, f) for f in filenames if f.endswith(".parquet"))
+        if not files:
+            continue
+        rel_dir = os.path.relpath(dirpath, root)
+        if scope == "date":
+            rel_dir = rel_dir.split(os.sep)[0]
+        groups.setdefault(rel_dir, []).extend(files)
+    return groups
+
+
+def _read_group(root, rel_dir, files):
+    "Read a group's files, restoring sensor_id from the Hive path when it is not in the file."
+    tables = []
+    for path in files:
+        table = pq.read_table(path)
+        for part in os.path.relpath(os.path.dirname(path), os.path.join(root, rel_dir)).split(os.sep):
+            name, _, value = part.partition("=")
+            if name == "sensor_id" and name not in table.column_names:
+                table = table.append_column(name, pa.array([unquote(value)] * len(table), pa.string()))
+        tables.append(table)
+    return sort_table(pa.concat_tables(tables, promote_options="permissive"))
+
+
+def _write_group(table, out_dir, rows_per_file):
+    os.makedirs(out_dir, exist_ok=True)
+    for i, start in enumerate(range(0, max(len(table), 1), rows_per_file)):
+        # _read_group already sorted the whole group
+        write_table(table.slice(start, rows_per_file), os.path.join(out_dir, f"data-compacted-{i}.parquet"),
+                    sort=False, sorting_columns=write_options(table.schema, sorted=True).get("sorting_columns"))
+
+
+def _swap_in(root, staging_root, trash_root, rel_dir):
+    "Replace root/rel_dir with the staged directory using renames."
+    final_dir = os.path.join(root, rel_dir)
+    old_dir = os.path.join(trash_root, rel_dir)
+    os.makedirs(os.path.dirname(old_dir), exist_ok=True)
+    os.rename(final_dir, old_dir)
+    os.rename(os.path.join(staging_root, rel_dir), final_dir)
+
+
+def compact_dataset(root=None, scope="partition", target_file_bytes=TARGET_FILE_BYTES, dry_run=False,
+                    partition_by=None):
+    """
+    Compact small files under root (defaults to loader.FINAL_OUTPUT_DIR).
+    partition_by is the layout the loader writes (defaults to loader.PARTITION_BY);
+    scope="date" is rejected while it still includes sensor_id.
+    A group is rewritten when it has more files than target_file_bytes needs
+    (or, for scope="date", when sensor_id directories remain).
+    Returns one report row per rewritten group with before/after file counts
+    and bytes (the after columns are estimates in a dry run).
+    """
+    if scope not in ("partition", "date"):
+        raise ValueError(f"Unknown compaction scope '{scope}', expected 'partition' or 'date'")
+    partition_by = partition_by or loader.PARTITION_BY
+    if scope == "date" and "sensor_id" in partition_by:
+        raise ValueError(f"scope='date' would mix Hive keys with the loader's partition_by={partition_by}; "
+                         "load with partition_by=['date'] first")
+    # A trailing slash would put the staging and trash dirs inside the dataset
+    root = os.path.normpath(root or loader.FINAL_OUTPUT_DIR)
+    if not os.path.isdir(root):
+        print(f"No dataset found at {root}.")
+        return pd.DataFrame()
+
+    groups = _scan_groups(root, scope)
+    rows = []
+    for rel_dir, files in sorted(groups.items()):
+        bytes_before = sum(os.path.getsize(f) for f in files)
+        files_needed = max(1, math.ceil(bytes_before / target_file_bytes))
+        nested = any(os.path.dirname(f) != os.path.join(root, rel_dir) for f in files)
+        if len(files) <= files_needed and not nested:
+            continue
+        rows.append({"group": rel_dir, "files_before": len(files), "bytes_before": bytes_before,
+                     "files_after": files_needed, "bytes_after": bytes_before})
+
+    report = pd.DataFrame(rows, columns=["group", "files_before", "bytes_before", "files_after", "bytes_after"])
+
+    if not dry_run and len(report):
+        run_id = uuid.uuid4().hex
+        staging_root, trash_root = f"{root}.compact-{run_id}", f"{root}.trash-{run_id}"
+        try:
+            for i, row in report.iterrows():
+                files = groups[row["group"]]
+                table = _read_group(root, row["group"], files)
+                rows_per_file = max(1, math.ceil(len(table) / row["files_after"]))
+                _write_group(table, os.path.join(staging_root, row["group"]), rows_per_file)
+                _swap_in(root, staging_root, trash_root, row["group"])
+
+                compacted = os.path.join(root, row["group"])
+                report.loc[i, "files_after"] = len(os.listdir(compacted))
+                report.loc[i, "bytes_after"] = sum(
+                    os.path.getsize(os.path.join(compacted, f)) for f in os.listdir(compacted))
+        finally:
+            shutil.rmtree(staging_root, ignore_errors=True)
+            shutil.rmtree(trash_root, ignore_errors=True)
+        catalog.update_catalog(report["group"].tolist(), root=root)
+
+    label = "Dry run" if dry_run else "Compaction"
+    print(f"{label}: {len(report)} group(s), files {report['files_before'].sum()} -> {report['files_after'].sum()}, "
+          f"bytes {report['bytes_before'].sum()} -> {report['bytes_after'].sum()}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact small Parquet files in the final dataset.")
+    parser.add_argument("--root", default=None, help="dataset root (default: loader.FINAL_OUTPUT_DIR)")
+    parser.add_argument("--scope", choices=["partition", "date"], default="partition")
+    parser.add_argument("--target-mb", type=float, default=TARGET_FILE_BYTES / (1024 * 1024))
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    report = compact_dataset(args.root, args.scope, int(args.target_mb * 1024 * 1024), args.dry_run)
+    if len(report):
+        print(report.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+config.py — Pipeline paths from a JSON config file and the environment.
+
+Every path defaults to the layout under data_dir ("../data"), so an empty
+config reproduces the module-level constants of the stages. Values are read
+from, in increasing priority:
+
+  1. the JSON file at `path`, or at $PIPELINE_CONFIG
+  2. environment variables PIPELINE_<KEY>, e.g. PIPELINE_DATA_DIR=/srv/data
+
+    {"data_dir": "/srv/sensor-data", "final_dir": "/mnt/warehouse/final_parquet"}
+
+Paths not set explicitly follow their base directory, so setting data_dir
+moves everything. Only the standard library is imported here: the CLI loads
+the config before any stage (and its pandas/duckdb/pyarrow imports) runs.
+"""
+
+import json
+import os
+import sys
+
+CONFIG_ENV = "PIPELINE_CONFIG"
+ENV_PREFIX = "PIPELINE_"
+DATA_DIR = "../data"
+
+# key -> (base key, path relative to the base), resolved in this order
+PATHS = {
+    "raw_dir": ("data_dir", "raw"),
+    "processed_dir": ("data_dir", "processed"),
+    "cache_dir": ("data_dir", "cache"),
+    "metrics_dir": ("data_dir", "metrics"),
+    "manifest_path": ("data_dir", "manifest.json"),
+    "checkpoint_file": ("data_dir", "last_ingested.txt"),
+    "cleaned_dir": ("processed_dir", "cleaned_only"),
+    "transformed_dir": ("processed_dir", "transformed"),
+    "final_dir": ("processed_dir", "final_parquet"),
+    "report_path": ("processed_dir", "data_quality_report.csv"),
+    "validation_metrics_path": ("processed_dir", "validation_hourly_metrics.parquet"),
+    "anomaly_state_dir": ("processed_dir", "anomaly_state"),
+    "window_state_dir": ("processed_dir", "window_state"),
+    "aggregate_state_dir": ("processed_dir", "aggregate_state"),
+}
+
+# Module-level constants that read a key at call time: "module.ATTRIBUTE"
+TARGETS = {
+    "raw_dir": ["src.ingestion.RAW_DATA_DIR", "src.download_from_drive.RAW_DIR", "src.transform.RAW_PROCESSED_DIR"],
+    "processed_dir": ["src.ingestion.PROCESSED_DIR"],
+    "cache_dir": ["src.download_from_drive.CACHE_DIR"],
+    "checkpoint_file": ["src.ingestion.CHECKPOINT_FILE"],
+    "cleaned_dir": ["src.transform.CLEANED_OUTPUT_DIR"],
+    "transformed_dir": ["src.transform.TRANSFORMED_OUTPUT_DIR", "src.validate.TRANSFORMED_DIR",
+                        "src.loader.TRANSFORMED_DIR"],
+    "final_dir": ["src.loader.FINAL_OUTPUT_DIR"],
+    "report_path": ["src.validate.REPORT_PATH"],
+    "validation_metrics_path": ["src.validate.METRICS_STORE_PATH"],
+    "manifest_path": ["src.manifest.MANIFEST_PATH"],
+    "metrics_dir": ["src.metrics.METRICS_DIR"],
+}
+
+
+def load_config(path=None, environ=None):
+    "Resolved config dict (data_dir plus every key of PATHS) from a JSON file and the environment."
+    environ = os.environ if environ is None else environ
+    path = path or environ.get(CONFIG_ENV)
+    values = {}
+    if path:
+        with open(path, "r") as f:
+            values.update(json.load(f))
+    unknown = set(values) - set(PATHS) - {"data_dir"}
+    if unknown:
+        raise ValueError(f"Unknown config key(s) {sorted(unknown)} in {path}")
+    for key in ["data_dir", *PATHS]:
+        if ENV_PREFIX + key.upper() in environ:
+            values[key] = environ[ENV_PREFIX + key.upper()]
+
+    config = {"data_dir": values.get("data_dir", DATA_DIR)}
+    for key, (base, relative) in PATHS.items():
+        config[key] = values.get(key, os.path.join(config[base], relative))
+    return config
+
+
+def apply(config):
+    """
+    Point the module-level path constants of the already imported stage
+    modules at the config. Call it after importing a stage, before running it.
+    """
+    for key, targets in TARGETS.items():
+        for target in targets:
+            module, attribute = target.rsplit(".", 1)
+            if module in sys.modules:
+                setattr(sys.modules[module], attribute, config[key])
+    metrics = sys.modules.get("src.metrics")
+    if metrics is not None:
+        metrics.RUN_LOG_PATH = os.path.join(config["metrics_dir"], "run_log.jsonl")
+        metrics.PROMETHEUS_PATH = os.path.join(config["metrics_dir"], "sensor_pipeline.prom")
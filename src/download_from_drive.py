@@ -1,21 +1,158 @@
 import os
-import gdown
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from src import manifest as mf
+from src.sources import DriveSource
 
 # Folder ID from your link:
 # https://drive.google.com/drive/folders/1-ybcSvjPf6pYHIMzBj-hiAhKPIxn6Isn?usp=sharing
 FOLDER_ID = "1-ybcSvjPf6pYHIMzBj-hiAhKPIxn6Isn"
 
 RAW_DIR = "../data/raw"
+# Content-addressed store of downloaded files: objects/<sha256[:2]>/<sha256>.
+# Raw files are hard links into it, so treat them as read-only.
+CACHE_DIR = "../data/cache"
+DOWNLOAD_WORKERS = 4
 
-def download_from_drive_folder():
-    os.makedirs(RAW_DIR, exist_ok=True)
 
-    print(f"⬇️ Downloading all files from Google Drive folder ({FOLDER_ID})...")
-    gdown.download_folder(
-        id=FOLDER_ID,
-        output=RAW_DIR,
-        quiet=False,
-        use_cookies=False
+def cached_object_path(cache_dir, sha256):
+    "Path of the cached object with this content hash."
+    return os.path.join(cache_dir, "objects", sha256[:2], sha256)
+
+
+def _partial_path(cache_dir, remote):
+    "Stable download path of a remote file, so a retry resumes its partial bytes."
+    digest = hashlib.sha1(str(remote.key).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, "partial", f"{digest}-{remote.name}")
+
+
+def link_object(object_path, raw_path):
+    "Place a cached object at raw_path (hard link, copy across filesystems)."
+    tmp_path = f"{raw_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(object_path, tmp_path)
+    except OSError:
+        shutil.copyfile(object_path, tmp_path)
+    os.replace(tmp_path, raw_path)
+
+
+def _matches(entry, remote):
+    """
+    True when a manifest entry describes the current remote file. A remote
+    without a checksum or modification time never matches: an in-place edit
+    of the same size would go unnoticed, so it is fetched and hashed instead.
+    """
+    return (
+        entry is not None
+        and entry.get("remote_key") == remote.key
+        and (remote.checksum is not None or remote.modified is not None)
+        and (remote.size is None or entry["size"] == remote.size)
+        and (remote.checksum is None or entry["sha256"] == remote.checksum)
+        and (remote.modified is None or entry.get("remote_modified") == remote.modified)
     )
 
+
+def record_download(manifest, remote, raw_path):
+    "Record a fetched or restored raw file with the remote version it came from."
+    mf.record(manifest, "download", raw_path, output=raw_path, remote_key=remote.key,
+              remote_modified=remote.modified)
+
+
+def plan_download(remote, raw_path, manifest, cache_dir):
+    "What a file needs: 'skip', 'restore' (from the cache) or 'download'."
+    entry = mf.get_entry(manifest, "download", raw_path) if manifest is not None else None
+    if manifest is None:
+        if os.path.exists(raw_path) and remote.size is not None and os.path.getsize(raw_path) == remote.size:
+            return "skip"
+        return "download"
+    if not _matches(entry, remote):
+        return "download"
+    if os.path.exists(raw_path) and not mf.is_changed(manifest, "download", raw_path):
+        return "skip"
+    if os.path.exists(cached_object_path(cache_dir, entry["sha256"])):
+        return "restore"
+    return "download"
+
+
+def download_file(source, remote, raw_path, cache_dir):
+    """
+    Fetch one file into the cache (resuming partial bytes) and link it into place.
+    Returns False when raw_path already held the fetched content and was left as is.
+    """
+    output = _partial_path(cache_dir, remote)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    source.fetch(remote, output)
+
+    sha256 = mf.file_hash(output)
+    if remote.checksum is not None and sha256 != remote.checksum:
+        os.remove(output)
+        raise ValueError(f"Checksum mismatch for {remote.name}")
+    object_path = cached_object_path(cache_dir, sha256)
+    if os.path.exists(raw_path) and os.path.exists(object_path) and os.path.samefile(raw_path, object_path):
+        os.remove(output)
+        return False
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    os.replace(output, object_path)
+    link_object(object_path, raw_path)
+    return True
+
+
+def download_files(source, raw_dir=RAW_DIR, manifest_path=None, cache_dir=CACHE_DIR, workers=DOWNLOAD_WORKERS):
+    """
+    Mirror every file of `source` into raw_dir with a bounded thread pool.
+    With manifest_path, files whose size/checksum/modification time match the
+    "download" stage are skipped (a warm rerun only lists the source and stats
+    local files), and files missing locally are restored from the cache
+    without a transfer. Files the source lists without a checksum or
+    modification time (Drive) are fetched and hashed; unchanged ones are
+    left in place and reported as up to date.
+    Returns {"downloaded", "restored", "skipped", "failed"} file name lists.
+    """
+    os.makedirs(raw_dir, exist_ok=True)
+    manifest = mf.load_manifest(manifest_path) if manifest_path else None
+    result = {"downloaded": [], "restored": [], "skipped": [], "failed": []}
+
+    to_fetch = []
+    for remote in source.list_files():
+        raw_path = os.path.join(raw_dir, remote.name)
+        action = plan_download(remote, raw_path, manifest, cache_dir)
+        if action == "skip":
+            result["skipped"].append(remote.name)
+        elif action == "restore":
+            entry = mf.get_entry(manifest, "download", raw_path)
+            link_object(cached_object_path(cache_dir, entry["sha256"]), raw_path)
+            record_download(manifest, remote, raw_path)
+            result["restored"].append(remote.name)
+        else:
+            to_fetch.append((remote, raw_path))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(download_file, source, remote, raw_path, cache_dir) for remote, raw_path in to_fetch]
+        for (remote, raw_path), future in zip(to_fetch, futures):
+            try:
+                replaced = future.result()
+            except Exception as e:
+                print(f"Download failed for {remote.name}: {e}")
+                result["failed"].append(remote.name)
+                continue
+            if manifest is not None:
+                record_download(manifest, remote, raw_path)
+            result["downloaded" if replaced else "skipped"].append(remote.name)
+
+    if manifest is not None:
+        mf.save_manifest(manifest, manifest_path)
+
+    print(f"Downloaded: {len(result['downloaded'])}, restored from cache: {len(result['restored'])}, "
+          f"up to date: {len(result['skipped'])}, failed: {len(result['failed'])}")
+    if result["failed"]:
+        raise RuntimeError(f"{len(result['failed'])} file(s) failed to download: {result['failed']}")
+    return result
+
+
+def download_from_drive_folder(manifest_path=None, workers=DOWNLOAD_WORKERS):
+    print(f"⬇️ Downloading all files from Google Drive folder ({FOLDER_ID})...")
+    download_files(DriveSource(FOLDER_ID), RAW_DIR, manifest_path=manifest_path, workers=workers)
     print(f"✅ All raw files downloaded into {RAW_DIR}")
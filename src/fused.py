@@ -0,0 +1,173 @@
+"""
+fused.py — Single-pass pipeline mode.
+
+Each raw file is read once and carried through ingestion, cleaning,
+transformation and validation metrics as in-memory Arrow data, then streamed
+straight into the partitioned dataset. The intermediate Parquet files of the
+staged pipeline (processed/_cleaned, cleaned_only, transformed) are only
+written with persist=True, for debugging. Cleaning and transformation use
+the pandas engine functions from transform.py, as a non-incremental staged
+run does: rolling windows start empty and daily averages are per file (no
+daily aggregate store), so run_pipeline only runs it with incremental=False.
+
+A fused run rebuilds the whole final dataset; with a manifest it is skipped
+when no raw file changed since the last fused run. A file that fails is
+reported and left out, and the other files are still validated and loaded.
+"""
+
+import itertools
+import os
+import shutil
+import uuid
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src import catalog, loader, manifest as mf, metrics, validate
+from src.anomaly import ANOMALY_STATE_DIR, make_detector
+from src.windows import RollingWindow
+from src.ingestion import CRITICAL_COLUMNS, EXPECTED_COLUMNS, PROCESSED_DIR, validate_schema
+from src.parquet_writer import write_frame, write_table
+from src.schema import enforce_schema, to_frame
+from src.transform import CLEANED_OUTPUT_DIR, RAW_PROCESSED_DIR, TRANSFORMED_OUTPUT_DIR, clean_dataframe, transform_dataframe
+
+
+def ingest_table(file_path):
+    "Ingestion of one raw file in memory: projected columns, critical nulls dropped, compact schema."
+    table = pq.read_table(file_path, columns=EXPECTED_COLUMNS)
+    keep = pc.is_valid(table.column(CRITICAL_COLUMNS[0]))
+    for col in CRITICAL_COLUMNS[1:]:
+        keep = pc.and_(keep, pc.is_valid(table.column(col)))
+    return enforce_schema(table.filter(keep))
+
+
+def process_file(file_path, persist=False, detector=None, window=None):
+    """
+    Ingest, clean and transform one raw file without touching disk.
+    Returns the transformed Arrow table, or None when no rows are left.
+    With persist=True the stage outputs are also written where the staged
+    pipeline would put them.
+    """
+    name = os.path.basename(file_path)
+    ingested = ingest_table(file_path)
+    if persist:
+        os.makedirs(PROCESSED_DIR, exist_ok=True)
+        write_table(ingested, os.path.join(PROCESSED_DIR, name.replace(".parquet", "_cleaned.parquet")))
+    if ingested.num_rows == 0:
+        print(f"No valid rows in {file_path}, skipping.")
+        return None
+
+    if detector is not None:
+        detector.start(name)
+    if window is not None:
+        window.start(name)
+    cleaned = clean_dataframe(to_frame(ingested), detector)
+    if persist:
+        os.makedirs(CLEANED_OUTPUT_DIR, exist_ok=True)
+        write_frame(cleaned, os.path.join(CLEANED_OUTPUT_DIR, name.replace(".parquet", "_cleaned.parquet")))
+
+    transformed = pa.Table.from_pandas(transform_dataframe(cleaned, window), preserve_index=False)
+    if persist:
+        os.makedirs(TRANSFORMED_OUTPUT_DIR, exist_ok=True)
+        write_table(transformed, os.path.join(TRANSFORMED_OUTPUT_DIR, name.replace(".parquet", "_transformed.parquet")))
+    if detector is not None:
+        detector.commit()
+    print(f"Processed {file_path}: {len(ingested)} ingested, {len(transformed)} after cleaning")
+    return transformed
+
+
+def run_fused(raw_dir=RAW_PROCESSED_DIR, persist=False, manifest_path=None, expected_ranges=None,
+              partition_by=loader.PARTITION_BY, anomaly_method=None, anomaly_state_dir=ANOMALY_STATE_DIR):
+    """
+    Run ingestion → clean → transform → validation metrics → partitioned load
+    in one pass over the raw files. Returns the validation report, or None
+    when there was nothing to do.
+    anomaly_method: online detector for cleaning, as in clean_and_transform_all_files.
+    """
+    files = sorted(os.path.join(raw_dir, f) for f in os.listdir(raw_dir) if f.endswith(".parquet"))
+    manifest = mf.load_manifest(manifest_path) if manifest_path else None
+    if manifest is not None:
+        if not mf.changed_files(manifest, "fused", files) and not mf.removed_files(manifest, "fused", files):
+            print("No new or changed raw files; fused outputs are up to date.")
+            return None
+
+    valid = []
+    for path in files:
+        ok, missing = validate_schema(path, EXPECTED_COLUMNS)
+        if ok:
+            valid.append(path)
+        else:
+            print(f"Skipped {path}: Missing columns {missing}")
+
+    detector = make_detector(anomaly_method, anomaly_state_dir) if anomaly_method else None
+    window = RollingWindow()  # rolling windows continue from one file to the next
+    con = duckdb.connect(database=":memory:")
+    validate.create_metrics_table(con)
+    rows = {}
+    schema_checks = []
+
+    failed = []
+
+    def transformed_tables():
+        for path in valid:
+            try:
+                with metrics.stage("fused", unit="file", file=os.path.basename(path)) as record:
+                    table = process_file(path, persist, detector, window)
+                    record["bytes_read"] = metrics.file_bytes(path)
+                    record["rows_out"] = table.num_rows if table is not None else 0
+            except Exception as e:
+                # As in the staged path, one bad file never takes down the others
+                print(f"Failed to process {path}: {e}")
+                failed.append(path)
+                continue
+            if table is None:
+                continue
+            schema_checks.append(validate.scan_table(con, table, path, expected_ranges))
+            rows[path] = table.num_rows
+            yield table
+
+    tables = transformed_tables()
+    first = next(tables, None)
+    if first is None:
+        print("No rows to load.")
+        con.close()
+        return None
+
+    schema = loader.partition_schema(first.schema)
+    partition_cols = loader.partition_columns(schema, partition_by)
+
+    batches = (loader.conform(batch, schema)
+               for table in itertools.chain([first], tables) for batch in table.to_batches())
+
+    os.makedirs(loader.FINAL_OUTPUT_DIR, exist_ok=True)
+    staging_dir = f"{loader.FINAL_OUTPUT_DIR}.staging-{uuid.uuid4().hex}"
+    try:
+        print("Writing partitioned Parquet dataset...")
+        written = loader.write_staged(batches, schema, partition_cols, staging_dir,
+                                       loader.MAX_ROWS_PER_FILE, loader.ROW_GROUP_SIZE)
+        # Full rebuild: partitions nothing was written to are dropped
+        emptied = loader.existing_partitions() - written
+        loader.publish(staging_dir, written, emptied)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    print(f"Wrote {len(written)} partition(s), removed {len(emptied)} stale partition(s).")
+    catalog.update_catalog(written | emptied, root=loader.FINAL_OUTPUT_DIR)
+
+    if failed:
+        print(f"{len(failed)} file(s) failed and were left out: {[os.path.basename(p) for p in failed]}")
+    report = validate.build_report(con, schema_checks[0])
+    con.close()
+    if detector is not None:
+        detector.save(anomaly_state_dir)
+
+    if manifest is not None:
+        for key in mf.removed_files(manifest, "fused", files):
+            mf.forget(manifest, "fused", key)
+        # Failed files stay unrecorded, so the next run retries them
+        for path in files:
+            if path not in failed:
+                mf.record(manifest, "fused", path, rows=rows.get(path, 0), output=loader.FINAL_OUTPUT_DIR)
+        mf.save_manifest(manifest, manifest_path)
+    return report
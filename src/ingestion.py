@@ -1,12 +1,21 @@
 import os
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 import duckdb
-from datetime import datetime
+import pyarrow.parquet as pq
+from src import manifest as mf, metrics
+from src.parquet_writer import ROW_GROUP_SIZE, open_writer
+from src.schema import SENSOR_SCHEMA, enforce_schema
 
 RAW_DATA_DIR = "../data/raw"
 CHECKPOINT_FILE = "../data/last_ingested.txt"
 PROCESSED_DIR = "../data/processed"
 
+EXPECTED_COLUMNS = ["sensor_id", "timestamp", "reading_type", "value", "battery_level"]
+CRITICAL_COLUMNS = ["sensor_id", "timestamp", "reading_type", "value"]
+# Raw files read by one DuckDB query, and concurrent per-date writers
+INGEST_BATCH_FILES = 32
+INGEST_WORKERS = 4
+
 
 def get_last_ingested_date():
     """Reads the last ingested date from checkpoint file."""
@@ -23,89 +32,182 @@ def update_checkpoint(date_str):
         f.write(date_str)
 
 
+def arrived_late(file_path, output_file):
+    "A raw file at or before the checkpoint that was never ingested, or re-uploaded since."
+    return not os.path.exists(output_file) or os.path.getmtime(file_path) > os.path.getmtime(output_file)
+
+
 def validate_schema(file_path, expected_columns):
-    "Validate the schema of the parquet file using DuckDB."
+    "Validate the schema of the parquet file from its footer metadata only."
     try:
-        con = duckdb.connect()
-        result = con.execute(f"DESCRIBE SELECT * FROM parquet_scan('{file_path}')").fetchdf()
-        actual_columns = set(result['column_name'].tolist())
+        actual_columns = set(pq.read_schema(file_path).names)
         missing = set(expected_columns) - actual_columns
-        con.close()
         return len(missing) == 0, missing
     except Exception as e:
         print(f"Schema validation failed for {file_path}: {e}")
         return False, []
 
 
-def read_parquet_file(file_path):
-    """Safely reads a parquet file into a DataFrame."""
+def _sql_list(paths):
+    return "[" + ", ".join("'" + os.path.abspath(p).replace("'", "''") + "'" for p in paths) + "]"
+
+
+def _read_into(con, table, file_paths):
+    "Expected columns of file_paths (rows with all critical values) into a new table."
+    not_null = " AND ".join(f"{c} IS NOT NULL" for c in CRITICAL_COLUMNS)
+    source = (f"read_parquet({_sql_list(file_paths)}, filename = true, union_by_name = true)" if file_paths else
+              f"(SELECT NULL::VARCHAR AS filename, {', '.join(f'NULL AS {c}' for c in EXPECTED_COLUMNS)} LIMIT 0)")
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {table} AS
+        SELECT filename, {", ".join(EXPECTED_COLUMNS)}
+        FROM {source}
+        WHERE {not_null}
+    """)
+
+
+def load_batch(con, file_paths):
+    """
+    Read the expected columns of a batch of files in one DuckDB query, drop
+    rows with missing critical values and log the per-file summary.
+    If the batch fails, files are retried one by one and unreadable ones are
+    skipped (0 records kept), so they do not take the valid files down with them.
+    The rows stay in the ingest_batch table for the per-date writers.
+    Returns {file_path: records kept}.
+    """
     try:
-        df = pd.read_parquet(file_path)
-        return df
-    except Exception as e:
-        print(f"Failed to read {file_path}: {e}")
-        return None
-
-
-def log_summary(con, df):
-    """Log ingestion summary using DuckDB SQL."""
-    con.register("df", df)
+        _read_into(con, "ingest_batch", file_paths)
+    except duckdb.Error as e:
+        # One unreadable file fails the whole query: find it file by file and read the rest
+        print(f"Batch read failed ({e}); retrying its {len(file_paths)} file(s) one by one")
+        readable = []
+        for path in file_paths:
+            try:
+                _read_into(con, "ingest_probe", [path])
+                readable.append(path)
+            except duckdb.Error as file_error:
+                print(f"Skipped {os.path.basename(path)}: unreadable ({file_error})")
+            finally:
+                con.execute("DROP TABLE IF EXISTS ingest_probe")
+        _read_into(con, "ingest_batch", readable)
     summary = con.execute("""
-        SELECT 
+        SELECT
+            filename,
             COUNT(*) AS total_records,
             COUNT(DISTINCT sensor_id) AS unique_sensors,
             MIN(timestamp) AS min_time,
             MAX(timestamp) AS max_time
-        FROM df
+        FROM ingest_batch
+        GROUP BY filename
+        ORDER BY filename
     """).fetchdf()
-    print("Ingestion Summary:\n", summary.to_string(index=False))
-
-
-def ingest_data(raw_dir=RAW_DATA_DIR, processed_dir=PROCESSED_DIR):
-    expected_cols = ["sensor_id", "timestamp", "reading_type", "value", "battery_level"]
+    if len(summary):
+        print("Ingestion Summary:\n", summary.to_string(index=False))
+    kept = dict(zip(summary["filename"], summary["total_records"]))
+    return {path: int(kept.get(os.path.abspath(path), 0)) for path in file_paths}
+
+
+def write_ingested_file(con, file_path, output_file):
+    """
+    Stream one file's rows out of ingest_batch (on its own cursor), sorted by
+    (sensor_id, timestamp instant), and write them in the canonical compact schema.
+    """
+    cursor = con.cursor()
+    try:
+        reader = cursor.execute(f"""
+            SELECT {", ".join(EXPECTED_COLUMNS)} FROM ingest_batch
+            WHERE filename = '{os.path.abspath(file_path).replace("'", "''")}'
+            ORDER BY sensor_id, TRY_CAST(timestamp AS TIMESTAMPTZ), timestamp
+        """).to_arrow_reader()
+        with open_writer(output_file, SENSOR_SCHEMA, sorted=True) as writer:
+            for batch in reader:
+                writer.write_batch(enforce_schema(batch), row_group_size=ROW_GROUP_SIZE)
+    finally:
+        cursor.close()
+    return output_file
+
+
+def write_and_record(con, file_path, output_file, rows_out):
+    "write_ingested_file plus its per-file metrics record."
+    with metrics.stage("ingest", unit="file", file=os.path.basename(file_path)) as record:
+        write_ingested_file(con, file_path, output_file)
+        record["rows_in"] = pq.ParquetFile(file_path).metadata.num_rows
+        record["rows_out"] = rows_out
+        record["bytes_read"] = metrics.file_bytes(file_path)
+        record["bytes_written"] = metrics.file_bytes(output_file)
+    return output_file
+
+
+def ingest_data(raw_dir=RAW_DATA_DIR, processed_dir=PROCESSED_DIR, manifest_path=None, workers=INGEST_WORKERS):
+    """
+    Ingest raw files newer than the checkpoint, plus late or re-uploaded files
+    at or before it (see arrived_late). With manifest_path, new or changed
+    files are picked from the shared manifest instead.
+    Files are read in batches by one DuckDB connection and independent dates
+    are written concurrently; the checkpoint only ever moves forward.
+    """
+    expected_cols = EXPECTED_COLUMNS
 
     last_date = get_last_ingested_date()
     files = sorted(f for f in os.listdir(raw_dir) if f.endswith(".parquet"))
+    manifest = mf.load_manifest(manifest_path) if manifest_path else None
 
     processed_count = 0
     total_records = 0
     skipped_files = 0
 
-    con = duckdb.connect()
-
+    # Select new files and check their schema from the Parquet footer
+    pending = []
     for file in files:
         date_str = file.replace(".parquet", "")
-        if last_date and date_str <= last_date:
+        file_path = os.path.join(raw_dir, file)
+        if manifest is not None:
+            if not mf.is_changed(manifest, "ingest", file_path):
+                continue
+        elif last_date and date_str <= last_date and not arrived_late(
+                file_path, os.path.join(processed_dir, f"{date_str}_cleaned.parquet")):
             continue
 
-        file_path = os.path.join(raw_dir, file)
         print(f"\n Processing: {file_path}")
-
-        # Validate schema
         valid_schema, missing = validate_schema(file_path, expected_cols)
         if not valid_schema:
             print(f"Skipped {file}: Missing columns {missing}")
             skipped_files += 1
             continue
-
-        # Read data
-        df = read_parquet_file(file_path)
-        df = df.dropna(subset=["sensor_id", "timestamp", "reading_type", "value"])
-        if df.empty:
-            skipped_files += 1
-            continue
-
-        log_summary(con, df)
-
-        # Save to processed folder
-        os.makedirs(processed_dir, exist_ok=True)
-        output_file = os.path.join(processed_dir, f"{date_str}_cleaned.parquet")
-        df.to_parquet(output_file, index=False)
-
-        processed_count += 1
-        total_records += len(df)
-
-        update_checkpoint(date_str)
+        pending.append((date_str, file_path))
+
+    os.makedirs(processed_dir, exist_ok=True)
+    con = duckdb.connect(database=":memory:")
+
+    for start in range(0, len(pending), INGEST_BATCH_FILES):
+        batch = pending[start:start + INGEST_BATCH_FILES]
+        with metrics.stage("ingest", unit="batch", files=len(batch)):
+            kept = load_batch(con, [file_path for _, file_path in batch])
+
+        to_write = []
+        for date_str, file_path in batch:
+            if kept[file_path] == 0:
+                skipped_files += 1
+            else:
+                to_write.append((date_str, file_path, os.path.join(processed_dir, f"{date_str}_cleaned.parquet")))
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(write_and_record, con, file_path, output_file, kept[file_path])
+                       for _, file_path, output_file in to_write]
+            for (date_str, file_path, output_file), future in zip(to_write, futures):
+                future.result()
+                processed_count += 1
+                total_records += kept[file_path]
+                if manifest is not None:
+                    mf.record(manifest, "ingest", file_path, rows=kept[file_path], output=output_file)
+
+        if manifest is not None:
+            mf.save_manifest(manifest, manifest_path)
+
+        # Every file of the batch is written, so its latest date is safe to checkpoint
+        batch_last = max((date_str for date_str, _, _ in to_write), default=None)
+        if batch_last and (not last_date or batch_last > last_date):
+            update_checkpoint(batch_last)
+            last_date = batch_last
 
     con.close()
     print("\n Ingestion Completed!")
@@ -1,70 +1,445 @@
 import os
+import shutil
+import uuid
+from urllib.parse import quote
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from src import catalog, manifest as mf, metrics, parquet_writer
+from src.parquet_writer import dataset_write_options
+from src.schema import to_utc_timestamps
 
 # Input folder where transformed files are saved
 TRANSFORMED_DIR = "../data/processed/transformed"
-# Output folder for optimized Parquet storage
+# Output folder for optimized Parquet storage (Hive layout: date=*/sensor_id=*/)
 FINAL_OUTPUT_DIR = "../data/processed/final_parquet"
 
+# --- Dataset layout ---
+# ["date"] writes one file set per day with sensor_id kept inside the files
+PARTITION_BY = ["date", "sensor_id"]
+MAX_ROWS_PER_FILE = 5_000_000
+ROW_GROUP_SIZE = parquet_writer.ROW_GROUP_SIZE
+# Record batch size used while streaming transformed files
+BATCH_SIZE = 250_000
+# mode="upsert": a row with the same key replaces the stored one
+UPSERT_KEYS = ["sensor_id", "timestamp", "reading_type"]
+
+
+def _date_column(batch):
+    "The partition date as YYYY-MM-DD strings, derived from timestamp (UTC day) if needed."
+    if "date" in batch.schema.names:
+        date = batch.column("date")
+        if pa.types.is_string(date.type) or pa.types.is_large_string(date.type):
+            return date.cast(pa.string())
+        if pa.types.is_timestamp(date.type):
+            return pc.strftime(date, format="%Y-%m-%d")
+        return date.cast(pa.string())
+    return to_utc_timestamps(batch.column("timestamp")).cast(pa.date32()).cast(pa.string())
+
+
+# --- Staged writes: shared by the staged, fused, scheduled and sharded runs ---
+
+def partition_columns(schema, partition_by):
+    "Hive partition columns of a dataset schema (date only when it has no sensor_id)."
+    if "sensor_id" in partition_by and "sensor_id" not in schema.names:
+        print("Missing sensor_id column, cannot partition by sensor.")
+        return ["date"]
+    return list(partition_by)
+
+
+def partition_schema(file_schema):
+    "Dataset schema of one transformed file/table schema, with string partition keys."
+    file_schema = file_schema.remove_metadata()
+    schema = pa.schema([f for f in file_schema if f.name not in ("date", "sensor_id")])
+    schema = schema.append(pa.field("date", pa.string()))
+    if "sensor_id" in file_schema.names:
+        schema = schema.append(pa.field("sensor_id", pa.string()))
+    return schema
+
+
+def dataset_schema(paths):
+    "Unified schema of all transformed files (footers only), with string partition keys."
+    schemas = [partition_schema(pq.read_schema(path)) for path in paths]
+    return pa.unify_schemas(schemas, promote_options="permissive")
+
+
+def conform(batch, schema):
+    "Cast a batch to the dataset schema, adding missing columns as nulls."
+    columns = {name: batch.column(name) for name in batch.schema.names}
+    columns["date"] = _date_column(batch)
+    if "sensor_id" in columns:
+        columns["sensor_id"] = columns["sensor_id"].cast(pa.string())
+    arrays = [
+        columns[field.name].cast(field.type) if field.name in columns else pa.nulls(len(batch), field.type)
+        for field in schema
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _partition_key(batch, partition_cols):
+    "'date|sensor_id' per row, used to select rows of affected partitions."
+    if len(partition_cols) == 1:
+        return batch.column("date")
+    return pc.binary_join_element_wise(batch.column("date"), batch.column("sensor_id"), "|")
+
+
+def _partition_dir(key):
+    "Relative Hive directory of a 'date|sensor_id' (or 'date') partition key."
+    parts = key.split("|", 1)
+    names = ["date", "sensor_id"][:len(parts)]
+    return os.path.join(*[f"{name}={quote(value, safe='')}" for name, value in zip(names, parts)])
+
+
+def iter_batches(paths, schema, partition_cols, keep=None):
+    "Stream every transformed file batch by batch, optionally only rows of `keep` partitions."
+    value_set = pa.array(sorted(keep), pa.string()) if keep is not None else None
+    for path in paths:
+        print(f"Loading transformed data: {path}")
+        rows_in = rows_out = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=BATCH_SIZE):
+            rows_in += len(batch)
+            batch = conform(batch, schema)
+            if value_set is not None:
+                batch = batch.filter(pc.is_in(_partition_key(batch, partition_cols), value_set=value_set))
+            if len(batch):
+                rows_out += len(batch)
+                yield batch
+        metrics.record_file("load", path, rows_in=rows_in, rows_out=rows_out, bytes_read=metrics.file_bytes(path))
+
+
+def file_partitions(path, partition_cols):
+    "Partition keys one transformed file writes to, reading only the key columns."
+    names = pq.read_schema(path).names
+    columns = [c for c in ["date", "sensor_id"] if c in names]
+    if "date" not in names:
+        columns.append("timestamp")
+    keys = set()
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=BATCH_SIZE, columns=columns):
+        arrays = {"date": _date_column(batch)}
+        if "sensor_id" in partition_cols:
+            arrays["sensor_id"] = batch.column("sensor_id").cast(pa.string())
+        key_batch = pa.RecordBatch.from_pydict(arrays)
+        keys.update(pc.unique(_partition_key(key_batch, partition_cols)).to_pylist())
+    return sorted(keys)
+
+
+def write_staged(batches, schema, partition_cols, staging_dir, max_rows_per_file, row_group_size):
+    """
+    write_dataset of conformed batches into a staging directory (next to
+    FINAL_OUTPUT_DIR); returns the relative partition dirs written, for publish().
+    """
+    written = set()
+    ds.write_dataset(
+        batches,
+        staging_dir,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([schema.field(c) for c in partition_cols]), flavor="hive"),
+        basename_template="data-{i}.parquet",
+        max_rows_per_file=max_rows_per_file,
+        max_rows_per_group=row_group_size,
+        file_options=dataset_write_options(schema),
+        existing_data_behavior="overwrite_or_ignore",
+        file_visitor=lambda f: written.add(os.path.relpath(os.path.dirname(f.path), staging_dir)),
+    )
+    return written
+
+
+def existing_partitions():
+    "Relative partition directories currently holding files under FINAL_OUTPUT_DIR."
+    partitions = set()
+    for dirpath, _, filenames in os.walk(FINAL_OUTPUT_DIR):
+        if any(f.endswith(".parquet") for f in filenames) and dirpath != FINAL_OUTPUT_DIR:
+            partitions.add(os.path.relpath(dirpath, FINAL_OUTPUT_DIR))
+    return partitions
+
+
+def publish(staging_dir, written, emptied):
+    """
+    Swap staged partition directories into FINAL_OUTPUT_DIR with renames, and
+    drop partitions that no longer have rows. Readers never see half-written files.
+    """
+    trash_dir = f"{FINAL_OUTPUT_DIR}.trash-{uuid.uuid4().hex}"
+    for rel_dir in sorted(written | emptied):
+        final_dir = os.path.join(FINAL_OUTPUT_DIR, rel_dir)
+        if os.path.exists(final_dir):
+            os.makedirs(os.path.dirname(os.path.join(trash_dir, rel_dir)), exist_ok=True)
+            os.rename(final_dir, os.path.join(trash_dir, rel_dir))
+        if rel_dir in written:
+            os.makedirs(os.path.dirname(final_dir), exist_ok=True)
+            os.rename(os.path.join(staging_dir, rel_dir), final_dir)
+    shutil.rmtree(trash_dir, ignore_errors=True)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def _plan_incremental(paths, partition_cols, manifest):
+    """
+    Work out which files and partitions an incremental load has to touch.
+    Returns (changed, removed, affected partition keys, contributing files, new partitions per file).
+    """
+    entries = mf.stage_entries(manifest, "load")
+    changed = mf.changed_files(manifest, "load", paths)
+    removed = mf.removed_files(manifest, "load", paths)
+
+    # Partitions affected: where changed files write now, and where changed or
+    # removed files wrote before.
+    new_partitions = {path: file_partitions(path, partition_cols) for path in changed}
+    affected = set().union(*new_partitions.values()) if new_partitions else set()
+    for key in [os.path.abspath(p) for p in changed] + removed:
+        affected.update(entries.get(key, {}).get("partitions", []))
 
-def load_and_partition():
+    # Changed files plus unchanged files that also write into an affected partition
+    contributors = [
+        path for path in paths
+        if path in new_partitions
+        or affected.intersection(entries.get(os.path.abspath(path), {}).get("partitions", []))
+    ]
+    return changed, removed, affected, contributors, new_partitions
+
+
+# --- Upserts ---
+
+def _hashes(df, columns):
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def _equal_rows(a, b, columns):
+    "Row-wise equality of two equally long frames on `columns`; missing values compare equal."
+    equal = np.ones(len(a), dtype=bool)
+    for column in columns:
+        x, y = np.asarray(a[column], dtype=object), np.asarray(b[column], dtype=object)
+        equal &= (x == y) | (pd.isna(x) & pd.isna(y))
+    return equal
+
+
+def _match(old, new, keys):
+    """
+    Position in `old` of the row with the key of each row of `new`, or -1.
+    Looked up through a 64-bit hash index of the keys; hits are confirmed on
+    the key columns, and on a hash collision the lookup is redone on the keys.
+    """
+    index = pd.Index(_hashes(old, keys))
+    if index.is_unique:
+        position = index.get_indexer(_hashes(new, keys))
+        hits = np.flatnonzero(position >= 0)
+        if _equal_rows(new.iloc[hits], old.iloc[position[hits]], keys).all():
+            return position
+    return pd.MultiIndex.from_frame(old[keys]).get_indexer(pd.MultiIndex.from_frame(new[keys]))
+
+
+def _read_partition(rel_dir, key, schema, partition_cols):
+    "Stored rows of one partition in the dataset schema, partition keys taken from the path."
+    part_dir = os.path.join(FINAL_OUTPUT_DIR, rel_dir)
+    files = sorted(f for f in os.listdir(part_dir) if f.endswith(".parquet")) if os.path.isdir(part_dir) else []
+    if not files:
+        return schema.empty_table()
+    table = pa.concat_tables([pq.read_table(os.path.join(part_dir, f)) for f in files],
+                             promote_options="permissive")
+    values = dict(zip(partition_cols, key.split("|", 1)))
+    columns = []
+    for field in schema:
+        if field.name in values:
+            columns.append(pa.array([values[field.name]] * len(table), field.type))
+        elif field.name in table.schema.names:
+            columns.append(table.column(field.name).cast(field.type))
+        else:
+            columns.append(pa.nulls(len(table), field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _upsert_partition(existing, incoming):
+    """
+    Merge incoming rows of one partition into its stored rows by UPSERT_KEYS,
+    through a hash index of the stored keys. Returns (merged table, or None
+    when nothing changed, and counts of inserted/updated/ignored rows).
+    """
+    keys = [k for k in UPSERT_KEYS if k in incoming.schema.names]
+    old, new = existing.to_pandas(), incoming.to_pandas()
+    # Within the incoming rows (and any duplicates already stored) the last row of a key wins
+    last_new = ~new.duplicated(subset=keys, keep="last").to_numpy()
+    last_old = ~old.duplicated(subset=keys, keep="last").to_numpy()
+
+    position = np.full(len(new), -1)
+    position[last_new] = _match(old[last_old], new[last_new], keys)
+    matched = position >= 0
+    same = np.zeros(len(new), dtype=bool)
+    if matched.any():
+        old_rows = np.flatnonzero(last_old)[position[matched]]
+        same[matched] = _equal_rows(new[matched], old.iloc[old_rows], list(new.columns))
+
+    inserted = last_new & ~matched
+    updated = matched & ~same
+    counts = {"inserted": int(inserted.sum()), "updated": int(updated.sum()),
+              "ignored": int(len(new) - inserted.sum() - updated.sum())}
+    if not inserted.any() and not updated.any() and last_old.all():
+        return None, counts
+
+    keep_old = last_old.copy()
+    keep_old[np.flatnonzero(last_old)[position[updated]]] = False
+    merged = pa.concat_tables([existing.take(np.flatnonzero(keep_old)),
+                               incoming.take(np.flatnonzero(inserted | updated))])
+    return parquet_writer.sort_table(merged), counts
+
+
+def _upsert_tables(groups, schema, partition_cols, counts):
+    """
+    Merged table of every touched partition that changed; tallies counts.
+    groups maps the files feeding some partitions to those partition keys;
+    only one group's incoming rows are held at a time.
+    """
+    for files, keys in groups:
+        grouped = {}
+        for batch in iter_batches(files, schema, partition_cols, keep=keys):
+            rows = pd.Series(_partition_key(batch, partition_cols).to_numpy(zero_copy_only=False))
+            for key, positions in rows.groupby(rows, sort=False).indices.items():
+                grouped.setdefault(key, []).append(batch.take(positions))
+        for key in sorted(grouped):
+            incoming = pa.Table.from_batches(grouped.pop(key), schema=schema)
+            merged, partition_counts = _upsert_partition(
+                _read_partition(_partition_dir(key), key, schema, partition_cols), incoming)
+            for name, value in partition_counts.items():
+                counts[name] += value
+            if merged is not None:
+                yield from merged.to_batches(max_chunksize=BATCH_SIZE)
+
+
+def upsert_partitions(paths, partition_by=PARTITION_BY, max_rows_per_file=MAX_ROWS_PER_FILE,
+                      row_group_size=ROW_GROUP_SIZE):
+    """
+    Merge the rows of transformed files into the final dataset instead of
+    rebuilding partitions from all files: rows are matched on UPSERT_KEYS,
+    new keys are inserted, changed rows replace the stored ones and identical
+    rows are ignored. Only touched partitions are read and rewritten (through
+    staging + rename). Late or corrected uploads land in their old partitions.
+    Files are applied in modification-time order, so the latest upload of a key wins.
+    Partitions fed by the same files are merged together, one such group at a
+    time, so only that group's incoming rows are held in memory.
+    Returns {"inserted", "updated", "ignored", "partitions"}.
+    """
     os.makedirs(FINAL_OUTPUT_DIR, exist_ok=True)
+    paths = sorted(paths, key=os.path.getmtime)
+    schema = dataset_schema(paths)
+    partition_cols = partition_columns(schema, partition_by)
+
+    # Touched partitions, grouped by the files that feed them (read from the key columns only)
+    contributors = {}
+    for path in paths:
+        for key in file_partitions(path, partition_cols):
+            contributors.setdefault(key, []).append(path)
+    groups = {}
+    for key, files in contributors.items():
+        groups.setdefault(tuple(files), set()).add(key)
+    groups = sorted((list(files), keys) for files, keys in groups.items())
+
+    # Keep columns that only the stored files of touched partitions still have
+    stored = []
+    for key in contributors:
+        part_dir = os.path.join(FINAL_OUTPUT_DIR, _partition_dir(key))
+        if os.path.isdir(part_dir):
+            stored += [partition_schema(pq.read_schema(os.path.join(part_dir, f)))
+                       for f in os.listdir(part_dir) if f.endswith(".parquet")]
+    if stored:
+        schema = pa.unify_schemas([schema] + stored, promote_options="permissive")
+
+    counts = {"inserted": 0, "updated": 0, "ignored": 0}
+    staging_dir = f"{FINAL_OUTPUT_DIR}.staging-{uuid.uuid4().hex}"
+    try:
+        with metrics.stage("load", unit="upsert", partitions=len(contributors)) as record:
+            written = write_staged(_upsert_tables(groups, schema, partition_cols, counts),
+                                    schema, partition_cols, staging_dir, max_rows_per_file, row_group_size)
+            record["rows_out"] = counts["inserted"] + counts["updated"]
+            record["bytes_written"] = metrics.dir_bytes(staging_dir)
+        publish(staging_dir, written, set())
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    print(f"Upsert: {counts['inserted']} inserted, {counts['updated']} updated, {counts['ignored']} ignored "
+          f"row(s); rewrote {len(written)} of {len(contributors)} touched partition(s).")
+    with metrics.stage("load", unit="catalog"):
+        catalog.update_catalog(written, root=FINAL_OUTPUT_DIR)
+    return {**counts, "partitions": sorted(written)}
 
-    files = [f for f in os.listdir(TRANSFORMED_DIR) if f.endswith("_transformed.parquet")]
+
+def load_and_partition(manifest_path=None, partition_by=PARTITION_BY,
+                       max_rows_per_file=MAX_ROWS_PER_FILE, row_group_size=ROW_GROUP_SIZE, mode="rebuild"):
+    """
+    Stream transformed files into a Hive-partitioned (date, sensor_id) Parquet
+    dataset under FINAL_OUTPUT_DIR. Partitions are written to a staging
+    directory and swapped in with renames.
+    With manifest_path, only partitions affected by new/changed/removed files are rewritten.
+    mode="upsert" merges the (new/changed) files into the stored rows by
+    UPSERT_KEYS instead (upsert_partitions); rows of removed files stay.
+    """
+    if mode not in ("rebuild", "upsert"):
+        raise ValueError(f"Unknown load mode '{mode}', expected 'rebuild' or 'upsert'")
+    os.makedirs(FINAL_OUTPUT_DIR, exist_ok=True)
+
+    files = sorted(f for f in os.listdir(TRANSFORMED_DIR) if f.endswith("_transformed.parquet"))
     if not files:
         print("No transformed files found for loading.")
         return
 
-    all_data = []
-    for file in files:
-        file_path = os.path.join(TRANSFORMED_DIR, file)
-        print(f"Loading transformed data: {file_path}")
-        try:
-            df = pd.read_parquet(file_path)
-            if not df.empty:
-                all_data.append(df)
-        except Exception as e:
-            print(f"Failed to read {file_path}: {e}")
-
-    if not all_data:
-        print("No data available for final storage.")
-        return
+    paths = [os.path.join(TRANSFORMED_DIR, f) for f in files]
+    manifest = mf.load_manifest(manifest_path) if manifest_path else None
+    if mode == "upsert":
+        changed = mf.changed_files(manifest, "load", paths) if manifest is not None else paths
+        if not changed:
+            print("No new or changed transformed files; final dataset is up to date.")
+            return
+        result = upsert_partitions(changed, partition_by, max_rows_per_file, row_group_size)
+        if manifest is not None:
+            partition_cols = partition_columns(dataset_schema(changed), partition_by)
+            for path in changed:
+                mf.record(manifest, "load", path, output=FINAL_OUTPUT_DIR,
+                          partitions=file_partitions(path, partition_cols),
+                          rows=pq.ParquetFile(path).metadata.num_rows)
+            mf.save_manifest(manifest, manifest_path)
+        return result
 
-    # Combine all transformed data into a single DataFrame
-    full_df = pd.concat(all_data, ignore_index=True)
-    print(f"Combined {len(full_df)} total records from {len(files)} files.")
+    schema = dataset_schema(paths)
+    partition_cols = partition_columns(schema, partition_by)
+    keep, emptied = None, set()
+    contributors, changed, removed, new_partitions = paths, paths, [], {}
+    if manifest is not None:
+        changed, removed, keep, contributors, new_partitions = _plan_incremental(paths, partition_cols, manifest)
+        if not changed and not removed:
+            print("No new or changed transformed files; final dataset is up to date.")
+            if not os.path.exists(catalog.catalog_path(FINAL_OUTPUT_DIR)):
+                catalog.update_catalog(root=FINAL_OUTPUT_DIR)
+            return
+        print(f"Incremental load: {len(changed)} new/changed, {len(removed)} removed file(s), "
+              f"{len(keep)} partition(s) to rewrite.")
 
-    # --- Ensure required columns are present ---
-    if "date" not in full_df.columns:
-        full_df["date"] = pd.to_datetime(full_df["timestamp"]).dt.date
-
-    if "sensor_id" not in full_df.columns:
-        print("Missing sensor_id column, cannot partition by sensor.")
-        partition_cols = ["date"]
-    else:
-        partition_cols = ["date", "sensor_id"]
-
-    # --- Store optimized Parquet ---
-    # Using Snappy compression for fast analytics
-    output_path = os.path.join(FINAL_OUTPUT_DIR, "agri_sensor_data.parquet")
-
-    print("Writing optimized Parquet dataset...")
-    full_df.to_parquet(
-        output_path,
-        index=False,
-        compression="snappy",
-        engine="pyarrow"
-    )
+    staging_dir = f"{FINAL_OUTPUT_DIR}.staging-{uuid.uuid4().hex}"
+    try:
+        print("Writing partitioned Parquet dataset...")
+        with metrics.stage("load", unit="write") as record:
+            written = write_staged(iter_batches(contributors, schema, partition_cols, keep),
+                                    schema, partition_cols, staging_dir, max_rows_per_file, row_group_size)
+            record["bytes_written"] = metrics.dir_bytes(staging_dir)
+        if keep is not None:
+            emptied = {_partition_dir(key) for key in keep} - written
+        else:
+            emptied = existing_partitions() - written
+        publish(staging_dir, written, emptied)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
 
-    print(f"Data stored at: {output_path}")
+    print(f"Wrote {len(written)} partition(s), removed {len(emptied)} empty partition(s).")
+    with metrics.stage("load", unit="catalog"):
+        catalog.update_catalog(written | emptied, root=FINAL_OUTPUT_DIR)
 
-    # --- Optional: Partitioned save (per date or per sensor) ---
-    print("Creating partitioned structure for analytical queries...")
-    for (date, sensor_id), group_df in full_df.groupby(partition_cols):
-        partition_dir = os.path.join(FINAL_OUTPUT_DIR, f"date={date}", f"sensor_id={sensor_id}")
-        os.makedirs(partition_dir, exist_ok=True)
-        out_file = os.path.join(partition_dir, f"data_{date}_{sensor_id}.parquet")
-        group_df.to_parquet(out_file, index=False, compression="snappy")
+    if manifest is not None:
+        for path in changed:
+            mf.record(manifest, "load", path, output=FINAL_OUTPUT_DIR, partitions=new_partitions[path],
+                      rows=pq.ParquetFile(path).metadata.num_rows)
+        for key in removed:
+            mf.forget(manifest, "load", key)
+        mf.save_manifest(manifest, manifest_path)
 
     print(f"Partitioned dataset stored under: {FINAL_OUTPUT_DIR}")
 
@@ -0,0 +1,101 @@
+"""
+manifest.py — Shared per-file, per-stage state for incremental runs.
+
+The manifest is one JSON file:
+    {"stages": {stage: {input_path: {"sha256", "mtime", "size", "rows", "output", ...}}}}
+A stage asks changed_files() which of its inputs are new or changed since it
+last recorded them, processes only those, then calls record() + save_manifest().
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_PATH = "../data/manifest.json"
+
+
+def load_manifest(path=MANIFEST_PATH):
+    "Load the manifest, or an empty one if it does not exist yet."
+    if not os.path.exists(path):
+        return {"stages": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    "Write the manifest atomically (temp file + rename)."
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True, default=str)
+    os.replace(tmp_path, path)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    "SHA-256 of the file content, read in chunks."
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _key(path):
+    return os.path.abspath(path)
+
+
+def stage_entries(manifest, stage):
+    "All recorded inputs of a stage, keyed by absolute input path."
+    return manifest["stages"].setdefault(stage, {})
+
+
+def get_entry(manifest, stage, path):
+    return stage_entries(manifest, stage).get(_key(path))
+
+
+def is_changed(manifest, stage, path):
+    """
+    True when `path` is new or its content changed since the stage recorded it.
+    mtime + size are checked first; the content hash only when they differ.
+    """
+    entry = get_entry(manifest, stage, path)
+    if entry is None:
+        return True
+    stat = os.stat(path)
+    if entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+        return False
+    if entry["size"] != stat.st_size or entry["sha256"] != file_hash(path):
+        return True
+    entry["mtime"] = stat.st_mtime  # touched, content unchanged
+    return False
+
+
+def changed_files(manifest, stage, paths):
+    "Subset of paths that the stage still has to (re)process, in input order."
+    return [path for path in paths if is_changed(manifest, stage, path)]
+
+
+def removed_files(manifest, stage, paths):
+    "Recorded inputs of the stage that are no longer among `paths`."
+    current = {_key(path) for path in paths}
+    return [key for key in stage_entries(manifest, stage) if key not in current]
+
+
+def record(manifest, stage, path, rows=None, output=None, **extra):
+    "Record that the stage processed `path` in its current state."
+    stat = os.stat(path)
+    entry = {
+        "sha256": file_hash(path),
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "rows": rows,
+        "output": output,
+    }
+    entry.update(extra)
+    stage_entries(manifest, stage)[_key(path)] = entry
+    return entry
+
+
+def forget(manifest, stage, key):
+    "Drop a recorded input (e.g. after its file was deleted)."
+    stage_entries(manifest, stage).pop(key, None)
@@ -0,0 +1,237 @@
+"""
+metrics.py — Stage and per-file instrumentation for pipeline runs.
+
+    metrics.start_run()
+    with metrics.stage("transform"):                       # one pipeline stage
+        with metrics.stage("transform", unit="file", file=name) as m:
+            ...
+            m["rows_in"], m["rows_out"] = 100, 98
+    metrics.finish_run()
+
+Each record has wall and CPU seconds (CPU is process-wide, plus reaped child
+processes), optional rows_in/rows_out and bytes_read/bytes_written, and two
+memory figures: process_peak_rss_bytes, the high-water mark of the process
+(and reaped children) so far, which is not specific to the stage, and
+peak_rss_growth_bytes, how far the stage raised that mark (0 when an earlier
+stage already went higher). Records are appended to a JSON-lines run log
+while a run is active; finish_run() rolls the run up per stage into a
+Prometheus textfile (for node_exporter's textfile collector).
+
+The run id travels in an environment variable, so worker processes of the
+transform pool log into the same run.
+
+Profiling one stage: set PIPELINE_PROFILE=<stage> to write a cProfile .pstats
+file for that stage, or PIPELINE_PROFILE=<stage>:py-spy to record it with
+py-spy (when installed) as a flame graph.
+"""
+
+import cProfile
+import json
+import os
+import shutil
+import subprocess
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+METRICS_DIR = "../data/metrics"
+RUN_LOG_PATH = os.path.join(METRICS_DIR, "run_log.jsonl")
+PROMETHEUS_PATH = os.path.join(METRICS_DIR, "sensor_pipeline.prom")
+RUN_ID_ENV = "PIPELINE_RUN_ID"
+PROFILE_ENV = "PIPELINE_PROFILE"
+
+COUNTERS = ["rows_in", "rows_out", "bytes_read", "bytes_written"]
+
+
+def start_run(run_id=None):
+    "Start logging records under a new (or given) run id; returns the run id."
+    run_id = run_id or time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    os.environ[RUN_ID_ENV] = run_id
+    return run_id
+
+
+def current_run():
+    return os.environ.get(RUN_ID_ENV)
+
+
+def file_bytes(*paths):
+    "Total size of the given files (missing files count as 0)."
+    return sum(os.path.getsize(p) for p in paths if p and os.path.isfile(p))
+
+
+def dir_bytes(path):
+    "Total size of the files under a directory."
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+
+
+def _children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def emit(record):
+    "Append one record to the run log (no-op outside a run)."
+    if current_run() is None:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(RUN_LOG_PATH)), exist_ok=True)
+    # One short write per line; O_APPEND keeps lines from worker processes whole
+    with open(RUN_LOG_PATH, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+def record_file(name, file, **counters):
+    """
+    Log counters of one file handled inside a bulk operation (e.g. one DuckDB
+    scan over many files), where per-file timing is not available.
+    """
+    record = {"run_id": current_run(), "stage": name, "unit": "file", "file": os.path.basename(str(file)),
+              "status": "ok", "wall_seconds": None, "cpu_seconds": None, "process_peak_rss_bytes": None,
+              "peak_rss_growth_bytes": None}
+    record.update({counter: counters.get(counter) for counter in COUNTERS})
+    emit(record)
+
+
+def _start_profiler(name):
+    "cProfile or py-spy for the stage selected by PIPELINE_PROFILE, else None."
+    target, _, tool = os.environ.get(PROFILE_ENV, "").partition(":")
+    if target != name:
+        return None
+    base = os.path.join(METRICS_DIR, f"profile-{name}-{current_run() or 'adhoc'}")
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    if tool == "py-spy":
+        if shutil.which("py-spy") is None:
+            print("py-spy not found on PATH, falling back to cProfile.")
+        else:
+            proc = subprocess.Popen(["py-spy", "record", "--pid", str(os.getpid()),
+                                     "--subprocesses", "-o", f"{base}.svg"])
+            return ("py-spy", proc, f"{base}.svg")
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return ("cprofile", profiler, f"{base}.pstats")
+
+
+def _stop_profiler(handle):
+    kind, obj, path = handle
+    if kind == "py-spy":
+        obj.terminate()  # py-spy writes its output on SIGTERM/SIGINT
+        obj.wait()
+    else:
+        obj.disable()
+        obj.dump_stats(path)
+    print(f"Profile of this stage written to {path}")
+
+
+@contextmanager
+def stage(name, unit="stage", **labels):
+    """
+    Time a stage (unit="stage") or a unit of work inside one (e.g. unit="file").
+    Yields the record so the caller can fill in rows/bytes counters.
+    """
+    record = {"run_id": current_run(), "stage": name, "unit": unit, **labels}
+    record.update({counter: None for counter in COUNTERS})
+    profiler = _start_profiler(name) if unit == "stage" else None
+    wall, cpu, child_cpu = time.perf_counter(), time.process_time(), _children_cpu()
+    peak_before = _peak_rss_bytes()
+    record["started_at"] = time.time()
+    record["status"] = "ok"
+    try:
+        yield record
+    except BaseException:
+        record["status"] = "failed"
+        raise
+    finally:
+        record["wall_seconds"] = round(time.perf_counter() - wall, 6)
+        record["cpu_seconds"] = round(time.process_time() - cpu + _children_cpu() - child_cpu, 6)
+        peak = _peak_rss_bytes()
+        record["process_peak_rss_bytes"] = peak
+        record["peak_rss_growth_bytes"] = None if peak is None else peak - peak_before
+        if profiler is not None:
+            _stop_profiler(profiler)
+        emit(record)
+
+
+def _run_records(run_id):
+    if not os.path.exists(RUN_LOG_PATH):
+        return []
+    with open(RUN_LOG_PATH) as f:
+        return [r for r in (json.loads(line) for line in f if line.strip()) if r.get("run_id") == run_id]
+
+
+def summarize_run(run_id=None):
+    """
+    Per-stage totals of a run: wall/cpu time and peak RSS figures from the stage records,
+    rows/bytes summed over the units inside the stage, and the file count.
+    """
+    run_id = run_id or current_run()
+    summary = {}
+    for r in _run_records(run_id):
+        s = summary.setdefault(r["stage"], {"wall_seconds": 0.0, "cpu_seconds": 0.0, "process_peak_rss_bytes": 0,
+                                            "peak_rss_growth_bytes": 0, "files": 0, "failed": 0,
+                                            **{c: 0 for c in COUNTERS}})
+        if r["unit"] == "stage":
+            s["wall_seconds"] += r["wall_seconds"]
+            s["cpu_seconds"] += r["cpu_seconds"]
+            for field in ["process_peak_rss_bytes", "peak_rss_growth_bytes"]:
+                s[field] = max(s[field], r.get(field) or 0)
+        elif r["unit"] == "file":
+            s["files"] += 1
+        s["failed"] += r["status"] == "failed"
+        for c in COUNTERS:
+            s[c] += r.get(c) or 0
+    return summary
+
+
+def write_prometheus(summary, run_id, path=None):
+    "Write the per-stage summary as Prometheus gauges (temp file + rename)."
+    path = path or PROMETHEUS_PATH
+    help_text = {
+        "wall_seconds": "Wall-clock time of the stage in the last run.",
+        "cpu_seconds": "CPU time of the stage in the last run.",
+        "process_peak_rss_bytes": "Peak RSS of the pipeline process (so far, not per stage) at the end of the stage.",
+        "peak_rss_growth_bytes": "How far the stage raised the peak RSS of the pipeline process.",
+        "files": "Files processed by the stage in the last run.",
+        "failed": "Failed stage or file units in the last run.",
+        "rows_in": "Rows read by the stage in the last run.",
+        "rows_out": "Rows written by the stage in the last run.",
+        "bytes_read": "Bytes read by the stage in the last run.",
+        "bytes_written": "Bytes written by the stage in the last run.",
+    }
+    lines = []
+    for field, text in help_text.items():
+        metric = f"sensor_pipeline_stage_{field}"
+        lines += [f"# HELP {metric} {text}", f"# TYPE {metric} gauge"]
+        lines += [f'{metric}{{stage="{name}"}} {values[field]}' for name, values in sorted(summary.items())]
+    lines += ["# HELP sensor_pipeline_last_run_timestamp_seconds End time of the last run.",
+              "# TYPE sensor_pipeline_last_run_timestamp_seconds gauge",
+              f'sensor_pipeline_last_run_timestamp_seconds{{run_id="{run_id}"}} {time.time():.3f}']
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(f"{path}.tmp", path)
+
+
+def finish_run():
+    "Roll the active run up into the Prometheus textfile and end it; returns the summary."
+    run_id = current_run()
+    if run_id is None:
+        return {}
+    summary = summarize_run(run_id)
+    write_prometheus(summary, run_id)
+    os.environ.pop(RUN_ID_ENV, None)
+    return summary
@@ -0,0 +1,103 @@
+"""
+parquet_writer.py — One writer configuration for the Parquet files of the pipeline.
+
+Files are sorted by (sensor_id, timestamp) and record that order in the
+footer (sorting_columns), row groups have a fixed size, and column
+statistics, page indexes and a bloom filter on sensor_id are written, so
+readers (pyarrow filters, DuckDB, Spark) can skip row groups and pages on
+timestamp ranges and sensor lookups.
+
+Encodings per column: dictionary for low-cardinality keys, BYTE_STREAM_SPLIT
+for float measurements (compresses better than plain under zstd), plain for
+the rest.
+
+    write_frame(df, path)                        # pandas
+    write_table(table, path)                     # Arrow
+    with open_writer(path, schema) as writer:    # streamed batches
+        writer.write_batch(batch, row_group_size=ROW_GROUP_SIZE)
+    ds.write_dataset(..., file_options=dataset_write_options(schema))
+    con.execute(f"COPY ... TO 'x.parquet' ({duckdb_copy_options()})")
+"""
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+SORT_KEYS = ["sensor_id", "timestamp"]
+ROW_GROUP_SIZE = 250_000
+COMPRESSION = "zstd"
+COMPRESSION_LEVEL = 3
+DICTIONARY_COLUMNS = ["sensor_id", "reading_type", "date"]
+# Expected distinct values per file, sizes the bloom filter
+BLOOM_FILTER_NDV = {"sensor_id": 10_000}
+WRITE_PAGE_INDEX = True
+
+
+def sort_keys(schema):
+    return [k for k in SORT_KEYS if k in schema.names]
+
+
+def write_options(schema, sorted=False, **overrides):
+    """
+    Keyword arguments for pq.write_table / pq.ParquetWriter /
+    make_write_options for a file with this schema. sorted=True records
+    SORT_KEYS as the file's sort order.
+    """
+    options = {
+        "compression": COMPRESSION,
+        "compression_level": COMPRESSION_LEVEL,
+        "use_dictionary": [c for c in DICTIONARY_COLUMNS if c in schema.names],
+        "column_encoding": {f.name: "BYTE_STREAM_SPLIT" for f in schema
+                            if pa.types.is_floating(f.type) and f.name not in DICTIONARY_COLUMNS},
+        "write_statistics": True,
+        "write_page_index": WRITE_PAGE_INDEX,
+        "bloom_filter_options": {c: {"ndv": n} for c, n in BLOOM_FILTER_NDV.items() if c in schema.names},
+    }
+    if sorted and sort_keys(schema):
+        options["sorting_columns"] = pq.SortingColumn.from_ordering(
+            schema, [(k, "ascending") for k in sort_keys(schema)])
+    options.update(overrides)
+    return options
+
+
+def sort_table(table):
+    "Table sorted by SORT_KEYS (those present); stable, so ties keep their order."
+    keys = sort_keys(table.schema)
+    if not keys:
+        return table
+    # Table sorting does not take dictionary columns, so sort on decoded keys
+    columns = [table.column(k) for k in keys]
+    columns = [c.cast(c.type.value_type) if pa.types.is_dictionary(c.type) else c for c in columns]
+    indices = pc.sort_indices(pa.table(dict(zip(keys, columns))), sort_keys=[(k, "ascending") for k in keys])
+    return table.take(indices)
+
+
+def write_table(table, path, sort=True, row_group_size=ROW_GROUP_SIZE, **overrides):
+    "Write an Arrow table with the pipeline's layout (sorted by default)."
+    if sort:
+        table = sort_table(table)
+    pq.write_table(table, path, row_group_size=row_group_size,
+                   **write_options(table.schema, sorted=sort, **overrides))
+    return path
+
+
+def write_frame(df, path, sort=True, **overrides):
+    "Write a pandas DataFrame (index dropped) with the pipeline's layout."
+    return write_table(pa.Table.from_pandas(df, preserve_index=False), path, sort=sort, **overrides)
+
+
+def open_writer(path, schema, sorted=False, **overrides):
+    "pq.ParquetWriter with the pipeline's options; pass sorted=True only if batches arrive in SORT_KEYS order."
+    return pq.ParquetWriter(path, schema, **write_options(schema, sorted=sorted, **overrides))
+
+
+def dataset_write_options(schema, **overrides):
+    "file_options for ds.write_dataset (row groups are sized by its max_rows_per_group)."
+    return ds.ParquetFileFormat().make_write_options(**write_options(schema, **overrides))
+
+
+def duckdb_copy_options():
+    "Options of DuckDB's COPY ... TO (...) matching the writer configuration."
+    return (f"FORMAT PARQUET, COMPRESSION {COMPRESSION}, COMPRESSION_LEVEL {COMPRESSION_LEVEL}, "
+            f"ROW_GROUP_SIZE {ROW_GROUP_SIZE}")
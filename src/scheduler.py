@@ -0,0 +1,360 @@
+"""
+scheduler.py — Asyncio scheduler that overlaps the per-file stages of a run.
+
+Every raw file flows through a DAG of stages:
+
+    download ─┬─> ingest
+              └─> transform ─┬─> validate (scan) ──> report
+                             └─> load (write) ────> publish
+
+Stages are connected by bounded asyncio queues, so file N+1 can download
+and ingest while file N transforms and file N-1 is written into the final
+dataset, and a slow stage holds back the ones feeding it (backpressure).
+Downloads, ingestion, validation scans and Parquet writes run in threads;
+transforms run in a process pool (or, when a detector or rolling window is
+carried from file to file, one at a time in file-name order).
+
+Files that fail a stage are reported and skip the rest of their branch. The
+validation report and the final dataset cover every raw file, so like fused
+mode a scheduled run rebuilds them; with a manifest, unchanged files skip
+download, ingestion and transformation. The final dataset is only published
+when every file made it through.
+"""
+
+import asyncio
+import functools
+import os
+import queue
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import duckdb
+import pyarrow.parquet as pq
+
+from src import catalog, loader, manifest as mf, metrics, validate
+from src.anomaly import ANOMALY_STATE_DIR
+from src.download_from_drive import (CACHE_DIR, DOWNLOAD_WORKERS, RAW_DIR, cached_object_path, download_file,
+                                     link_object, plan_download, record_download)
+from src.ingestion import EXPECTED_COLUMNS, PROCESSED_DIR, load_batch, validate_schema, write_and_record
+from src.transform import (CLEANED_OUTPUT_DIR, TRANSFORMED_OUTPUT_DIR, process_raw_file, refresh_daily_avg,
+                           save_transform_state, transform_options)
+
+# --- Backpressure ---
+# Items waiting between two stages, and concurrent workers per stage
+QUEUE_SIZE = 4
+CONCURRENCY = {"download": DOWNLOAD_WORKERS, "ingest": 2, "transform": 2, "validate": 1, "load": 1}
+
+_DONE = object()
+
+
+async def _ordered(inbox):
+    "Items of inbox in seq order (upstream stages may finish files out of order)."
+    pending, next_seq, done = {}, 0, False
+    while True:
+        while next_seq in pending:
+            yield pending.pop(next_seq)
+            next_seq += 1
+        if done:
+            for seq in sorted(pending):
+                yield pending.pop(seq)
+            return
+        item = await inbox.get()
+        if item is _DONE:
+            done = True
+        else:
+            pending[item["seq"]] = item
+
+
+async def _unordered(inbox):
+    while (item := await inbox.get()) is not _DONE:
+        yield item
+    await inbox.put(_DONE)  # let the other workers of the stage see it
+
+
+async def _stage(name, handle, inbox, outboxes, workers=1, ordered=False, errors=None):
+    """
+    Run handle(item) on every item of inbox with `workers` concurrent tasks
+    and pass each item on to every outbox. Failed items are added to errors
+    and forwarded with their error so downstream stages skip them.
+    """
+    async def worker():
+        items = _ordered(inbox) if ordered else _unordered(inbox)
+        async for item in items:
+            if item["error"] is None:
+                try:
+                    await handle(item)
+                except Exception as e:
+                    print(f"{name} failed for {item['name']}: {e}")
+                    item["error"] = f"{name}: {e}"
+                    if errors is not None:
+                        errors.append(f"{item['name']} ({item['error']})")
+            for box in outboxes:
+                await box.put(dict(item))  # branches get their own copy
+
+    await asyncio.gather(*(worker() for _ in range(1 if ordered else max(1, workers))))
+    for box in outboxes:
+        await box.put(_DONE)
+
+
+class _ScheduledRun:
+    "State of one scheduled run; the stage handlers are its methods."
+
+    def __init__(self, source, raw_dir, processed_dir, cleaned_dir, transformed_dir, engine, manifest_path,
+                 expected_ranges, anomaly_method, anomaly_state_dir, window_state_dir, aggregate_state_dir,
+                 concurrency, queue_size, cache_dir):
+        self.source = source
+        self.raw_dir, self.processed_dir = raw_dir, processed_dir
+        self.cleaned_dir, self.transformed_dir = cleaned_dir, transformed_dir
+        self.engine = engine
+        self.manifest_path = manifest_path
+        self.manifest = mf.load_manifest(manifest_path) if manifest_path else None
+        self.expected_ranges = expected_ranges if expected_ranges is not None else validate.EXPECTED_RANGES
+        self.anomaly_state_dir, self.window_state_dir = anomaly_state_dir, window_state_dir
+        self.aggregate_state_dir = aggregate_state_dir
+        self.concurrency = {**CONCURRENCY, **(concurrency or {})}
+        self.queue_size = queue_size
+        self.cache_dir = cache_dir
+        self.options, self.transform_workers = transform_options(
+            engine, self.concurrency["transform"], anomaly_method, anomaly_state_dir, window_state_dir,
+            aggregate_state_dir)
+        self.aggregates_since = self.options["aggregates"].version if "aggregates" in self.options else None
+        self.errors = []
+
+    # --- Source ---
+
+    def _list_items(self):
+        if self.source is not None:
+            remotes = sorted(self.source.list_files(), key=lambda r: r.name)
+            names = [(r.name, r) for r in remotes]
+        else:
+            names = [(f, None) for f in sorted(os.listdir(self.raw_dir)) if f.endswith(".parquet")]
+        return [{"seq": i, "name": name, "remote": remote, "raw_path": os.path.join(self.raw_dir, name),
+                 "error": None} for i, (name, remote) in enumerate(names)]
+
+    # --- Stage handlers ---
+
+    def _fetch(self, item):
+        remote, raw_path = item["remote"], item["raw_path"]
+        action = plan_download(remote, raw_path, self.manifest, self.cache_dir)
+        if action == "skip":
+            return
+        with metrics.stage("download", unit="file", file=item["name"]) as record:
+            if action == "restore":
+                entry = mf.get_entry(self.manifest, "download", raw_path)
+                link_object(cached_object_path(self.cache_dir, entry["sha256"]), raw_path)
+            else:
+                download_file(self.source, remote, raw_path, self.cache_dir)
+            record["bytes_written"] = metrics.file_bytes(raw_path)
+        if self.manifest is not None:
+            record_download(self.manifest, remote, raw_path)
+
+    async def download(self, item):
+        await asyncio.to_thread(self._fetch, item)
+
+    def _ingest(self, item):
+        raw_path = item["raw_path"]
+        if self.manifest is not None and not mf.is_changed(self.manifest, "ingest", raw_path):
+            return
+        ok, missing = validate_schema(raw_path, EXPECTED_COLUMNS)
+        if not ok:
+            print(f"Skipped {item['name']}: Missing columns {missing}")
+            return
+        output_file = os.path.join(self.processed_dir, item["name"].replace(".parquet", "_cleaned.parquet"))
+        con = duckdb.connect(database=":memory:")
+        try:
+            kept = load_batch(con, [raw_path])[raw_path]
+            if kept:
+                write_and_record(con, raw_path, output_file, kept)
+        finally:
+            con.close()
+        if self.manifest is not None:
+            mf.record(self.manifest, "ingest", raw_path, rows=kept, output=output_file)
+
+    async def ingest(self, item):
+        await asyncio.to_thread(self._ingest, item)
+
+    async def transform(self, item):
+        raw_path = item["raw_path"]
+        item["transformed_path"] = os.path.join(
+            self.transformed_dir, item["name"].replace(".parquet", "_transformed.parquet"))
+        if (self.manifest is not None and os.path.exists(item["transformed_path"])
+                and not mf.is_changed(self.manifest, "transform", raw_path)):
+            return
+        call = functools.partial(process_raw_file, self.engine, item["name"], self.raw_dir, self.cleaned_dir,
+                                 self.transformed_dir, **self.options)
+        summary = await asyncio.get_running_loop().run_in_executor(self.transform_pool, call)
+        if summary["status"] == "failed":
+            raise RuntimeError(summary["error"])
+        if summary["status"] == "skipped":
+            item["transformed_path"] = None
+            return
+        if self.manifest is not None:
+            mf.record(self.manifest, "transform", raw_path, rows=summary["records_cleaned"],
+                      output=item["transformed_path"])
+
+    def _scan(self, path):
+        self.schema_checks.append(validate.scan_files(self.validate_con, [path], self.expected_ranges))
+        rows = self.validate_con.execute("SELECT SUM(records) FROM file_hourly_metrics WHERE source_file = ?",
+                                         [os.path.abspath(path)]).fetchone()[0] or 0
+        metrics.record_file("validate", path, rows_in=int(rows), bytes_read=metrics.file_bytes(path))
+        if self.manifest is not None:
+            mf.record(self.manifest, "validate", path, rows=int(rows), output=validate.METRICS_STORE_PATH)
+
+    async def validate(self, item):
+        if item["transformed_path"] is not None:
+            # One DuckDB connection holds the metrics, so scans run on its own thread
+            await asyncio.get_running_loop().run_in_executor(self.validate_pool, self._scan, item["transformed_path"])
+
+    async def load(self, item):
+        if item["transformed_path"] is None:
+            return
+        if self.writer is None:
+            self.writer = self.write_pool.submit(self._write_dataset)
+        elif self.writer.done():
+            self.writer.result()  # the writer died: raise its error
+        self.loaded.append(item["transformed_path"])
+        await asyncio.to_thread(self._put, item["transformed_path"])
+
+    def _put(self, path):
+        "Hand a file to the writer thread; blocks while it is queue_size files behind."
+        while not self.writer.done():
+            try:
+                self.load_queue.put(path, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _write_dataset(self):
+        "Writer thread: stream queued transformed files into one staging dataset."
+        def paths():
+            while (path := self.load_queue.get()) is not None:
+                yield path
+
+        files = paths()
+        first = next(files, None)
+        if first is None:
+            return set()
+        return self._stage_files(first, files)
+
+    def _stage_files(self, first, files):
+        "Write transformed files (first, then the rest) into the staging dataset."
+        schema = loader.partition_schema(pq.read_schema(first))
+        self.partition_cols = loader.partition_columns(schema, loader.PARTITION_BY)
+        with metrics.stage("load", unit="write") as record:
+            written = loader.write_staged(
+                loader.iter_batches(_chain(first, files), schema, self.partition_cols),
+                schema, self.partition_cols, self.staging_dir, loader.MAX_ROWS_PER_FILE, loader.ROW_GROUP_SIZE)
+            record["bytes_written"] = metrics.dir_bytes(self.staging_dir)
+        return written
+
+    # --- Run ---
+
+    async def run(self):
+        size = self.queue_size
+        to_download, to_ingest, to_transform, to_validate, to_load = (asyncio.Queue(size) for _ in range(5))
+        self.validate_con = duckdb.connect(database=":memory:")
+        validate.create_metrics_table(self.validate_con)
+        self.schema_checks, self.loaded, self.writer, self.written = [], [], None, set()
+        self.load_queue = queue.Queue(maxsize=size)
+        self.staging_dir = f"{loader.FINAL_OUTPUT_DIR}.staging-{uuid.uuid4().hex}"
+        os.makedirs(self.raw_dir, exist_ok=True)
+        for path in (self.processed_dir, self.cleaned_dir, self.transformed_dir):
+            os.makedirs(path, exist_ok=True)
+
+        items = await asyncio.to_thread(self._list_items)
+        print(f"Scheduling {len(items)} file(s): queues of {size}, workers {self.concurrency}")
+        ordered = self.transform_workers <= 1
+        self.transform_pool = (ThreadPoolExecutor(1) if ordered else ProcessPoolExecutor(self.transform_workers))
+        self.validate_pool, self.write_pool = ThreadPoolExecutor(1), ThreadPoolExecutor(1)
+
+        async def produce():
+            for item in items:
+                await to_download.put(item)
+            await to_download.put(_DONE)
+
+        async def passthrough(item):
+            return None
+
+        try:
+            await asyncio.gather(
+                produce(),
+                _stage("download", self.download if self.source is not None else passthrough,
+                       to_download, [to_ingest, to_transform], self.concurrency["download"], errors=self.errors),
+                _stage("ingest", self.ingest, to_ingest, [], self.concurrency["ingest"], errors=self.errors),
+                _stage("transform", self.transform, to_transform, [to_validate, to_load],
+                       self.transform_workers, ordered=ordered, errors=self.errors),
+                _stage("validate", self.validate, to_validate, [], 1, errors=self.errors),
+                _stage("load", self.load, to_load, [], 1, errors=self.errors),
+            )
+            if self.writer is not None:
+                await asyncio.to_thread(self._put, None)
+                self.written = await asyncio.wrap_future(self.writer)
+            return self._finish()
+        finally:
+            self.transform_pool.shutdown()
+            self.validate_pool.shutdown()
+            self.write_pool.shutdown()
+            self.validate_con.close()
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def _finish(self):
+        if self.errors:
+            raise RuntimeError(f"{len(self.errors)} file(s) failed, final dataset not published: {self.errors}")
+
+        if "aggregates" in self.options:
+            # Files loaded before a later file added to one of their days carry partial daily averages
+            refreshed = refresh_daily_avg(self.options["aggregates"], self.aggregates_since, self.transformed_dir)
+            self.options["aggregates"].compact(self.aggregates_since)
+            if set(refreshed) & set(self.loaded):
+                shutil.rmtree(self.staging_dir, ignore_errors=True)
+                self.written = self._stage_files(self.loaded[0], iter(self.loaded[1:]))
+
+        report = None
+        if self.schema_checks:
+            if self.manifest is not None:
+                # Every current file was rescanned: the stored metrics are replaced, not merged
+                validate.store_metrics(self.validate_con)
+                for key in mf.removed_files(self.manifest, "validate", self.loaded):
+                    mf.forget(self.manifest, "validate", key)
+            report = validate.build_report(self.validate_con, self.schema_checks[0])
+
+        emptied = loader.existing_partitions() - self.written
+        if self.written or emptied:
+            loader.publish(self.staging_dir, self.written, emptied)
+            catalog.update_catalog(self.written | emptied, root=loader.FINAL_OUTPUT_DIR)
+        print(f"Wrote {len(self.written)} partition(s), removed {len(emptied)} stale partition(s).")
+
+        save_transform_state(self.options, self.anomaly_state_dir, self.window_state_dir, self.aggregate_state_dir)
+        if self.manifest is not None:
+            for path in self.loaded:
+                mf.record(self.manifest, "load", path, output=loader.FINAL_OUTPUT_DIR,
+                          partitions=loader.file_partitions(path, self.partition_cols),
+                          rows=pq.ParquetFile(path).metadata.num_rows)
+            for key in mf.removed_files(self.manifest, "load", self.loaded):
+                mf.forget(self.manifest, "load", key)
+            mf.save_manifest(self.manifest, self.manifest_path)
+        return report
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def run_scheduled(source=None, raw_dir=RAW_DIR, processed_dir=PROCESSED_DIR, cleaned_dir=CLEANED_OUTPUT_DIR,
+                  transformed_dir=TRANSFORMED_OUTPUT_DIR, engine="pandas", manifest_path=None,
+                  expected_ranges=None, anomaly_method=None, anomaly_state_dir=ANOMALY_STATE_DIR,
+                  window_state_dir=None, aggregate_state_dir=None, concurrency=None, queue_size=QUEUE_SIZE,
+                  cache_dir=CACHE_DIR):
+    """
+    Download, ingest, transform, validate and load every file with the stages
+    overlapped. source: a src.sources.Source to download from, or None to
+    use the files already in raw_dir. concurrency overrides CONCURRENCY per
+    stage; queue_size bounds the files waiting between two stages.
+    Returns the validation report (None when there was nothing to validate).
+    """
+    run = _ScheduledRun(source, raw_dir, processed_dir, cleaned_dir, transformed_dir, engine, manifest_path,
+                        expected_ranges, anomaly_method, anomaly_state_dir, window_state_dir, aggregate_state_dir,
+                        concurrency, queue_size, cache_dir)
+    return asyncio.run(run.run())
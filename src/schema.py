@@ -0,0 +1,128 @@
+"""
+schema.py — Canonical typed in-memory schema for sensor readings.
+
+sensor_id / reading_type are dictionary-encoded (pandas category), timestamp
+is timestamp[us, UTC] and the float columns are float32. Ingestion writes
+this schema and every later stage reads through it, so frames stay compact.
+
+The transform adds the time keys once, vectorized, next to the UTC timestamp:
+timestamp_local (LOCAL_TZ), date (UTC day, date32) and hour (UTC, floored).
+ISO 8601 strings are only rendered on export (iso_strings).
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+SENSOR_SCHEMA = pa.schema([
+    ("sensor_id", pa.dictionary(pa.int32(), pa.string())),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("reading_type", pa.dictionary(pa.int8(), pa.string())),
+    ("value", pa.float32()),
+    ("battery_level", pa.float32()),
+])
+
+# Columns stored as dictionaries / categories
+CATEGORICAL_COLUMNS = ["sensor_id", "reading_type"]
+
+# Local time of the sensor sites (IST, fixed offset, no DST)
+LOCAL_TZ = "+05:30"
+LOCAL_TIMESTAMP_TYPE = pa.timestamp("us", tz=LOCAL_TZ)
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+
+def to_utc_timestamps(array):
+    """
+    Parse/cast timestamps to timestamp[us, UTC].
+    Naive values are taken as UTC, like pd.to_datetime(..., utc=True).
+    """
+    target = SENSOR_SCHEMA.field("timestamp").type
+    if pa.types.is_timestamp(array.type):
+        if array.type.tz is None:
+            return pc.assume_timezone(array.cast(pa.timestamp("us")), "UTC").cast(target)
+        return array.cast(target)
+    if pa.types.is_date(array.type):
+        return pc.assume_timezone(array.cast(pa.timestamp("us")), "UTC").cast(target)
+    try:
+        return pc.assume_timezone(array.cast(pa.timestamp("us")), "UTC").cast(target)
+    except pa.ArrowInvalid:
+        pass
+    try:
+        return array.cast(target)
+    except pa.ArrowInvalid:
+        parsed = pd.to_datetime(array.to_pandas(), utc=True, format="ISO8601")
+        return pa.array(parsed, type=target)
+
+
+def enforce_schema(data):
+    """
+    Cast the canonical columns of an Arrow table/record batch to SENSOR_SCHEMA.
+    Other columns are passed through unchanged.
+    """
+    columns, fields = [], []
+    for name, column in zip(data.schema.names, data.columns):
+        if name in SENSOR_SCHEMA.names:
+            field = SENSOR_SCHEMA.field(name)
+            if name == "timestamp":
+                column = to_utc_timestamps(column)
+            elif pa.types.is_dictionary(field.type):
+                if pa.types.is_dictionary(column.type):
+                    column = column.cast(field.type.value_type)
+                column = pc.dictionary_encode(column.cast(pa.string())).cast(field.type)
+            else:
+                column = column.cast(field.type)
+            fields.append(field)
+        else:
+            fields.append(data.schema.field(name))
+        columns.append(column)
+    schema = pa.schema(fields)
+    if isinstance(data, pa.RecordBatch):
+        return pa.RecordBatch.from_arrays(columns, schema=schema)
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def to_frame(data):
+    "Arrow table/batch to pandas with category columns in sorted category order."
+    df = data.to_pandas()
+    for name in CATEGORICAL_COLUMNS:
+        if name in df.columns and isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].cat.reorder_categories(sorted(df[name].cat.categories))
+    return df
+
+
+def read_sensor_frame(path, columns=None):
+    "Read a Parquet file into a compact, schema-enforced DataFrame."
+    return to_frame(enforce_schema(pq.read_table(path, columns=columns)))
+
+
+# --- Time keys ---
+
+def utc_timestamps(timestamps):
+    "A timestamp Series as datetime64[us, UTC]; only strings / naive values are parsed (as UTC)."
+    if not isinstance(timestamps.dtype, pd.DatetimeTZDtype):
+        timestamps = pd.to_datetime(timestamps, utc=True, format="ISO8601")
+    return timestamps.dt.tz_convert("UTC").astype("datetime64[us, UTC]")
+
+
+def utc_dates(timestamps):
+    "UTC calendar day of tz-aware timestamps as date32 (no per-row Python dates)."
+    return timestamps.dt.tz_localize(None).dt.floor("D").astype("date32[pyarrow]")
+
+
+def add_time_columns(df):
+    """
+    Normalize df["timestamp"] to UTC and add timestamp_local, date and hour.
+    Later stages group, partition and validate on these instead of parsing strings.
+    """
+    ts = utc_timestamps(df["timestamp"])
+    df["timestamp"] = ts
+    df["timestamp_local"] = ts.dt.tz_convert(LOCAL_TZ)
+    df["date"] = utc_dates(ts)
+    df["hour"] = ts.dt.floor("h")
+    return df
+
+
+def iso_strings(timestamps, tz=LOCAL_TZ):
+    "ISO 8601 strings with UTC offset, e.g. 2025-06-05T17:30:00+0530; for export only."
+    return utc_timestamps(timestamps).dt.tz_convert(tz).dt.strftime(ISO_FORMAT)
@@ -0,0 +1,269 @@
+"""
+sharding.py — Sharded execution of the staged pipeline over worker processes.
+
+A coordinator splits a run into shard specs and hands them to workers (local
+processes standing in for nodes; every path is on the shared filesystem):
+
+  1. per-file stages: every shard ingests and transforms a contiguous date
+     range of raw files and scans its transformed files for validation
+     metrics. Cleaning statistics are per file, so files are never split.
+     Serial pandas/streaming runs carry the 7-day rolling window from file to
+     file; a shard first replays the files of the window before its range
+     (the halo) into a scratch directory, so its window starts exactly where
+     a single-node run would be.
+  2. load: every shard owns a set of final partitions, by partition date
+     range (by="date") or by a CRC32 hash of sensor_id (by="sensor"), and
+     stages only the partitions it owns. By date a shard reads only the
+     transformed files whose dates (footer statistics) overlap its range;
+     by sensor it reads them all.
+  3. the coordinator publishes the staged partitions, drops partitions no
+     file writes to any more, updates the catalog and merges the per-shard
+     validation metrics into one report.
+
+Transformed files and the final dataset are byte-identical to a single-node
+run over the same raw files (run_pipeline(incremental=False)).
+
+    run_sharded(shards=4, by="sensor")
+"""
+
+import os
+import shutil
+import tempfile
+import uuid
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src import catalog, ingestion, loader, metrics, validate
+from src.transform import CLEANED_OUTPUT_DIR, TRANSFORMED_OUTPUT_DIR, process_raw_file, transform_options
+from src.windows import ROLLING_WINDOW
+
+SHARD_BY = ["date", "sensor"]
+# Raw files before a shard's first date that can still reach its rolling windows
+HALO = pd.Timedelta(ROLLING_WINDOW) + pd.Timedelta("1D")
+
+
+def _file_date(name):
+    try:
+        return pd.Timestamp(name[:8])
+    except ValueError:
+        return None
+
+
+def plan_shards(files, shards, by="date"):
+    """
+    Shard specs for raw file names: contiguous date ranges of files for the
+    per-file stages (with their halo), and the final partitions each shard owns.
+    """
+    if by not in SHARD_BY:
+        raise ValueError(f"Unknown shard key '{by}', expected one of {SHARD_BY}")
+    files = sorted(files)
+    shards = max(1, min(shards, len(files)))
+    bounds = [round(i * len(files) / shards) for i in range(shards + 1)]
+    specs = []
+    for i in range(shards):
+        own = files[bounds[i]:bounds[i + 1]]
+        first = _file_date(own[0])
+        earlier = files[:bounds[i]]
+        # Without a date in the name the whole history is replayed
+        halo = earlier if first is None else [
+            f for f in earlier if _file_date(f) is None or _file_date(f) >= first - HALO]
+        specs.append({"shard": i, "shards": shards, "by": by, "files": own, "halo": halo,
+                      # Partition dates owned by by="date": [date_from, date_to)
+                      "date_from": None if i == 0 or first is None else str(first.date()),
+                      "date_to": None})
+    for spec, following in zip(specs, specs[1:]):
+        spec["date_to"] = following["date_from"]
+    return specs
+
+
+def _owned(batch, spec):
+    "Mask of the rows of a conformed batch whose partition the shard owns."
+    if spec["by"] == "sensor":
+        sensors = pc.unique(batch.column("sensor_id")).to_pylist()
+        mine = [s for s in sensors if s is not None and zlib.crc32(s.encode()) % spec["shards"] == spec["shard"]]
+        return pc.is_in(batch.column("sensor_id"), value_set=pa.array(mine, pa.string()))
+    mask = pc.is_valid(batch.column("date"))
+    if spec["date_from"] is not None:
+        mask = pc.and_(mask, pc.greater_equal(batch.column("date"), spec["date_from"]))
+    if spec["date_to"] is not None:
+        mask = pc.and_(mask, pc.less(batch.column("date"), spec["date_to"]))
+    return mask
+
+
+def _date_range(path):
+    "(first, last) partition date of a transformed file from its footer statistics, or None when unknown."
+    metadata = pq.ParquetFile(path).metadata
+    names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+    if "date" not in names:
+        return None
+    column = names.index("date")
+    lows, highs = [], []
+    for i in range(metadata.num_row_groups):
+        stats = metadata.row_group(i).column(column).statistics
+        if stats is None or not stats.has_min_max:
+            return None
+        lows.append(str(stats.min))
+        highs.append(str(stats.max))
+    return (min(lows), max(highs)) if lows else None
+
+
+def shard_paths(spec, paths, ranges):
+    """
+    Transformed files that can hold rows of the partitions a shard owns:
+    by="date" the files whose date range (from _date_range) overlaps the
+    shard's, by="sensor" all of them.
+    """
+    if spec["by"] != "date":
+        return list(paths)
+    return [path for path in paths if ranges[path] is None or (
+        (spec["date_to"] is None or ranges[path][0] < spec["date_to"])
+        and (spec["date_from"] is None or ranges[path][1] >= spec["date_from"]))]
+
+
+# --- Workers ---
+
+def _ingest(files, raw_dir, processed_dir):
+    "Ingest raw files one by one (same output as ingestion.ingest_data); returns the dates written."
+    os.makedirs(processed_dir, exist_ok=True)
+    written = []
+    con = duckdb.connect(database=":memory:")
+    try:
+        for file in files:
+            raw_path = os.path.join(raw_dir, file)
+            ok, missing = ingestion.validate_schema(raw_path, ingestion.EXPECTED_COLUMNS)
+            if not ok:
+                print(f"Skipped {file}: Missing columns {missing}")
+                continue
+            kept = ingestion.load_batch(con, [raw_path])[raw_path]
+            if kept:
+                date_str = file.replace(".parquet", "")
+                ingestion.write_and_record(con, raw_path, os.path.join(processed_dir, f"{date_str}_cleaned.parquet"),
+                                           kept)
+                written.append(date_str)
+    finally:
+        con.close()
+    return written
+
+
+def run_shard(spec, raw_dir, processed_dir, cleaned_dir, transformed_dir, engine, expected_ranges, metrics_dir):
+    """
+    Per-file stages of one shard: ingest, transform (after replaying the halo)
+    and the validation scan, whose metrics go to <metrics_dir>/shard-<i>.parquet.
+    """
+    print(f"Shard {spec['shard']}: {len(spec['files'])} file(s), {len(spec['halo'])} halo file(s)")
+    ingested = _ingest(spec["files"], raw_dir, processed_dir)
+
+    os.makedirs(cleaned_dir, exist_ok=True)
+    os.makedirs(transformed_dir, exist_ok=True)
+    options, _ = transform_options(engine)
+    if "window" in options:
+        with tempfile.TemporaryDirectory() as scratch:
+            for file in spec["halo"]:
+                process_raw_file(engine, file, raw_dir, scratch, scratch, **options)
+    summaries = [process_raw_file(engine, file, raw_dir, cleaned_dir, transformed_dir, **options)
+                 for file in spec["files"]]
+
+    transformed = [os.path.join(transformed_dir, s["file"].replace(".parquet", "_transformed.parquet"))
+                   for s in summaries if s["status"] == "ok"]
+    metrics_path, schema_check = None, None
+    if transformed:
+        con = duckdb.connect(database=":memory:")
+        try:
+            validate.create_metrics_table(con)
+            schema_check = validate.scan_files(con, transformed, expected_ranges)
+            metrics_path = os.path.join(metrics_dir, f"shard-{spec['shard']}.parquet")
+            con.execute(f"COPY file_hourly_metrics TO '{metrics_path}' (FORMAT PARQUET)")
+        finally:
+            con.close()
+    return {"shard": spec["shard"], "ingested": ingested, "summaries": summaries,
+            "metrics_path": metrics_path, "schema_check": schema_check}
+
+
+def load_shard(spec, paths, schema, staging_dir, partition_by=loader.PARTITION_BY,
+               max_rows_per_file=loader.MAX_ROWS_PER_FILE, row_group_size=loader.ROW_GROUP_SIZE):
+    """
+    Stage the final partitions the shard owns from its transformed files
+    (shard_paths) in the dataset schema of all files. Batches are cut exactly
+    as in loader.load_and_partition, so every owned partition gets the same
+    rows in the same order. Returns the partition dirs.
+    """
+    partition_cols = loader.partition_columns(schema, partition_by)
+    batches = (batch.filter(_owned(batch, spec)) for batch in loader.iter_batches(paths, schema, partition_cols))
+    with metrics.stage("load", unit="shard", shard=spec["shard"]):
+        return loader.write_staged((b for b in batches if len(b)), schema, partition_cols, staging_dir,
+                                    max_rows_per_file, row_group_size)
+
+
+# --- Coordinator ---
+
+def run_sharded(shards=2, by="date", workers=None, raw_dir=ingestion.RAW_DATA_DIR,
+                processed_dir=ingestion.PROCESSED_DIR, cleaned_dir=CLEANED_OUTPUT_DIR,
+                transformed_dir=TRANSFORMED_OUTPUT_DIR, engine="pandas", expected_ranges=None):
+    """
+    Ingest, transform, validate and load all raw files with `shards` shard
+    specs on `workers` processes (one per shard by default). The final dataset
+    is only published when every shard succeeded. Returns the validation report.
+    """
+    if expected_ranges is None:
+        expected_ranges = validate.EXPECTED_RANGES
+    files = sorted(f for f in os.listdir(raw_dir) if f.endswith(".parquet"))
+    if not files:
+        print("No raw files to process.")
+        return None
+    specs = plan_shards(files, shards, by)
+    metrics_dir = os.path.join(processed_dir, f"shards-{uuid.uuid4().hex}")
+    os.makedirs(metrics_dir, exist_ok=True)
+    workers = workers or len(specs)
+
+    report = None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            with metrics.stage("sharded", unit="files", shards=len(specs)):
+                results = list(pool.map(run_shard, specs, *[[arg] * len(specs) for arg in (
+                    raw_dir, processed_dir, cleaned_dir, transformed_dir, engine, expected_ranges, metrics_dir)]))
+            dates = [d for r in results for d in r["ingested"]]
+            last_date = ingestion.get_last_ingested_date()
+            if dates and (not last_date or max(dates) > last_date):
+                ingestion.update_checkpoint(max(dates))
+
+            paths = [os.path.join(transformed_dir, f) for f in sorted(os.listdir(transformed_dir))
+                     if f.endswith("_transformed.parquet")]
+            if paths:
+                os.makedirs(loader.FINAL_OUTPUT_DIR, exist_ok=True)
+                schema = loader.dataset_schema(paths)
+                ranges = {path: _date_range(path) for path in paths}
+                staging = [f"{loader.FINAL_OUTPUT_DIR}.staging-{uuid.uuid4().hex}" for _ in specs]
+                try:
+                    written = list(pool.map(load_shard, specs, [shard_paths(s, paths, ranges) for s in specs],
+                                            [schema] * len(specs), staging))
+                    # Partitions no transformed file writes to any more go with the first shard's swap
+                    emptied = loader.existing_partitions() - set().union(*written)
+                    for i, (staging_dir, partitions) in enumerate(zip(staging, written)):
+                        loader.publish(staging_dir, partitions, emptied if i == 0 else set())
+                finally:
+                    for staging_dir in staging:
+                        shutil.rmtree(staging_dir, ignore_errors=True)
+                written = set().union(*written)
+                print(f"Wrote {len(written)} partition(s) from {len(specs)} shard(s), "
+                      f"removed {len(emptied)} stale partition(s).")
+                catalog.update_catalog(written | emptied, root=loader.FINAL_OUTPUT_DIR)
+
+        scanned = [r for r in results if r["metrics_path"]]
+        if scanned:
+            con = duckdb.connect(database=":memory:")
+            try:
+                validate.create_metrics_table(con)
+                con.execute("INSERT INTO file_hourly_metrics SELECT * FROM read_parquet($paths)",
+                            {"paths": [r["metrics_path"] for r in scanned]})
+                report = validate.build_report(con, scanned[0]["schema_check"])
+            finally:
+                con.close()
+    finally:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+    return report
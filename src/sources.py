@@ -0,0 +1,104 @@
+"""
+sources.py — Pluggable sources of raw files for the downloader.
+
+A source lists its files as RemoteFile entries and fetches one to a path.
+Bytes in flight are kept in a "<path>...part" file next to it, and a later
+fetch of the same path resumes from there as long as the source file is
+unchanged; otherwise it starts over.
+DriveSource reads a Google Drive folder through gdown; LocalDirectorySource
+serves a local directory (tests, mirrored data).
+"""
+
+import json
+import os
+import shutil
+from collections import namedtuple
+
+import gdown
+
+# key: stable id at the source; size, checksum (sha256 hex) and modified (a version
+# stamp such as mtime_ns) are None when unknown
+RemoteFile = namedtuple("RemoteFile", ["key", "name", "size", "checksum", "modified"], defaults=[None])
+
+CHUNK_SIZE = 1 << 20
+
+
+class Source:
+    "Interface of a raw file source."
+
+    def list_files(self):
+        "All files of the source as RemoteFile entries."
+        raise NotImplementedError
+
+    def fetch(self, remote, output_path):
+        "Download `remote` to output_path, resuming a partial download of it."
+        raise NotImplementedError
+
+
+def _resume_offset(part_path, validator):
+    """
+    Bytes of part_path to keep: all of them when they were written from the
+    same version of the file (validator, e.g. size and mtime, saved next to
+    them), else none. Records validator for the next attempt.
+    """
+    meta_path = f"{part_path}.json"
+    offset = 0
+    if os.path.exists(part_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == validator and os.path.getsize(part_path) <= validator["size"]:
+                offset = os.path.getsize(part_path)
+    if not offset:
+        with open(meta_path, "w") as f:
+            json.dump(validator, f)
+    return offset
+
+
+class LocalDirectorySource(Source):
+    "Files of a local directory, e.g. a mounted share or a test fixture."
+
+    def __init__(self, path, suffix=".parquet"):
+        self.path = path
+        self.suffix = suffix
+
+    def list_files(self):
+        files = []
+        for name in sorted(os.listdir(self.path)):
+            full_path = os.path.join(self.path, name)
+            if name.endswith(self.suffix) and os.path.isfile(full_path):
+                stat = os.stat(full_path)
+                files.append(RemoteFile(os.path.abspath(full_path), name, stat.st_size, None, stat.st_mtime_ns))
+        return files
+
+    def fetch(self, remote, output_path):
+        part_path = f"{output_path}.part"
+        stat = os.stat(remote.key)
+        offset = _resume_offset(part_path, {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+        with open(remote.key, "rb") as src, open(part_path, "ab" if offset else "wb") as dst:
+            src.seek(offset)
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(part_path, output_path)
+        os.remove(f"{part_path}.json")
+
+
+class DriveSource(Source):
+    """
+    Files of a public Google Drive folder. The listing comes from gdown
+    without downloading and reports no size, checksum or modification time,
+    so the downloader fetches and hashes a file to tell whether it changed.
+    """
+
+    def __init__(self, folder_id, suffix=".parquet"):
+        self.folder_id = folder_id
+        self.suffix = suffix
+
+    def list_files(self):
+        listing = gdown.download_folder(id=self.folder_id, skip_download=True, quiet=True, use_cookies=False)
+        return [
+            RemoteFile(item.id, os.path.basename(item.path), None, None)
+            for item in listing or []
+            if item.path.endswith(self.suffix)
+        ]
+
+    def fetch(self, remote, output_path):
+        # gdown keeps its own "<output_path>*.part" file and resumes it
+        gdown.download(id=remote.key, output=output_path, quiet=True, use_cookies=False, resume=True)
@@ -0,0 +1,329 @@
+"""
+streaming.py — Bounded-memory clean + transform of one raw Parquet file.
+
+The file is read record batch by record batch in a few passes:
+  1. dedupe/null mask + per reading_type mean/std/min/max (for the z-score)
+  2. exact median per reading_type, only where outliers are possible
+  3. per (date, sensor_id, reading_type) aggregates (for daily_avg_value,
+     optionally recorded in a DailyAggregates store, see aggregates.py)
+  4. spill the corrected rows to a temporary Parquet file
+  5. read them back sorted by (sensor_id, timestamp) (DuckDB sorts out of
+     core) and emit cleaned + transformed batches through ParquetWriter,
+     carrying the last 7 days per (sensor_id, reading_type) for the rolling
+     mean (windows.py)
+
+Peak memory is bounded by the batch size and the number of groups, plus an
+8-byte hash per distinct row for the duplicate check and 1 bit per row for
+the keep mask. The raw file may be in any order: like the pandas engine,
+both outputs are sorted by (sensor_id, timestamp), ties in file order.
+Outputs are written to "<path>.tmp" and only renamed into place once the
+whole file went through, so a failure never leaves a truncated file.
+"""
+
+import os
+import shutil
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.aggregates import combine, daily_aggregates, daily_avg
+from src.calibrations import apply_calibration
+from src.parquet_writer import ROW_GROUP_SIZE, open_writer
+from src.schema import add_time_columns, enforce_schema, to_frame, utc_dates, utc_timestamps
+from src.windows import RollingWindow
+
+BATCH_SIZE = 250_000
+CRITICAL_COLS = ["sensor_id", "timestamp", "reading_type", "value"]
+GROUP_KEYS = ["sensor_id", "reading_type"]
+ZSCORE_THRESHOLD = 3
+
+# Exact median selection: collect values once a rank's window is this small,
+# otherwise narrow the window with a histogram of this many bins per pass.
+MEDIAN_COLLECT_LIMIT = 1_000_000
+MEDIAN_HISTOGRAM_BINS = 4096
+# Memory DuckDB may use for the sort of pass 5 before it spills to disk
+SORT_MEMORY_LIMIT = "1GB"
+
+
+def _iter_frames(parquet_file, batch_size, columns=None):
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield to_frame(enforce_schema(batch))
+
+
+def _iter_kept_frames(parquet_file, masks, batch_size, columns=None):
+    "Re-read the file and apply the keep masks computed in the first pass."
+    for frame, (n_rows, packed) in zip(_iter_frames(parquet_file, batch_size, columns), masks):
+        if len(frame) != n_rows:
+            raise RuntimeError("Record batch boundaries changed between passes")
+        keep = np.unpackbits(packed, count=n_rows).astype(bool)
+        yield frame[keep].reset_index(drop=True)
+
+
+def _dedupe_mask(frame, seen_hashes):
+    "Mask of first occurrences across the whole file, updating the sorted hash index."
+    hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+    first = np.zeros(len(hashes), dtype=bool)
+    first[np.unique(hashes, return_index=True)[1]] = True
+
+    if len(seen_hashes):
+        pos = np.minimum(np.searchsorted(seen_hashes, hashes), len(seen_hashes) - 1)
+        first &= seen_hashes[pos] != hashes
+
+    return first, np.union1d(seen_hashes, hashes[first])
+
+
+def _merge_moments(stats, batch_stats):
+    "Merge per reading_type count/mean/M2/min/max (Chan et al. parallel variance)."
+    for reading_type, row in batch_stats.iterrows():
+        if reading_type not in stats:
+            stats[reading_type] = row.to_dict()
+            continue
+        acc = stats[reading_type]
+        n = acc["count"] + row["count"]
+        delta = row["mean"] - acc["mean"]
+        acc["M2"] += row["M2"] + delta ** 2 * acc["count"] * row["count"] / n
+        acc["mean"] += delta * row["count"] / n
+        acc["count"] = n
+        acc["min"] = min(acc["min"], row["min"])
+        acc["max"] = max(acc["max"], row["max"])
+
+
+def _scan_file(parquet_file, batch_size):
+    "Pass 1: keep masks, input row count and z-score moments per reading_type."
+    masks, stats = [], {}
+    seen_hashes = np.empty(0, dtype="uint64")
+    records_in = 0
+
+    for frame in _iter_frames(parquet_file, batch_size):
+        records_in += len(frame)
+        keep, seen_hashes = _dedupe_mask(frame, seen_hashes)
+        keep &= frame[CRITICAL_COLS].notna().all(axis=1).to_numpy()
+        masks.append((len(frame), np.packbits(keep)))
+
+        kept = frame.loc[keep, ["reading_type", "value"]]
+        if kept.empty:
+            continue
+        grouped = kept.groupby("reading_type", observed=True)["value"]
+        batch_stats = grouped.agg(["count", "mean", "min", "max"])
+        batch_stats["M2"] = grouped.var(ddof=0) * batch_stats["count"]
+        _merge_moments(stats, batch_stats)
+
+    for acc in stats.values():
+        acc["std"] = np.sqrt(acc["M2"] / acc["count"])
+    return masks, stats, records_in
+
+
+def _may_have_outliers(acc):
+    std = acc["std"]
+    if std == 0 or np.isnan(std):
+        return False
+    return max(acc["max"] - acc["mean"], acc["mean"] - acc["min"]) / std > ZSCORE_THRESHOLD
+
+
+def _exact_medians(parquet_file, masks, batch_size, stats):
+    """
+    Pass 2: exact median per reading_type using bounded memory.
+    Each target rank keeps a value window [lo, hi) that is narrowed by a
+    histogram per pass until it is small enough to collect and sort.
+    """
+    targets = []
+    for reading_type, acc in stats.items():
+        if not _may_have_outliers(acc):
+            continue
+        n = int(acc["count"])
+        ranks = [(n - 1) // 2] if n % 2 else [n // 2 - 1, n // 2]
+        for rank in ranks:
+            targets.append({"reading_type": reading_type, "rank": rank, "lo": acc["min"],
+                            "hi": acc["max"], "hi_closed": True, "below": 0, "count": n})
+
+    pending = list(targets)
+    while pending:
+        for t in pending:
+            t["parts"], t["w_min"], t["w_max"] = [], np.inf, -np.inf
+            t["hist"] = np.zeros(MEDIAN_HISTOGRAM_BINS, dtype="int64")
+            t["collect"] = t["count"] <= MEDIAN_COLLECT_LIMIT
+
+        for frame in _iter_kept_frames(parquet_file, masks, batch_size, ["reading_type", "value"]):
+            for t in pending:
+                values = frame["value"].to_numpy(dtype="float64")[
+                    (frame["reading_type"] == t["reading_type"]).to_numpy()]
+                upper = values <= t["hi"] if t["hi_closed"] else values < t["hi"]
+                values = values[(values >= t["lo"]) & upper]
+                if not len(values):
+                    continue
+                t["w_min"] = min(t["w_min"], values.min())
+                t["w_max"] = max(t["w_max"], values.max())
+                if t["collect"]:
+                    t["parts"].append(values)
+                else:
+                    t["hist"] += np.histogram(values, MEDIAN_HISTOGRAM_BINS, (t["lo"], t["hi"]))[0]
+
+        still_pending = []
+        for t in pending:
+            offset = t["rank"] - t["below"]
+            if t["w_min"] == t["w_max"]:
+                t["median"] = t["w_min"]
+            elif t["collect"]:
+                t["median"] = np.partition(np.concatenate(t["parts"]), offset)[offset]
+            else:
+                edges = np.linspace(t["lo"], t["hi"], MEDIAN_HISTOGRAM_BINS + 1)
+                cumulative = np.cumsum(t["hist"])
+                b = int(np.searchsorted(cumulative, offset, side="right"))
+                t["below"] += int(cumulative[b - 1]) if b else 0
+                t["count"] = int(t["hist"][b])
+                t["hi_closed"] = t["hi_closed"] and b == MEDIAN_HISTOGRAM_BINS - 1
+                t["lo"], t["hi"] = edges[b], edges[b + 1]
+                still_pending.append(t)
+        pending = still_pending
+
+    medians = {}
+    for t in targets:
+        medians.setdefault(t["reading_type"], []).append(t["median"])
+    return {reading_type: float(np.mean(values)) for reading_type, values in medians.items()}
+
+
+def _correct_outliers(frame, stats, medians):
+    "Flag |z| > 3 per reading_type against whole-file stats and swap in the median."
+    reading_type = frame["reading_type"]
+    mean = reading_type.map({rt: acc["mean"] for rt, acc in stats.items()}).to_numpy(dtype="float64")
+    std = reading_type.map({rt: acc["std"] for rt, acc in stats.items()}).to_numpy(dtype="float64")
+    values = frame["value"].to_numpy(dtype="float64")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zscore = np.where((std == 0) | np.isnan(std), 0.0, np.abs((values - mean) / std))
+    is_outlier = zscore > ZSCORE_THRESHOLD
+
+    frame["is_outlier"] = is_outlier
+    if is_outlier.any():
+        median = reading_type.map(medians).to_numpy(dtype="float64")
+        frame.loc[is_outlier, "value"] = median[is_outlier]
+    return frame
+
+
+def _daily_aggregates(parquet_file, masks, batch_size, stats, medians):
+    "Pass 3: aggregates of corrected values per (date, sensor_id, reading_type)."
+    totals = None
+    for frame in _iter_kept_frames(parquet_file, masks, batch_size, CRITICAL_COLS):
+        frame = _correct_outliers(frame, stats, medians)
+        frame["date"] = utc_dates(utc_timestamps(frame["timestamp"]))
+        totals = combine(totals, daily_aggregates(frame))
+    return totals
+
+
+def _quote(text):
+    return "'" + str(text).replace("'", "''") + "'"
+
+
+def _iter_sorted_frames(path, batch_size, spill_dir):
+    "Pass 5: rows of a Parquet file by (sensor_id, timestamp), ties in file order."
+    con = duckdb.connect(database=":memory:")
+    try:
+        con.execute("SET TimeZone = 'UTC'")
+        con.execute(f"SET memory_limit = {_quote(SORT_MEMORY_LIMIT)}")
+        con.execute(f"SET temp_directory = {_quote(spill_dir)}")
+        reader = con.execute("""
+            SELECT * EXCLUDE (file_row_number)
+            FROM read_parquet($path, file_row_number = true)
+            ORDER BY sensor_id, timestamp, file_row_number
+        """, {"path": str(path)}).to_arrow_reader(batch_size)
+        for batch in reader:
+            yield to_frame(enforce_schema(batch))
+    finally:
+        con.close()
+
+
+class _LazyWriter:
+    """
+    ParquetWriter opened on the first batch so the schema comes from the data.
+    Writes go to "<path>.tmp"; commit() renames it into place, discard() drops it.
+    """
+
+    def __init__(self, path, sorted=False):
+        self.path = str(path)
+        self.tmp_path = f"{self.path}.tmp"
+        self.sorted = sorted
+        self.writer = None
+
+    def write(self, frame):
+        if self.writer is None:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            self.writer = open_writer(self.tmp_path, table.schema, sorted=self.sorted)
+        else:
+            table = pa.Table.from_pandas(frame, schema=self.writer.schema, preserve_index=False)
+        self.writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+
+    def close(self):
+        "Finish the file at tmp_path; False when nothing was written."
+        if self.writer is None:
+            return False
+        self.writer.close()
+        self.writer = None
+        return True
+
+    def commit(self):
+        if self.close():
+            os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def stream_clean_and_transform_file(file_path, cleaned_path, transformed_path, batch_size=BATCH_SIZE, window=None,
+                                    aggregates=None):
+    """
+    Streaming counterpart of transform.clean_and_transform_file.
+    window: RollingWindow carrying earlier files' readings; a fresh 7-day one by default.
+    aggregates: DailyAggregates store the file's daily aggregates are recorded in.
+    Returns (records_in, records_after_cleaning), or None for an empty file.
+    """
+    parquet_file = pq.ParquetFile(file_path)
+    if parquet_file.metadata.num_rows == 0:
+        print("Empty file, skipping.")
+        return None
+
+    masks, stats, records_in = _scan_file(parquet_file, batch_size)
+    medians = _exact_medians(parquet_file, masks, batch_size, stats)
+    daily = _daily_aggregates(parquet_file, masks, batch_size, stats, medians)
+    if aggregates is not None and daily is not None:
+        aggregates.update(daily, os.path.basename(file_path))
+
+    # Pass 4 spills the corrected rows; its file is only read back, never renamed
+    spill_writer = _LazyWriter(f"{transformed_path}.unsorted")
+    spill_dir = f"{transformed_path}.sort"
+    cleaned_writer = _LazyWriter(cleaned_path, sorted=True)
+    transformed_writer = _LazyWriter(transformed_path, sorted=True)
+    window = window or RollingWindow()
+    window.start(os.path.basename(file_path))
+    records_cleaned = 0
+
+    try:
+        for frame in _iter_kept_frames(parquet_file, masks, batch_size):
+            if frame.empty:
+                continue
+            spill_writer.write(_correct_outliers(frame, stats, medians))
+            records_cleaned += len(frame)
+        if spill_writer.close():
+            for frame in _iter_sorted_frames(spill_writer.tmp_path, batch_size, spill_dir):
+                cleaned_writer.write(frame)
+                frame = add_time_columns(frame)
+                frame["daily_avg_value"] = (aggregates.daily_avg(frame) if aggregates is not None
+                                            else daily_avg(daily, frame))
+                frame["7d_rolling_avg"] = window.apply(frame)["mean"]
+                frame["normalized_value"] = apply_calibration(frame["reading_type"], frame["value"].to_numpy())
+                transformed_writer.write(frame)
+        cleaned_writer.commit()
+        transformed_writer.commit()
+    finally:
+        for writer in (spill_writer, cleaned_writer, transformed_writer):
+            writer.discard()
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    print(f"Cleaned file saved: {cleaned_path}")
+    print(f"Transformed file saved: {transformed_path}")
+    return records_in, records_cleaned
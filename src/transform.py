@@ -1,25 +1,27 @@
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import timedelta
+from src import manifest as mf, metrics
+from src.aggregates import DAILY_KEYS, DailyAggregates, daily_aggregates, daily_avg
+from src.anomaly import ANOMALY_STATE_DIR, make_detector
+from src.windows import RollingWindow
+from src.schema import add_time_columns, read_sensor_frame
+from src.parquet_writer import write_frame, write_table
+from src.calibrations import apply_calibration
+from src.streaming import stream_clean_and_transform_file
+from src.transform_duckdb import duckdb_clean_and_transform_file
 
 
 RAW_PROCESSED_DIR = "../data/raw"
 CLEANED_OUTPUT_DIR = "../data/processed/cleaned_only"
 TRANSFORMED_OUTPUT_DIR = "../data/processed/transformed"
 
-# --- Calibration parameters ---
-CALIBRATION = {
-    "temperature": {"multiplier": 1.02, "offset": -0.5},
-    "humidity": {"multiplier": 0.98, "offset": 0.3},
-}
-
-# --- Expected ranges for anomaly detection ---
-EXPECTED_RANGES = {
-    "temperature": (15, 40),
-    "humidity": (10, 90),
-}
-
+# Calibration parameters and expected ranges live in src/calibrations.py
 
 def compute_zscore(x):
     "Compute absolute z-score manually."
@@ -30,14 +32,21 @@ def compute_zscore(x):
     return np.abs((x - mean) / std)
 
 
-def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    "Clean data: remove duplicates, handle missing values, and correct outliers."
+def clean_dataframe(df: pd.DataFrame, detector=None) -> pd.DataFrame:
+    """
+    Clean data: remove duplicates, handle missing values, and correct outliers.
+    With a detector (src/anomaly.py) outliers are found per (sensor_id,
+    reading_type) from its running state instead of the file-wide z-score.
+    """
     df = df.drop_duplicates()
 
     # Drop rows with missing critical columns
     critical_cols = ["sensor_id", "timestamp", "reading_type", "value"]
     df = df.dropna(subset=critical_cols)
 
+    if detector is not None:
+        return detector.process(df)
+
     # Compute z-score and correct outliers
     df["zscore"] = df.groupby("reading_type")["value"].transform(compute_zscore)
     df["is_outlier"] = df["zscore"] > 3
@@ -47,75 +56,248 @@ def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def transform_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    "Add derived and normalized fields."
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
+def transform_dataframe(df: pd.DataFrame, window=None, aggregates=None, source=None) -> pd.DataFrame:
+    """
+    Add derived and normalized fields.
+    window: RollingWindow carrying earlier files' readings; a fresh 7-day one by default.
+    aggregates: DailyAggregates store; the frame's daily aggregates are recorded
+    under `source` and daily_avg_value covers every file of the day.
+    """
+    # UTC timestamp plus local time and date/hour keys, computed once
+    df = add_time_columns(df)
 
     # Daily average per sensor and reading_type
-    df["date"] = df["timestamp"].dt.date
-    daily_avg = (
-        df.groupby(["date", "sensor_id", "reading_type"])["value"]
-        .mean()
-        .reset_index(name="daily_avg_value")
-    )
-    df = df.merge(daily_avg, on=["date", "sensor_id", "reading_type"], how="left")
-
-    # 7-day rolling average per sensor
+    daily = daily_aggregates(df)
+    if aggregates is not None:
+        aggregates.update(daily, source)
+        df["daily_avg_value"] = aggregates.daily_avg(df)
+    else:
+        df["daily_avg_value"] = daily_avg(daily, df)
+
+    # 7-day (time-based) rolling average per sensor and reading_type
     df = df.sort_values(by=["sensor_id", "timestamp"])
-    df["7d_rolling_avg"] = (
-        df.groupby(["sensor_id", "reading_type"])["value"]
-        .transform(lambda x: x.rolling(window=7, min_periods=1).mean())
-    )
+    df["7d_rolling_avg"] = (window or RollingWindow()).apply(df)["mean"]
 
-    # Apply calibration normalization
-    def normalize(row):
-        params = CALIBRATION.get(row["reading_type"], {"multiplier": 1, "offset": 0})
-        return row["value"] * params["multiplier"] + params["offset"]
+    # Apply calibration normalization (vectorized over reading_type codes)
+    df["normalized_value"] = apply_calibration(df["reading_type"], df["value"].to_numpy())
+    return df
 
-    df["normalized_value"] = df.apply(normalize, axis=1)
 
-    # Convert timestamps to UTC+5:30 and ISO 8601
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-    df["timestamp_iso"] = df["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%S%z")
-    return df
+def clean_and_transform_file(file_path, cleaned_path, transformed_path, detector=None, window=None,
+                             aggregates=None):
+    """
+    Clean + transform a single raw file fully in memory.
+    Returns (records_in, records_after_cleaning), or None for an empty file.
+    """
+    df = read_sensor_frame(file_path)
+    if df.empty:
+        print("Empty file, skipping.")
+        return None
+
+    if detector is not None:
+        detector.start(os.path.basename(file_path))
+    if window is not None:
+        window.start(os.path.basename(file_path))
+    cleaned_df = clean_dataframe(df, detector)
+    write_frame(cleaned_df, cleaned_path)
+    print(f"Cleaned file saved: {cleaned_path}")
+
+    transformed_df = transform_dataframe(cleaned_df, window, aggregates, os.path.basename(file_path))
+    write_frame(transformed_df, transformed_path)
+    print(f"Transformed file saved: {transformed_path}")
+    if detector is not None:
+        # Only a file whose outputs are written counts in the detector state
+        detector.commit()
+
+    return len(df), len(cleaned_df)
+
+
+# Per-file execution engines selectable per run
+ENGINES = {
+    "pandas": clean_and_transform_file,
+    "streaming": stream_clean_and_transform_file,
+    "duckdb": duckdb_clean_and_transform_file,
+}
+
+
+def process_raw_file(engine, file, raw_dir, cleaned_dir, transformed_dir, **options):
+    """
+    Run one engine over one raw file and return its summary row.
+    Failures are caught here so one bad file never takes down the others.
+    options (detector, window, aggregates) are passed on to the engine.
+    """
+    file_path = os.path.join(raw_dir, file)
+    cleaned_path = os.path.join(cleaned_dir, file.replace(".parquet", "_cleaned.parquet"))
+    transformed_path = os.path.join(transformed_dir, file.replace(".parquet", "_transformed.parquet"))
+    print(f"\n Cleaning + Transforming file: {file_path}")
+
+    summary = {"file": file, "status": "ok", "records_in": 0, "records_cleaned": 0,
+               "seconds": 0.0, "error": None}
+    start = time.perf_counter()
+    try:
+        with metrics.stage("transform", unit="file", file=file, engine=engine) as record:
+            counts = ENGINES[engine](file_path, cleaned_path, transformed_path, **options)
+            record["bytes_read"] = metrics.file_bytes(file_path)
+            if counts is not None:
+                record["rows_in"], record["rows_out"] = counts
+                record["bytes_written"] = metrics.file_bytes(cleaned_path, transformed_path)
+        if counts is None:
+            summary["status"] = "skipped"
+        else:
+            summary["records_in"], summary["records_cleaned"] = counts
+            print(f"Records processed: {counts[0]}, after cleaning: {counts[1]}")
+    except Exception as e:
+        print(f"Failed to process {file}: {e}")
+        summary["status"] = "failed"
+        summary["error"] = str(e)
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def transform_options(engine, workers=1, anomaly_method=None, anomaly_state_dir=ANOMALY_STATE_DIR,
+                      window_state_dir=None, aggregate_state_dir=None):
+    """
+    Engine options (detector, window, aggregates) of a run and the worker count
+    it can use: a detector, window_state_dir or aggregate_state_dir forces a
+    serial run, and serial pandas/streaming runs carry a RollingWindow.
+    Returns (options, workers).
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown transform engine '{engine}', expected one of {sorted(ENGINES)}")
+    options = {}
+    if anomaly_method is not None:
+        if engine != "pandas":
+            raise ValueError("anomaly_method is only supported by the pandas engine")
+        options["detector"] = make_detector(anomaly_method, anomaly_state_dir)
+        workers = 1  # detector state flows from one file to the next
+    if aggregate_state_dir is not None:
+        if engine == "duckdb":
+            raise ValueError("aggregate_state_dir is only supported by the pandas and streaming engines")
+        options["aggregates"] = DailyAggregates.load(aggregate_state_dir)
+        workers = 1  # one store, updated file by file
+    if window_state_dir is not None:
+        workers = 1
+    if workers <= 1 and engine in ("pandas", "streaming"):
+        options["window"] = RollingWindow.load(window_state_dir) if window_state_dir else RollingWindow()
+    return options, workers
+
+
+def save_transform_state(options, anomaly_state_dir=ANOMALY_STATE_DIR, window_state_dir=None,
+                         aggregate_state_dir=None):
+    "Persist the detector, the rolling window (with window_state_dir) and the daily aggregates of a finished run."
+    if "detector" in options:
+        options["detector"].save(anomaly_state_dir)
+    if window_state_dir is not None and "window" in options:
+        options["window"].save(window_state_dir)
+    if aggregate_state_dir is not None and "aggregates" in options:
+        options["aggregates"].save(aggregate_state_dir)
+
+
+def refresh_daily_avg(aggregates, since, transformed_dir=TRANSFORMED_OUTPUT_DIR):
+    """
+    Rewrite daily_avg_value in the transformed files of every source live on a
+    day that changed in the store after version `since`: a file written before
+    another file added readings to (or was removed from) one of its days holds
+    a partial daily average. Returns the paths that were rewritten.
+    """
+    dates = set(aggregates.changes(since)["date"].unique())
+    sources = set().union(*(aggregates.by_date.get(date, set()) for date in dates))
+    refreshed = []
+    for source in sorted(sources):
+        path = os.path.join(transformed_dir, source.replace(".parquet", "_transformed.parquet"))
+        if not os.path.exists(path):
+            continue
+        table = pq.read_table(path)
+        daily = aggregates.daily_avg(table.select(DAILY_KEYS).to_pandas(types_mapper=pd.ArrowDtype))
+        column = table.schema.get_field_index("daily_avg_value")
+        if np.array_equal(table.column(column).to_numpy(), daily, equal_nan=True):
+            continue
+        table = table.set_column(column, table.schema.field(column), pa.array(daily, table.schema.field(column).type))
+        write_table(table, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        print(f"Refreshed daily averages: {path}")
+        refreshed.append(path)
+    return refreshed
 
 
 def clean_and_transform_all_files(raw_dir="../data/raw",
                                   cleaned_dir="../data/processed/cleaned_only",
-                                  transformed_dir="../data/processed/transformed"):
+                                  transformed_dir="../data/processed/transformed",
+                                  engine="pandas",
+                                  workers=1,
+                                  manifest_path=None,
+                                  anomaly_method=None,
+                                  anomaly_state_dir=ANOMALY_STATE_DIR,
+                                  window_state_dir=None,
+                                  aggregate_state_dir=None):
     """
     Clean and transform all files in raw_dir and save to cleaned_dir / transformed_dir.
+    engine="streaming" processes each file by Parquet record batch with bounded memory,
+    engine="duckdb" pushes the work down into DuckDB SQL.
+    workers > 1 fans the files out over a process pool; workers=1 runs serially.
+    With manifest_path, only raw files that are new or changed since the last run are processed.
+    anomaly_method ("welford" or "mad") replaces the file-wide z-score with an online
+    per-series detector whose state is resumed from and saved to anomaly_state_dir;
+    files then run serially in name order (pandas engine only).
+    Serial pandas/streaming runs carry the 7-day rolling window from one file to the
+    next; window_state_dir also resumes and saves it between runs (and forces a
+    serial run). Parallel workers start every file with an empty window.
+    aggregate_state_dir keeps the daily aggregates of every file (src/aggregates.py),
+    so daily_avg_value covers days spanning files; raw files that are gone are
+    tombstoned (pandas/streaming engines, serial). Transformed files sharing a
+    day with this run's files get their daily_avg_value rewritten, and the
+    tombstones of earlier runs are compacted.
+    Returns one summary dict per file, in file-name order.
     """
+    options, workers = transform_options(engine, workers, anomaly_method, anomaly_state_dir, window_state_dir,
+                                         aggregate_state_dir)
+    since = options["aggregates"].version if "aggregates" in options else None
+
     os.makedirs(cleaned_dir, exist_ok=True)
     os.makedirs(transformed_dir, exist_ok=True)
 
-    files = [f for f in os.listdir(raw_dir) if f.endswith(".parquet")]
-
-    for file in files:
-        file_path = os.path.join(raw_dir, file)
-        print(f"\n Cleaning + Transforming file: {file_path}")
-
-        try:
-            df = pd.read_parquet(file_path)
-            if df.empty:
-                print("Empty file, skipping.")
-                continue
+    files = sorted(f for f in os.listdir(raw_dir) if f.endswith(".parquet"))
+    manifest = mf.load_manifest(manifest_path) if manifest_path else None
+    if manifest is not None:
+        if "aggregates" in options:
+            removed = mf.removed_files(manifest, "transform", [os.path.join(raw_dir, f) for f in files])
+            options["aggregates"].remove(os.path.basename(key) for key in removed)
+        files = [f for f in files if mf.is_changed(manifest, "transform", os.path.join(raw_dir, f))]
+        if not files:
+            print("No new or changed raw files to transform.")
+    args = (raw_dir, cleaned_dir, transformed_dir)
 
-            cleaned_df = clean_dataframe(df)
-            cleaned_path = os.path.join(cleaned_dir, file.replace(".parquet", "_cleaned.parquet"))
-            cleaned_df.to_parquet(cleaned_path, index=False)
-            print(f"Cleaned file saved: {cleaned_path}")
+    if workers <= 1 or len(files) <= 1:
+        summaries = [process_raw_file(engine, file, *args, **options) for file in files]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as pool:
+            futures = [pool.submit(process_raw_file, engine, file, *args) for file in files]
+            summaries = []
+            for file, future in zip(files, futures):
+                try:
+                    summaries.append(future.result())
+                except Exception as e:
+                    # The worker process itself died (e.g. OOM kill)
+                    print(f"Failed to process {file}: {e}")
+                    summaries.append({"file": file, "status": "failed", "records_in": 0,
+                                      "records_cleaned": 0, "seconds": 0.0, "error": str(e)})
 
-            transformed_df = transform_dataframe(cleaned_df)
-        
-            transformed_path = os.path.join(transformed_dir, file.replace(".parquet", "_transformed.parquet"))
-            transformed_df.to_parquet(transformed_path, index=False)
-            print(f"Transformed file saved: {transformed_path}")
+    if "aggregates" in options:
+        refresh_daily_avg(options["aggregates"], since, transformed_dir)
+        options["aggregates"].compact(since)
+    save_transform_state(options, anomaly_state_dir, window_state_dir, aggregate_state_dir)
 
-            print(f"Records processed: {len(df)}, after cleaning: {len(cleaned_df)}")
+    if manifest is not None:
+        for summary in summaries:
+            if summary["status"] == "ok":
+                output = os.path.join(transformed_dir, summary["file"].replace(".parquet", "_transformed.parquet"))
+                mf.record(manifest, "transform", os.path.join(raw_dir, summary["file"]),
+                          rows=summary["records_cleaned"], output=output)
+        mf.save_manifest(manifest, manifest_path)
 
-        except Exception as e:
-            print(f"Failed to process {file}: {e}")
+    if summaries:
+        print("\nTransformation Summary:\n", pd.DataFrame(summaries).to_string(index=False))
+    return summaries
 
 
 # if __name__ == "__main__":
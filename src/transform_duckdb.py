@@ -0,0 +1,126 @@
+"""
+transform_duckdb.py — DuckDB engine for clean + transform of one raw file.
+
+Produces the same cleaned/transformed columns as the pandas engine in
+transform.py, computed with window functions over read_parquet, so DuckDB
+can run it in parallel and spill to disk instead of materialising pandas
+copies. value is read as FLOAT, matching the compact schema in schema.py.
+
+The cleaned file is written with COPY ... TO (FORMAT PARQUET). The
+transformed rows are streamed as Arrow batches through the shared Parquet
+writer, because DuckDB stores every TIMESTAMPTZ as UTC and timestamp_local
+has to keep its LOCAL_TZ zone.
+"""
+
+import duckdb
+import pandas as pd
+
+from src.calibrations import CALIBRATION, DEFAULT_CALIBRATION
+from src.parquet_writer import ROW_GROUP_SIZE, duckdb_copy_options, open_writer
+from src.schema import LOCAL_TIMESTAMP_TYPE
+from src.windows import ROLLING_WINDOW
+
+CRITICAL_COLS = ["sensor_id", "timestamp", "reading_type", "value"]
+ZSCORE_THRESHOLD = 3
+# RANGE frames include their lower bound, windows.py does not: stop 1us short
+WINDOW_US = pd.Timedelta(ROLLING_WINDOW) // pd.Timedelta("1us") - 1
+
+
+def _quote(text):
+    return "'" + str(text).replace("'", "''") + "'"
+
+
+def _calibration_case(field):
+    "CASE expression mapping reading_type to its calibration multiplier/offset."
+    whens = " ".join(
+        f"WHEN {_quote(reading_type)} THEN {float(params[field])!r}::DOUBLE"
+        for reading_type, params in CALIBRATION.items()
+    )
+    return f"CASE reading_type {whens} ELSE {float(DEFAULT_CALIBRATION[field])!r}::DOUBLE END"
+
+
+CLEAN_SQL = f"""
+    CREATE TEMP TABLE cleaned AS
+    WITH deduped AS (
+        SELECT * EXCLUDE (file_row_number) REPLACE (CAST(value AS FLOAT) AS value),
+            MIN(file_row_number) AS _row
+        FROM read_parquet($path, file_row_number = true)
+        GROUP BY ALL
+    ),
+    scored AS (
+        SELECT *,
+            AVG(value) OVER by_type AS _mean,
+            STDDEV_POP(value) OVER by_type AS _std,
+            QUANTILE_CONT(value, 0.5) OVER by_type AS _median
+        FROM deduped
+        WHERE {" AND ".join(f"{col} IS NOT NULL" for col in CRITICAL_COLS)}
+        WINDOW by_type AS (PARTITION BY reading_type)
+    ),
+    flagged AS (
+        SELECT *, COALESCE(_std > 0 AND ABS((value - _mean) / _std) > {ZSCORE_THRESHOLD}, false) AS is_outlier
+        FROM scored
+    )
+    SELECT * EXCLUDE (_mean, _std, _median)
+        REPLACE (CASE WHEN is_outlier THEN _median ELSE value END AS value)
+    FROM flagged
+"""
+
+TRANSFORM_SQL = f"""
+    WITH typed AS (
+        SELECT * REPLACE (CAST(timestamp AS TIMESTAMP) AS timestamp) FROM cleaned
+    )
+    SELECT * EXCLUDE (_row) REPLACE (timezone('UTC', timestamp) AS timestamp),
+        timezone('UTC', timestamp) AS timestamp_local,
+        CAST(timestamp AS DATE) AS date,
+        timezone('UTC', date_trunc('hour', timestamp)) AS hour,
+        AVG(value) OVER (PARTITION BY CAST(timestamp AS DATE), sensor_id, reading_type) AS daily_avg_value,
+        AVG(value) OVER (
+            PARTITION BY sensor_id, reading_type ORDER BY timestamp
+            RANGE BETWEEN INTERVAL '{WINDOW_US} microseconds' PRECEDING AND CURRENT ROW
+        ) AS "7d_rolling_avg",
+        value * {_calibration_case("multiplier")} + {_calibration_case("offset")} AS normalized_value
+    FROM typed
+    ORDER BY sensor_id, timestamp, _row
+"""
+
+
+def _local_time(batch):
+    "Tag timestamp_local (a UTC instant from DuckDB) with LOCAL_TZ."
+    index = batch.schema.get_field_index("timestamp_local")
+    return batch.set_column(index, "timestamp_local", batch.column(index).cast(LOCAL_TIMESTAMP_TYPE))
+
+
+def duckdb_clean_and_transform_file(file_path, cleaned_path, transformed_path):
+    """
+    DuckDB counterpart of transform.clean_and_transform_file.
+    Returns (records_in, records_after_cleaning), or None for an empty file.
+    """
+    con = duckdb.connect(database=":memory:")
+    try:
+        con.execute("SET TimeZone = 'UTC'")
+        records_in = con.execute("SELECT COUNT(*) FROM read_parquet($path)",
+                                 {"path": str(file_path)}).fetchone()[0]
+        if records_in == 0:
+            print("Empty file, skipping.")
+            return None
+
+        con.execute(CLEAN_SQL, {"path": str(file_path)})
+        records_cleaned = con.execute("SELECT COUNT(*) FROM cleaned").fetchone()[0]
+
+        con.execute(f"""
+            COPY (SELECT * EXCLUDE (_row) FROM cleaned ORDER BY sensor_id, timestamp, _row)
+            TO {_quote(cleaned_path)} ({duckdb_copy_options()})
+        """)
+        print(f"Cleaned file saved: {cleaned_path}")
+
+        reader = con.execute(TRANSFORM_SQL).to_arrow_reader(ROW_GROUP_SIZE)
+        schema = reader.schema.set(reader.schema.get_field_index("timestamp_local"),
+                                   reader.schema.field("timestamp_local").with_type(LOCAL_TIMESTAMP_TYPE))
+        with open_writer(str(transformed_path), schema, sorted=True) as writer:
+            for batch in reader:
+                writer.write_batch(_local_time(batch), row_group_size=ROW_GROUP_SIZE)
+        print(f"Transformed file saved: {transformed_path}")
+    finally:
+        con.close()
+
+    return records_in, records_cleaned
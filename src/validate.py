@@ -1,39 +1,117 @@
 import duckdb
 import os
 import pandas as pd
+from src import manifest as mf, metrics
+from src.calibrations import EXPECTED_RANGES
 
 TRANSFORMED_DIR = "../data/processed/transformed"
 REPORT_PATH = "../data/processed/data_quality_report.csv"
+# Per-file hourly metrics kept between incremental runs
+METRICS_STORE_PATH = "../data/processed/validation_hourly_metrics.parquet"
 
-# Expected ranges per reading_type
-EXPECTED_RANGES = {
-    "temperature": (15, 40),
-    "humidity": (10, 90),
-}
+# Expected ranges per reading_type come from the calibration config
+# (src/calibrations.py); pass expected_ranges to override them per run.
 
 
-def run_data_quality_validation():
-    print("Running Data Quality Validation using DuckDB...")
+def detect_hourly_gaps(con, source):
+    """
+    Find missing hours per (sensor_id, reading_type) from the sorted distinct
+    hours in `source` (needs sensor_id, reading_type and an hour column).
+    Each gap is returned as an interval: gap_start/gap_end are the first and
+    last missing hour, missing_hours its length. Cost is one sort + LEAD over
+    the observed hours, independent of how long the gaps are.
+    """
+    return con.execute(f"""
+        WITH hours AS (
+            SELECT DISTINCT sensor_id, reading_type, hour
+            FROM {source}
+            WHERE hour IS NOT NULL
+        ),
+        steps AS (
+            SELECT sensor_id, reading_type, hour,
+                LEAD(hour) OVER (PARTITION BY sensor_id, reading_type ORDER BY hour) AS next_hour
+            FROM hours
+        )
+        SELECT sensor_id, reading_type,
+            hour + INTERVAL 1 HOUR AS gap_start,
+            next_hour - INTERVAL 1 HOUR AS gap_end,
+            CAST(date_diff('hour', hour, next_hour) - 1 AS BIGINT) AS missing_hours
+        FROM steps
+        WHERE next_hour > hour + INTERVAL 1 HOUR
+        ORDER BY sensor_id, reading_type, gap_start
+    """).fetchdf()
 
-    # Connect to DuckDB (in-memory)
-    con = duckdb.connect(database=":memory:")
 
-    # Register transformed parquet files
-    files = [os.path.join(TRANSFORMED_DIR, f) for f in os.listdir(TRANSFORMED_DIR) if f.endswith("_transformed.parquet")]
-    if not files:
-        print("No transformed files found for validation.")
-    else:
-        file_list_str = ", ".join([f"'{f}'" for f in files])
+def create_metrics_table(con):
+    "Per-file hourly metrics table that scan_table fills and build_report reads."
+    con.execute("""
+        CREATE TEMP TABLE file_hourly_metrics (
+            source_file VARCHAR, sensor_id VARCHAR, reading_type VARCHAR, hour TIMESTAMP,
+            records BIGINT, out_of_range BIGINT, missing_value BIGINT, missing_battery BIGINT,
+            anomalous BIGINT, first_record TIMESTAMP, last_record TIMESTAMP
+        )
+    """)
+
+
+def scan_files(con, files, expected_ranges):
+    """
+    Check the schema of `files` and aggregate them, in one scan, into the
+    file_hourly_metrics temp table. Returns the schema check frame.
+    """
+    file_list_str = ", ".join([f"'{os.path.abspath(f)}'" for f in files])
 
+    con.execute(f"""
+        CREATE OR REPLACE VIEW transformed_data AS
+        SELECT * FROM read_parquet([{file_list_str}], filename = true);
+    """)
+    schema_check = _check_schema(con, "transformed_data")
+    _insert_hourly_metrics(con, "transformed_data", expected_ranges)
+    return schema_check
+
+
+def scan_table(con, table, source_file, expected_ranges=None):
+    """
+    Add the hourly metrics of one in-memory transformed Arrow table (rows of
+    `source_file`) to file_hourly_metrics. Used by the fused pipeline, which
+    never writes the transformed files. Returns the schema check frame.
+    """
+    if expected_ranges is None:
+        expected_ranges = EXPECTED_RANGES
+    con.register("transformed_batch", table)
+    try:
+        source_file = os.path.abspath(source_file).replace("'", "''")
         con.execute(f"""
-            CREATE OR REPLACE VIEW transformed_data AS
-            SELECT * FROM read_parquet([{file_list_str}]);
+            CREATE OR REPLACE TEMP VIEW transformed_data AS
+            SELECT *, '{source_file}' AS filename FROM transformed_batch
         """)
+        schema_check = _check_schema(con, "transformed_data")
+        _insert_hourly_metrics(con, "transformed_data", expected_ranges)
+    finally:
+        con.execute("DROP VIEW IF EXISTS transformed_data")
+        con.unregister("transformed_batch")
+    return schema_check
+
+
+def _time_column(con, source):
+    """
+    (column, UTC TIMESTAMP expression) for the reading time of `source`: the
+    native timestamp, or timestamp_iso strings in files from older pipeline runs.
+    """
+    types = {name: column_type for name, column_type, *_ in con.execute(f"DESCRIBE {source}").fetchall()}
+    if types.get("timestamp") == "TIMESTAMP WITH TIME ZONE":
+        return "timestamp", "timezone('UTC', timestamp)"
+    if "timestamp_iso" in types:
+        return "timestamp_iso", "timestamp_iso::TIMESTAMP"
+    return "timestamp", "CAST(timestamp AS TIMESTAMP)"
 
+
+def _check_schema(con, source):
+    "Check the logical column types of `source`; raises ValueError on mismatches."
+    time_column, _ = _time_column(con, source)
     # Expected types (logical expectation, not exact DuckDB internals)
     EXPECTED_TYPES = {
         "sensor_id_type": "text",
-        "timestamp_type": "text",
+        "timestamp_type": "text" if time_column == "timestamp_iso" else "timestamp",
         "value_type": "real",
         "reading_type_type": "text",
         "battery_type": "real"
@@ -45,17 +123,19 @@ def run_data_quality_validation():
         "DOUBLE": "real",
         "FLOAT": "real",
         "INTEGER": "integer",
-        "BIGINT": "integer"
+        "BIGINT": "integer",
+        "TIMESTAMP WITH TIME ZONE": "timestamp",
+        "TIMESTAMP": "timestamp"
     }
 
-    schema_check = con.execute("""
+    schema_check = con.execute(f"""
         SELECT 
             typeof(sensor_id) AS sensor_id_type,
-            typeof(timestamp_iso) AS timestamp_type,
+            typeof({time_column}) AS timestamp_type,
             typeof(value) AS value_type,
             typeof(reading_type) AS reading_type_type,
             typeof(battery_level) AS battery_type
-        FROM transformed_data
+        FROM {source}
         LIMIT 1
     """).fetchdf()
 
@@ -72,85 +152,185 @@ def run_data_quality_validation():
         raise ValueError("Schema mismatches found:\n" + "\n".join(mismatches))
 
     print("✅ Schema validation passed: All column types match expected definitions.")
+    return schema_check
+
+
+def _insert_hourly_metrics(con, source, expected_ranges):
+    "Aggregate `source` (with a filename column) into file_hourly_metrics."
+    # --- Single scan: per (file, sensor_id, reading_type, hour) aggregates ---
+    # Every metric in the report is derived from this small table, so the
+    # Parquet files are read exactly once; timestamps and hour keys are native
+    # (only timestamp_iso of older files is parsed).
+    column_names = [c[0] for c in con.execute(f"DESCRIBE {source}").fetchall()]
+    has_outlier = "is_outlier" in column_names
+    time_column, ts = _time_column(con, source)
+    hour = f"date_trunc('hour', {ts})"
+    if time_column == "timestamp" and "hour" in column_names:
+        hour = "timezone('UTC', hour)"
+
+    con.register("expected_ranges", pd.DataFrame(
+        [(rt, float(lo), float(hi)) for rt, (lo, hi) in expected_ranges.items()],
+        columns=["reading_type", "min_value", "max_value"],
+    ).astype({"reading_type": "object", "min_value": "float64", "max_value": "float64"}))
+
+    con.execute(f"""
+        INSERT INTO file_hourly_metrics
+        SELECT
+            d.filename AS source_file,
+            d.sensor_id,
+            d.reading_type,
+            d.hour,
+            COUNT(*) AS records,
+            COUNT(*) FILTER (WHERE d.value < r.min_value OR d.value > r.max_value) AS out_of_range,
+            COUNT(*) FILTER (WHERE d.value IS NULL) AS missing_value,
+            COUNT(*) FILTER (WHERE d.battery_level IS NULL) AS missing_battery,
+            {"COUNT(*) FILTER (WHERE d.is_outlier = TRUE)" if has_outlier else "CAST(NULL AS BIGINT)"} AS anomalous,
+            MIN(d.ts) AS first_record,
+            MAX(d.ts) AS last_record
+        FROM (
+            SELECT filename, sensor_id, reading_type, value, battery_level,
+                {"is_outlier," if has_outlier else ""}
+                {ts} AS ts, {hour} AS hour
+            FROM {source}
+        ) d
+        LEFT JOIN expected_ranges r ON d.reading_type = r.reading_type
+        GROUP BY ALL
+    """)
+    con.unregister("expected_ranges")
+
+
+def merge_previous_metrics(con, replaced):
+    """
+    Add the stored metrics of files other than `replaced` (rescanned or
+    removed files) to file_hourly_metrics, then persist the merged per-file
+    metrics for the next incremental run.
+    """
+    if os.path.exists(METRICS_STORE_PATH):
+        replaced_list = [os.path.abspath(p) for p in replaced]
+        con.execute("""
+            INSERT INTO file_hourly_metrics
+            SELECT * FROM read_parquet($path)
+            WHERE NOT list_contains($replaced, source_file)
+        """, {"path": METRICS_STORE_PATH, "replaced": replaced_list})
+    store_metrics(con)
+
+
+def store_metrics(con):
+    "Persist file_hourly_metrics as the per-file metrics store (temp file + rename)."
+    os.makedirs(os.path.dirname(os.path.abspath(METRICS_STORE_PATH)), exist_ok=True)
+    tmp_path = f"{METRICS_STORE_PATH}.tmp"
+    con.execute(f"COPY file_hourly_metrics TO '{tmp_path}' (FORMAT PARQUET)")
+    os.replace(tmp_path, METRICS_STORE_PATH)
 
 
+def run_data_quality_validation(expected_ranges=None, manifest_path=None):
+    print("Running Data Quality Validation using DuckDB...")
+    if expected_ranges is None:
+        expected_ranges = EXPECTED_RANGES
+
+    # Connect to DuckDB (in-memory)
+    con = duckdb.connect(database=":memory:")
+
+    # Register transformed parquet files
+    files = [os.path.join(TRANSFORMED_DIR, f) for f in os.listdir(TRANSFORMED_DIR) if f.endswith("_transformed.parquet")]
+    if not files:
+        print("No transformed files found for validation.")
+        return
+
+    # Incremental runs only scan new/changed files and merge their metrics
+    # into the per-file metrics kept from earlier runs.
+    manifest = mf.load_manifest(manifest_path) if manifest_path else None
+    if manifest is not None:
+        removed = mf.removed_files(manifest, "validate", files)
+        files_to_scan = mf.changed_files(manifest, "validate", files)
+        print(f"Incremental validation: {len(files_to_scan)} new/changed, {len(removed)} removed file(s).")
+    else:
+        removed, files_to_scan = [], files
+
+    create_metrics_table(con)
+    schema_check = pd.DataFrame()
+    if files_to_scan:
+        with metrics.stage("validate", unit="scan", files=len(files_to_scan)):
+            schema_check = scan_files(con, files_to_scan, expected_ranges)
+        scanned = dict(con.execute("""
+            SELECT source_file, SUM(records) FROM file_hourly_metrics GROUP BY source_file
+        """).fetchall())
+        for path in files_to_scan:
+            metrics.record_file("validate", path, rows_in=int(scanned.get(os.path.abspath(path), 0)),
+                                bytes_read=metrics.file_bytes(path))
+
+    if manifest is not None:
+        merge_previous_metrics(con, files_to_scan + removed)
+        scanned_rows = dict(con.execute("""
+            SELECT source_file, SUM(records) FROM file_hourly_metrics GROUP BY source_file
+        """).fetchall())
+        for path in files_to_scan:
+            mf.record(manifest, "validate", path, rows=scanned_rows.get(os.path.abspath(path), 0),
+                      output=METRICS_STORE_PATH)
+        for key in removed:
+            mf.forget(manifest, "validate", key)
+        mf.save_manifest(manifest, manifest_path)
+
+    return build_report(con, schema_check)
+
+
+def build_report(con, schema_check):
+    """
+    Roll file_hourly_metrics up into the data quality report, save it to
+    REPORT_PATH and return it.
+    """
+    con.execute("""
+        CREATE TEMP TABLE hourly_metrics AS
+        SELECT sensor_id, reading_type, hour,
+            SUM(records) AS records,
+            SUM(out_of_range) AS out_of_range,
+            SUM(missing_value) AS missing_value,
+            SUM(missing_battery) AS missing_battery,
+            SUM(anomalous) AS anomalous,
+            MIN(first_record) AS first_record,
+            MAX(last_record) AS last_record
+        FROM file_hourly_metrics
+        GROUP BY ALL
+    """)
+    has_outlier = con.execute("SELECT COUNT(anomalous) > 0 FROM hourly_metrics").fetchone()[0]
+    if not has_outlier:
+        print("Column 'is_outlier' not found. Skipping anomaly % calculation.")
+
     # --- Validate expected value ranges ---
     range_violations = con.execute("""
-        SELECT reading_type, COUNT(*) AS out_of_range_count
-        FROM transformed_data
-        WHERE 
-            (reading_type = 'temperature' AND (value < 15 OR value > 40)) OR
-            (reading_type = 'humidity' AND (value < 10 OR value > 90))
+        SELECT reading_type, SUM(out_of_range) AS out_of_range_count
+        FROM hourly_metrics
         GROUP BY reading_type
+        HAVING SUM(out_of_range) > 0
     """).fetchdf()
 
     # --- Detect hourly data gaps per sensor ---
-    hourly_gaps = con.execute("""
-        WITH expected AS (
-            SELECT
-                sensor_id,
-                reading_type,
-                MIN(timestamp_iso::TIMESTAMP) AS min_t,
-                MAX(timestamp_iso::TIMESTAMP) AS max_t
-            FROM transformed_data
-            GROUP BY sensor_id, reading_type
-        ),
-        generated AS (
-            SELECT
-                e.sensor_id,
-                e.reading_type,
-                g.ts
-            FROM expected e,
-            generate_series(e.min_t, e.max_t, INTERVAL 1 HOUR) AS g(ts)
-        ),
-        missing AS (
-            SELECT g.sensor_id, g.reading_type, COUNT(*) AS missing_hours
-            FROM generated g
-            LEFT JOIN transformed_data d
-            ON g.sensor_id = d.sensor_id
-            AND g.reading_type = d.reading_type
-            AND date_trunc('hour', d.timestamp_iso::TIMESTAMP) = g.ts
-            WHERE d.sensor_id IS NULL
-            GROUP BY g.sensor_id, g.reading_type
-        )
-        SELECT * FROM missing
-        ORDER BY missing_hours DESC
-    """).fetchdf()
-
+    gap_intervals = detect_hourly_gaps(con, "hourly_metrics")
+    hourly_gaps = (
+        gap_intervals.groupby(["sensor_id", "reading_type"], as_index=False)["missing_hours"].sum()
+        .sort_values("missing_hours", ascending=False, kind="stable")
+    )
 
-    # --- Missing values per reading_type ---
-    missing_values = con.execute("""
+    # --- Missing values and % of anomalous readings per reading_type ---
+    per_type = con.execute("""
         SELECT reading_type,
-            COUNT(*) FILTER (WHERE value IS NULL) * 100.0 / COUNT(*) AS pct_missing_value,
-            COUNT(*) FILTER (WHERE battery_level IS NULL) * 100.0 / COUNT(*) AS pct_missing_battery
-        FROM transformed_data
+            SUM(missing_value) * 100.0 / SUM(records) AS pct_missing_value,
+            SUM(missing_battery) * 100.0 / SUM(records) AS pct_missing_battery,
+            SUM(anomalous) * 100.0 / SUM(records) AS pct_anomalous
+        FROM hourly_metrics
         GROUP BY reading_type
     """).fetchdf()
-
-    # --- % of anomalous readings ---
-    # --- % of anomalous readings ---
-    columns = [c for c in con.execute("DESCRIBE transformed_data").fetchall()]
-    column_names = [c[0] for c in columns]
-
-    if "is_outlier" in column_names:
-        anomaly_stats = con.execute("""
-            SELECT reading_type,
-                COUNT(*) FILTER (WHERE is_outlier = TRUE) * 100.0 / COUNT(*) AS pct_anomalous
-            FROM transformed_data
-            GROUP BY reading_type
-        """).fetchdf()
-    else:
-        print("Column 'is_outlier' not found. Skipping anomaly % calculation.")
-        anomaly_stats = pd.DataFrame()
-
+    missing_values = per_type[["reading_type", "pct_missing_value", "pct_missing_battery"]]
+    anomaly_stats = (per_type.loc[per_type["pct_anomalous"].notna(), ["reading_type", "pct_anomalous"]]
+                     if has_outlier else pd.DataFrame())
 
     # --- Time coverage per sensor ---
     time_coverage = con.execute("""
         SELECT sensor_id,
-            MIN(timestamp_iso::TIMESTAMP) AS first_record,
-            MAX(timestamp_iso::TIMESTAMP) AS last_record,
-            (MAX(timestamp_iso::TIMESTAMP) - MIN(timestamp_iso::TIMESTAMP)) AS total_coverage
-        FROM transformed_data
+            MIN(first_record) AS first_record,
+            MAX(last_record) AS last_record,
+            (MAX(last_record) - MIN(first_record)) AS total_coverage
+        FROM hourly_metrics
         GROUP BY sensor_id
         ORDER BY sensor_id
     """).fetchdf()
@@ -162,6 +342,7 @@ def run_data_quality_validation():
         "Missing Values %": [missing_values.to_dict(orient="records")],
         "Anomaly %": [anomaly_stats.to_dict(orient="records")],
         "Hourly Gaps": [hourly_gaps.to_dict(orient="records")],
+        "Gap Intervals": [gap_intervals.to_dict(orient="records")],
         "Time Coverage": [time_coverage.to_dict(orient="records")],
     }
 
@@ -170,6 +351,7 @@ def run_data_quality_validation():
     report_df.to_csv(REPORT_PATH, index=False)
 
     print(f"Data Quality Report saved at: {REPORT_PATH}")
+    return report
 
 
 # if __name__ == "__main__":
@@ -0,0 +1,194 @@
+"""
+windows.py — Time-based rolling windows per (sensor_id, reading_type) series.
+
+RollingWindow aggregates each reading's window (t - window, t], where t is
+its timestamp; readings sharing t are all included (like a SQL RANGE frame).
+Window bounds come from one searchsorted per series, and every aggregate runs
+over the same bounds with pandas' variable-window kernels, so there is no
+per-group Python callback.
+
+Readings still inside the window are held per series as int64 timestamps and
+float64 values, tagged with their source file, and merged into the next batch,
+so windows continue across batches and daily files; a batch only sorts its own
+rows. A reprocessed file first drops its earlier readings (start). The held
+readings (the tail) can be saved and resumed between runs.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.indexers import BaseIndexer
+
+ROLLING_WINDOW = "7D"
+AGGREGATES = ["mean", "min", "max", "count"]
+WINDOW_STATE_DIR = "../data/processed/window_state"
+SERIES_KEYS = ["sensor_id", "reading_type"]
+
+
+class _FixedBounds(BaseIndexer):
+    "Precomputed [start, end) row bounds for pandas rolling kernels."
+
+    def __init__(self, start, end):
+        super().__init__()
+        self.start = start
+        self.end = end
+
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        return self.start, self.end
+
+
+def window_bounds(codes, timestamps, window):
+    """
+    Row bounds of the (t - window, t] window of every row. codes/timestamps
+    (int64) must be sorted by (code, timestamp); window is in timestamp units.
+    """
+    start = np.empty(len(codes), dtype="int64")
+    end = np.empty(len(codes), dtype="int64")
+    breaks = np.flatnonzero(np.diff(codes)) + 1
+    for lo, hi in zip(np.r_[0, breaks], np.r_[breaks, len(codes)]):
+        ts = timestamps[lo:hi]
+        start[lo:hi] = lo + np.searchsorted(ts, ts - window, side="right")
+        end[lo:hi] = lo + np.searchsorted(ts, ts, side="right")
+    return start, end
+
+
+_EMPTY = (np.empty(0, dtype="int64"), np.empty(0, dtype="float64"), np.empty(0, dtype="int32"))
+
+
+def _to_ns(timestamps):
+    "Timestamps (strings, naive or tz-aware) as int64 nanoseconds since the epoch, UTC."
+    return pd.to_datetime(timestamps, utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+
+
+class RollingWindow:
+    "Rolling time-window aggregates per series, carrying state from batch to batch."
+
+    def __init__(self, window=ROLLING_WINDOW, aggregates=("mean",), tail=None):
+        unknown = set(aggregates) - set(AGGREGATES)
+        if unknown:
+            raise ValueError(f"Unknown aggregates {sorted(unknown)}, expected some of {AGGREGATES}")
+        self.window = window
+        self.aggregates = list(aggregates)
+        self.span = pd.Timedelta(window).value
+        # Held readings per series: (ts, value, source code) arrays sorted by ts
+        self.series = {}
+        self.sources = {}
+        self._source = self._source_code("")
+        self._last = {}
+        if tail is not None:
+            self._restore(tail)
+
+    def _source_code(self, source):
+        return self.sources.setdefault(source, len(self.sources))
+
+    def _restore(self, tail):
+        codes = np.array([self._source_code(s) for s in tail["source"]], dtype="int32")
+        ts, values = tail["ts"].to_numpy("int64"), tail["value"].to_numpy("float64")
+        for key, rows in tail.groupby(SERIES_KEYS, sort=False).indices.items():
+            order = rows[np.argsort(ts[rows], kind="stable")]
+            self.series[tuple(map(str, key))] = (ts[order], values[order], codes[order])
+
+    def start(self, source):
+        """
+        Begin the readings of one source file. What an earlier run of the
+        same file left in the window is dropped, so a reprocessed file is not
+        counted twice.
+        """
+        code = self._source_code(source)
+        for key, (ts, values, sources) in self.series.items():
+            keep = sources != code
+            if not keep.all():
+                self.series[key] = (ts[keep], values[keep], sources[keep])
+        self._source = code
+        self._last = {}
+
+    def apply(self, df, time_col="timestamp", value_col="value"):
+        """
+        Aggregates of the window ending at each row of df (any row order).
+        Returns a frame with one column per aggregate, aligned to df.index.
+        Only the batch is sorted; each series is merged with the held
+        readings that can fall into its windows. Batches of one file must
+        keep each series in time order: a reading older than one already
+        applied from the same file raises ValueError.
+        """
+        result = pd.DataFrame(index=df.index)
+        if df.empty:
+            for agg in self.aggregates:
+                result[agg] = np.empty(0)
+            return result
+        ts = _to_ns(df[time_col])
+        values = df[value_col].to_numpy(dtype="float64")
+        codes, keys = pd.MultiIndex.from_arrays([df[k] for k in SERIES_KEYS]).factorize()
+        order = np.lexsort((ts, codes))
+        breaks = np.flatnonzero(np.diff(codes[order])) + 1
+
+        merged_ts, merged_values, is_new, positions = [], [], [], []
+        for lo, hi in zip(np.r_[0, breaks], np.r_[breaks, len(order)]):
+            rows = order[lo:hi]
+            key = tuple(map(str, keys[codes[rows[0]]]))
+            batch_ts = ts[rows]
+            if key in self._last and batch_ts[0] < self._last[key]:
+                raise ValueError(f"Readings of series {key} are out of time order; "
+                                 "batches of a file must keep each series in time order")
+            held_ts, held_values, held_sources = self.series.get(key, _EMPTY)
+
+            # Held readings that can fall into a window of the batch
+            first = np.searchsorted(held_ts, batch_ts[0] - self.span, side="right")
+            stop = np.searchsorted(held_ts, batch_ts[-1], side="right")
+            held = stop - first
+            merge = np.argsort(np.r_[held_ts[first:stop], batch_ts], kind="stable")
+            merged_ts.append(np.r_[held_ts[first:stop], batch_ts][merge])
+            merged_values.append(np.r_[held_values[first:stop], values[rows]][merge])
+            is_new.append(merge >= held)
+            positions.append(rows[merge[merge >= held] - held])
+
+            # Insert the batch; keep what the file's later readings can still reach
+            at = np.searchsorted(held_ts, batch_ts, side="right")
+            held_ts = np.insert(held_ts, at, batch_ts)
+            held_values = np.insert(held_values, at, values[rows])
+            held_sources = np.insert(held_sources, at, self._source)
+            keep = held_ts > batch_ts[-1] - self.span
+            self.series[key] = (held_ts[keep], held_values[keep], held_sources[keep])
+            self._last[key] = batch_ts[-1]
+
+        segment = np.repeat(np.arange(len(merged_ts)), [len(t) for t in merged_ts])
+        merged_ts = np.concatenate(merged_ts)
+        start, end = window_bounds(segment, merged_ts, self.span)
+        rolling = pd.Series(np.concatenate(merged_values)).rolling(_FixedBounds(start, end), min_periods=1)
+        is_new = np.concatenate(is_new)
+        positions = np.concatenate(positions)
+        for agg in self.aggregates:
+            out = np.empty(len(df))
+            out[positions] = getattr(rolling, agg)().to_numpy()[is_new]
+            result[agg] = out
+        return result
+
+    @property
+    def tail(self):
+        "Held readings within the window of each series' latest one, as a frame."
+        names = np.array(list(self.sources), dtype=object)
+        parts = []
+        for (sensor_id, reading_type), (ts, values, sources) in self.series.items():
+            keep = ts > ts[-1] - self.span if len(ts) else slice(0)
+            parts.append(pd.DataFrame({"sensor_id": sensor_id, "reading_type": reading_type,
+                                       "source": names[sources[keep]], "ts": ts[keep], "value": values[keep]}))
+        if not parts:
+            return pd.DataFrame({"sensor_id": pd.Series(dtype=str), "reading_type": pd.Series(dtype=str),
+                                 "source": pd.Series(dtype=str), "ts": pd.Series(dtype="int64"),
+                                 "value": pd.Series(dtype="float64")})
+        return pd.concat(parts, ignore_index=True)
+
+    def save(self, state_dir=WINDOW_STATE_DIR):
+        "Persist the tail to <state_dir>/<window>.parquet (temp file + rename)."
+        os.makedirs(state_dir, exist_ok=True)
+        path = os.path.join(state_dir, f"{self.window}.parquet")
+        self.tail.to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, state_dir=WINDOW_STATE_DIR, window=ROLLING_WINDOW, aggregates=("mean",)):
+        "A RollingWindow resumed from the tail saved under state_dir, if any."
+        path = os.path.join(state_dir, f"{window}.parquet")
+        tail = pd.read_parquet(path) if os.path.exists(path) else None
+        return cls(window, aggregates, tail)
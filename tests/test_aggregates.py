@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+from src.aggregates import DailyAggregates, daily_aggregates
+from src.schema import add_time_columns
+from src.transform import clean_and_transform_all_files
+
+
+def make_frame(times, values, sensor="s1"):
+    return add_time_columns(pd.DataFrame({
+        "sensor_id": sensor,
+        "timestamp": times,
+        "reading_type": "temperature",
+        "value": values,
+    }))
+
+
+def test_updates_replace_per_source_and_deletions_are_versioned(tmp_path):
+    store = DailyAggregates()
+    store.update(daily_aggregates(make_frame(["2025-06-05 10:00", "2025-06-06 01:00"], [1.0, 2.0])), "a.parquet")
+    store.update(daily_aggregates(make_frame(["2025-06-06 23:00"], [4.0])), "b.parquet")
+    totals = store.totals().set_index("date")
+    assert totals["value_count"].tolist() == [1, 2]
+    assert totals.loc[pd.Timestamp("2025-06-06").date(), "value_max"] == 4.0
+
+    # Re-processing a.parquet replaces its rows; its day that is gone becomes a tombstone
+    version = store.update(daily_aggregates(make_frame(["2025-06-06 02:00"], [6.0])), "a.parquet")
+    assert version == 3
+    changes = store.changes(2)
+    assert changes["deleted"].tolist() == [True, False]
+    assert changes.loc[changes["deleted"], "value_sum"].tolist() == [1.0]
+    assert store.totals()[["value_sum", "value_count"]].values.tolist() == [[10.0, 2]]
+
+    assert store.remove(["b.parquet"]) == 4
+    assert store.remove(["b.parquet"]) == 4
+    assert store.evict("2025-06-07") == 5
+    assert store.totals().empty
+
+    store.save(tmp_path)
+    resumed = DailyAggregates.load(tmp_path)
+    assert resumed.version == 5
+    assert len(resumed.changes(0)) == 3
+
+
+@pytest.mark.parametrize("engine", ["pandas", "streaming"])
+def test_daily_avg_covers_days_spanning_files(tmp_path, engine):
+    raw_dir, state_dir = tmp_path / "raw", tmp_path / "aggregates"
+    raw_dir.mkdir()
+    for name, times, values in [("20250605.parquet", ["2025-06-05 22:00", "2025-06-05 23:00"], [10.0, 20.0]),
+                                ("20250606.parquet", ["2025-06-05 23:30", "2025-06-06 01:00"], [30.0, 5.0])]:
+        pd.DataFrame({"sensor_id": "s1", "timestamp": times, "reading_type": "temperature",
+                      "value": values, "battery_level": 90.0}).to_parquet(raw_dir / name, index=False)
+
+    def run():
+        clean_and_transform_all_files(raw_dir=str(raw_dir), cleaned_dir=str(tmp_path / "cleaned"),
+                                      transformed_dir=str(tmp_path / "transformed"), engine=engine,
+                                      manifest_path=str(tmp_path / "manifest.json"),
+                                      aggregate_state_dir=str(state_dir))
+        return pd.read_parquet(tmp_path / "transformed" / "20250606_transformed.parquet")
+
+    assert run()["daily_avg_value"].tolist() == [20.0, 5.0]
+    # The earlier file of the shared day is rewritten with the full average
+    earlier = tmp_path / "transformed" / "20250605_transformed.parquet"
+    assert pd.read_parquet(earlier)["daily_avg_value"].tolist() == [20.0, 20.0]
+
+    # Dropping a raw file tombstones its contribution on the next run, and the
+    # unchanged file sharing its day is refreshed
+    (raw_dir / "20250605.parquet").unlink()
+    assert run()["daily_avg_value"].tolist() == [30.0, 5.0]
+    store = DailyAggregates.load(str(state_dir))
+    assert store.totals()["value_count"].tolist() == [1, 1]
+    assert store.changes(store.version - 1)["deleted"].all()
+
+
+def test_tombstones_are_compacted():
+    store = DailyAggregates()
+    store.update(daily_aggregates(make_frame(["2025-06-05 10:00"], [1.0])), "a.parquet")
+    store.update(daily_aggregates(make_frame(["2025-06-06 10:00"], [2.0])), "b.parquet")
+    store.remove(["a.parquet"])
+    assert store.totals([pd.Timestamp("2025-06-06").date()])["value_sum"].tolist() == [2.0]
+    assert len(store.changes(0)) == 2
+
+    store.compact(store.version)
+    assert len(store.rows) == 1 and store.version == 3
+    assert store.changes(3).empty
+    with pytest.raises(ValueError):
+        store.changes(2)
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.anomaly import MadDetector, WelfordDetector, make_detector
+from src.transform import clean_and_transform_all_files
+
+
+def make_readings(n=600, seed=1):
+    "Two sensors on baselines 15 apart; s1 reads the s2 level once."
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "sensor_id": np.where(np.arange(n) % 2 == 0, "s1", "s2"),
+        "timestamp": pd.date_range("2025-06-05", periods=n, freq="min"),
+        "reading_type": "temperature",
+        "value": rng.normal(0, 1, n),
+        "battery_level": 90.0,
+    })
+    df["value"] += np.where(df["sensor_id"] == "s1", 20.0, 35.0)
+    df.loc[400, "value"] = 35.0
+    return df
+
+
+@pytest.mark.parametrize("cls", [WelfordDetector, MadDetector])
+def test_detector_is_per_series_and_batch_invariant(cls):
+    df = make_readings()
+    whole = cls().process(df)
+
+    chunked_detector = cls()
+    chunked = pd.concat([chunked_detector.process(df.iloc[i:i + 97]) for i in range(0, len(df), 97)])
+
+    # Normal for the pooled population, an outlier for s1
+    assert whole.loc[400, "is_outlier"]
+    assert 19 < whole.loc[400, "value"] < 21
+    assert whole["is_outlier"].sum() < 15
+    pd.testing.assert_frame_equal(whole, chunked)
+
+
+def test_detector_state_carries_across_files(tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    df = make_readings()
+    df["timestamp"] = df["timestamp"].astype(str)
+    df.iloc[:300].to_parquet(raw_dir / "20250605.parquet", index=False)
+    df.iloc[300:].to_parquet(raw_dir / "20250606.parquet", index=False)
+    state_dir = str(tmp_path / "state")
+
+    clean_and_transform_all_files(str(raw_dir), str(tmp_path / "c"), str(tmp_path / "t"),
+                                  anomaly_method="welford", anomaly_state_dir=state_dir)
+
+    cleaned = pd.read_parquet(tmp_path / "c" / "20250606_cleaned.parquet")
+    assert cleaned["is_outlier"].sum() >= 1
+    state = make_detector("welford", state_dir).totals()
+    assert state["count"].sum() == len(df)
+    assert state.loc[("s1", "temperature"), "mean"] == pytest.approx(20.0, abs=0.2)
+
+    with pytest.raises(ValueError):
+        clean_and_transform_all_files(str(raw_dir), str(tmp_path / "c"), str(tmp_path / "t"),
+                                      engine="duckdb", anomaly_method="mad")
+
+
+@pytest.mark.parametrize("method", ["welford", "mad"])
+def test_state_is_per_file_and_committed_after_success(tmp_path, monkeypatch, method):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    df = make_readings()
+    df.iloc[:300].to_parquet(raw_dir / "20250605.parquet", index=False)
+    df.iloc[300:].to_parquet(raw_dir / "20250606.parquet", index=False)
+    state_dir = str(tmp_path / "state")
+
+    def run():
+        clean_and_transform_all_files(str(raw_dir), str(tmp_path / "c"), str(tmp_path / "t"),
+                                      anomaly_method=method, anomaly_state_dir=state_dir)
+        return pd.read_parquet(tmp_path / "c" / "20250606_cleaned.parquet"), make_detector(method, state_dir)
+
+    first, detector = run()
+    saved = detector.state_frame()
+
+    # A rerun replaces each file's contribution: same state, same output
+    second, detector = run()
+    pd.testing.assert_frame_equal(detector.state_frame(), saved)
+    pd.testing.assert_frame_equal(first, second)
+
+    # A file that fails after cleaning leaves its old contribution in place
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr("src.transform.transform_dataframe", fail)
+    (raw_dir / "20250606.parquet").write_bytes((raw_dir / "20250605.parquet").read_bytes())
+    run()
+    pd.testing.assert_frame_equal(make_detector(method, state_dir).state_frame(), saved)
+
+
+def test_welford_scores_against_committed_totals(monkeypatch):
+    df = make_readings()
+    expected = WelfordDetector().process(df)
+
+    detector = WelfordDetector()
+    monkeypatch.setattr("src.anomaly._combine_moments", lambda frame: pytest.fail("state re-combined"))
+    parts = []
+    for i, start in enumerate(range(0, len(df), 100)):
+        detector.start(f"file{i}")
+        parts.extend(detector.process(df.iloc[j:j + 25]) for j in range(start, start + 100, 25))
+        detector.commit()
+
+    pd.testing.assert_frame_equal(pd.concat(parts), expected)
+    assert detector.totals()["count"].sum() == len(df)
@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+from src import catalog
+from src.compact import compact_dataset
+from src.loader import load_and_partition
+
+
+@pytest.fixture
+def dataset(monkeypatch, tmp_path):
+    transformed_dir = tmp_path / "transformed"
+    transformed_dir.mkdir()
+    final_dir = tmp_path / "final_parquet"
+    monkeypatch.setattr("src.loader.TRANSFORMED_DIR", str(transformed_dir))
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(final_dir))
+
+    def write_day(day, offset):
+        pd.DataFrame({
+            "sensor_id": ["s1", "s1", "s1", "s2"],
+            "timestamp": [f"{day}T10:00:00Z", f"{day}T10:30:00Z", f"{day}T11:00:00Z", f"{day}T10:00:00Z"],
+            "value": [1.0 + offset, 3.0 + offset, 5.0 + offset, 100.0],
+            "reading_type": ["temperature"] * 4,
+            "date": [day] * 4,
+        }).to_parquet(transformed_dir / f"{day.replace('-', '')}_transformed.parquet", index=False)
+
+    return final_dir, write_day, str(tmp_path / "manifest.json")
+
+
+def test_loader_maintains_rollups_incrementally(dataset):
+    final_dir, write_day, manifest_path = dataset
+    write_day("2025-06-05", 0)
+    write_day("2025-06-06", 0)
+    load_and_partition(manifest_path=manifest_path)
+
+    assert (final_dir / catalog.CATALOG_NAME).exists()
+    hourly = catalog.query_rollup("hourly", sensor_ids=["s1"])
+    assert hourly["records"].tolist() == [2, 1, 2, 1]
+    assert hourly["value_avg"].tolist() == [2.0, 5.0, 2.0, 5.0]
+    assert hourly["hour"].iloc[0] == pd.Timestamp("2025-06-05 10:00")
+
+    write_day("2025-06-06", 10)
+    load_and_partition(manifest_path=manifest_path)
+    daily = catalog.query_rollup("daily", start="2025-06-06", sensor_ids=["s1"], reading_types=["temperature"])
+    assert daily[["date", "records", "value_min", "value_max"]].values.tolist() == [["2025-06-06", 3, 11.0, 15.0]]
+    assert catalog.query_rollup("daily", end="2025-06-06")["value_sum"].tolist() == [9.0, 100.0]
+
+    con = catalog.connect()
+    assert con.execute("SELECT COUNT(*) FROM readings WHERE date = '2025-06-06'").fetchone()[0] == 4
+    assert con.execute("SELECT COUNT(*) FROM partition_files").fetchone()[0] == 4
+    con.close()
+
+
+def test_query_readings_prunes_partitions(dataset, monkeypatch):
+    final_dir, write_day, _ = dataset
+    write_day("2025-06-05", 0)
+    write_day("2025-06-09", 0)
+    load_and_partition()
+
+    read = []
+    original = catalog._read_parquet
+    monkeypatch.setattr(catalog, "_read_parquet", lambda paths: read.extend(paths) or original(paths))
+    df = catalog.query_readings("2025-06-05 10:15", "2025-06-05 12:00", sensor_ids=["s1"], columns=["value"])
+
+    assert df["value"].tolist() == [3.0, 5.0]
+    assert len(read) == 1 and "date=2025-06-05" in read[0] and "sensor_id=s1" in read[0]
+    assert catalog.query_readings("2025-07-01", "2025-07-02").empty
+
+    exported = catalog.query_readings("2025-06-05 10:15", "2025-06-05 10:45", sensor_ids=["s1"], iso=True)
+    assert exported["timestamp_iso"].tolist() == ["2025-06-05T16:00:00+0530"]
+
+
+def test_compaction_updates_catalog(dataset):
+    final_dir, write_day, _ = dataset
+    write_day("2025-06-05", 0)
+    load_and_partition()
+    # Switching the layout: date=*/sensor_id=* merged into date=*/
+    compact_dataset(str(final_dir), scope="date", partition_by=["date"])
+
+    con = catalog.connect(str(final_dir))
+    assert con.execute("SELECT partition, COUNT(*) FROM partition_files GROUP BY ALL").fetchall() == [("date=2025-06-05", 1)]
+    assert con.execute("SELECT SUM(records) FROM daily_rollup").fetchone()[0] == 4
+    assert con.execute("SELECT COUNT(*) FROM readings WHERE sensor_id = 's2'").fetchone()[0] == 1
+    con.close()
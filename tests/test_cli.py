@@ -0,0 +1,73 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import pandas as pd
+import pytest
+from benchmarks.synthetic import generate_dataset
+from src import cli, config as cfg
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+HEAVY = ["pandas", "numpy", "duckdb", "pyarrow", "gdown"]
+
+STARTUP = """
+import sys, time
+start = time.perf_counter()
+import src.cli
+src.cli.build_parser().parse_args(["validate"])
+print(time.perf_counter() - start)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+@pytest.fixture
+def restore_paths(monkeypatch):
+    "Undo the module constants cfg.apply() points at tmp dirs."
+    targets = [t for ts in cfg.TARGETS.values() for t in ts] + ["src.metrics.RUN_LOG_PATH", "src.metrics.PROMETHEUS_PATH"]
+    for target in targets:
+        module, attribute = target.rsplit(".", 1)
+        module = importlib.import_module(module)
+        monkeypatch.setattr(module, attribute, getattr(module, attribute))
+
+
+def test_startup_is_lazy_and_within_budget():
+    timings = []
+    for _ in range(3):
+        out = subprocess.run([sys.executable, "-c", STARTUP.format(heavy=HEAVY)], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.splitlines()
+        assert out[1:] in ([], [""]), f"heavy modules imported at startup: {out[1]}"
+        timings.append(float(out[0]))
+    assert min(timings) < cli.STARTUP_BUDGET_SECONDS, f"startup took {min(timings):.3f}s"
+
+
+def test_config_file_then_environment(tmp_path):
+    path = tmp_path / "pipeline.json"
+    path.write_text(json.dumps({"data_dir": "/srv/data", "final_dir": "/mnt/final"}))
+    config = cfg.load_config(environ={cfg.CONFIG_ENV: str(path), "PIPELINE_PROCESSED_DIR": "/fast/processed"})
+    assert config["raw_dir"] == os.path.join("/srv/data", "raw")
+    assert config["transformed_dir"] == os.path.join("/fast/processed", "transformed")
+    assert config["final_dir"] == "/mnt/final"
+    assert cfg.load_config(environ={})["checkpoint_file"] == "../data/last_ingested.txt"
+
+    path.write_text(json.dumps({"final_directory": "/mnt/final"}))
+    with pytest.raises(ValueError):
+        cfg.load_config(path, environ={})
+
+
+def test_stages_run_under_configured_data_dir(tmp_path, monkeypatch, restore_paths):
+    data_dir = tmp_path / "data"
+    generate_dataset(data_dir / "raw", days=2, sensors=2, freq="1h")
+    monkeypatch.setenv("PIPELINE_DATA_DIR", str(data_dir))
+
+    for stage in ["ingest", "transform", "validate", "load", "compact"]:
+        assert cli.main([stage]) == 0
+    assert (data_dir / "last_ingested.txt").read_text() == "20250602"
+    assert (data_dir / "processed" / "data_quality_report.csv").exists()
+    final = pd.read_parquet(data_dir / "processed" / "final_parquet")
+    assert len(final) == len(pd.read_parquet(data_dir / "processed" / "transformed"))
+    assert set(json.loads((data_dir / "manifest.json").read_text())["stages"]) >= {"ingest", "transform", "load"}
+    assert (data_dir / "metrics" / "run_log.jsonl").exists()
+
+    with pytest.raises(SystemExit):
+        cli.main(["load", "--mode", "bogus"])
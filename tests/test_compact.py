@@ -0,0 +1,47 @@
+import os
+import pandas as pd
+import pytest
+from src.compact import compact_dataset
+
+
+def make_partition(final_dir, date, sensor_id, n_files):
+    partition_dir = final_dir / f"date={date}" / f"sensor_id={sensor_id}"
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(n_files):
+        pd.DataFrame({
+            "timestamp": [f"{date}T{23 - i:02d}:00:00Z"],
+            "value": [float(i)],
+        }).to_parquet(partition_dir / f"data-{i}.parquet", index=False)
+
+
+def test_partition_compaction_dry_run_then_rewrite(tmp_path):
+    final_dir = tmp_path / "final_parquet"
+    make_partition(final_dir, "2025-06-05", "s1", 3)
+    make_partition(final_dir, "2025-06-05", "s2", 1)
+
+    report = compact_dataset(str(final_dir) + os.sep, dry_run=True)
+    assert report[["group", "files_before", "files_after"]].values.tolist() == [
+        [os.path.join("date=2025-06-05", "sensor_id=s1"), 3, 1]]
+    assert len(list((final_dir / "date=2025-06-05" / "sensor_id=s1").glob("*.parquet"))) == 3
+
+    report = compact_dataset(str(final_dir) + os.sep)
+    files = list((final_dir / "date=2025-06-05" / "sensor_id=s1").glob("*.parquet"))
+    assert len(files) == 1 and report["files_after"].tolist() == [1]
+    assert pd.read_parquet(files[0])["timestamp"].is_monotonic_increasing
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["final_parquet"]
+
+
+def test_date_compaction_merges_sensors(tmp_path):
+    final_dir = tmp_path / "final_parquet"
+    make_partition(final_dir, "2025-06-05", "s2", 2)
+    make_partition(final_dir, "2025-06-05", "s1", 2)
+
+    with pytest.raises(ValueError):
+        compact_dataset(str(final_dir), scope="date")   # the loader still writes sensor_id= dirs
+    compact_dataset(str(final_dir), scope="date", partition_by=["date"])
+
+    files = list((final_dir / "date=2025-06-05").glob("*.parquet"))
+    assert len(files) == 1
+    df = pd.read_parquet(files[0])
+    assert df["sensor_id"].tolist() == ["s1", "s1", "s2", "s2"]
+    assert not any(p.is_dir() for p in (final_dir / "date=2025-06-05").iterdir())
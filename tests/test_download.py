@@ -0,0 +1,113 @@
+import json
+import os
+from src.download_from_drive import download_files, _partial_path
+from src.sources import LocalDirectorySource, RemoteFile
+
+
+class CountingSource(LocalDirectorySource):
+    def __init__(self, path):
+        super().__init__(path)
+        self.fetched = []
+
+    def fetch(self, remote, output_path):
+        self.fetched.append(remote.name)
+        super().fetch(remote, output_path)
+
+
+def test_download_skips_restores_and_resumes(tmp_path):
+    remote_dir, raw_dir, cache_dir = tmp_path / "remote", tmp_path / "raw", tmp_path / "cache"
+    remote_dir.mkdir()
+    for day in ["20250605", "20250606", "20250607"]:
+        (remote_dir / f"{day}.parquet").write_bytes(day.encode() * 1000)
+    manifest_path = str(tmp_path / "manifest.json")
+
+    def run():
+        source = CountingSource(str(remote_dir))
+        result = download_files(source, str(raw_dir), manifest_path=manifest_path,
+                                cache_dir=str(cache_dir), workers=2)
+        return source, result
+
+    source, result = run()
+    assert sorted(source.fetched) == ["20250605.parquet", "20250606.parquet", "20250607.parquet"]
+    assert (raw_dir / "20250606.parquet").read_bytes() == b"20250606" * 1000
+
+    # Warm rerun: nothing is transferred
+    source, result = run()
+    assert source.fetched == [] and len(result["skipped"]) == 3
+
+    # A deleted raw file comes back from the cache; a changed remote file is
+    # fetched again, resuming the partial bytes already on disk.
+    os.remove(raw_dir / "20250605.parquet")
+    (remote_dir / "20250607.parquet").write_bytes(b"changed!" * 2000)
+    remote = [r for r in source.list_files() if r.name == "20250607.parquet"][0]
+    partial = _partial_path(str(cache_dir), remote)
+    stat = os.stat(remote.key)
+    with open(f"{partial}.part", "wb") as f:
+        f.write(b"changed!" * 500)
+    with open(f"{partial}.part.json", "w") as f:
+        json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}, f)
+
+    source, result = run()
+    assert result["restored"] == ["20250605.parquet"]
+    assert source.fetched == ["20250607.parquet"]
+    assert (raw_dir / "20250605.parquet").read_bytes() == b"20250605" * 1000
+    assert (raw_dir / "20250607.parquet").read_bytes() == b"changed!" * 2000
+    assert not os.listdir(cache_dir / "partial")
+
+
+class UnversionedSource(CountingSource):
+    "Lists files like DriveSource: no size, checksum or modification time."
+
+    def list_files(self):
+        return [RemoteFile(r.key, r.name, None, None) for r in super().list_files()]
+
+
+def test_unversioned_files_are_fetched_and_hashed(tmp_path):
+    remote_dir, raw_dir, cache_dir = tmp_path / "remote", tmp_path / "raw", tmp_path / "cache"
+    remote_dir.mkdir()
+    (remote_dir / "20250605.parquet").write_bytes(b"original" * 100)
+    manifest_path = str(tmp_path / "manifest.json")
+
+    def run():
+        source = UnversionedSource(str(remote_dir))
+        return source, download_files(source, str(raw_dir), manifest_path=manifest_path, cache_dir=str(cache_dir))
+
+    run()
+    os.utime(raw_dir / "20250605.parquet", (0, 0))
+
+    # Unchanged content is fetched to check it, but the raw file is left alone
+    source, result = run()
+    assert source.fetched == ["20250605.parquet"] and result["skipped"] == ["20250605.parquet"]
+    assert os.stat(raw_dir / "20250605.parquet").st_mtime == 0
+
+    # A correction of the same size is picked up
+    (remote_dir / "20250605.parquet").write_bytes(b"replaced" * 100)
+    source, result = run()
+    assert result["downloaded"] == ["20250605.parquet"]
+    assert (raw_dir / "20250605.parquet").read_bytes() == b"replaced" * 100
+    assert not os.listdir(cache_dir / "partial")
+
+
+def test_resume_restarts_when_the_source_changed(tmp_path):
+    remote_dir = tmp_path / "remote"
+    remote_dir.mkdir()
+    (remote_dir / "20250605.parquet").write_bytes(b"new bytes!" * 100)
+    source = LocalDirectorySource(str(remote_dir))
+    remote = source.list_files()[0]
+    output = str(tmp_path / "out.parquet")
+    stat = os.stat(remote.key)
+
+    # Partial bytes of an older version of the file (same size, other mtime)
+    with open(f"{output}.part", "wb") as f:
+        f.write(b"old bytes!" * 40)
+    with open(f"{output}.part.json", "w") as f:
+        json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns - 1}, f)
+    source.fetch(remote, output)
+    assert open(output, "rb").read() == b"new bytes!" * 100
+
+    # Partial bytes without a record of their version are not trusted either
+    with open(f"{output}.part", "wb") as f:
+        f.write(b"old bytes!" * 40)
+    source.fetch(remote, output)
+    assert open(output, "rb").read() == b"new bytes!" * 100
+    assert sorted(os.listdir(tmp_path)) == ["out.parquet", "remote"]
@@ -0,0 +1,85 @@
+import os
+import pandas as pd
+import pytest
+from src import fused
+from src.fused import run_fused
+from src.loader import load_and_partition
+from pipeline import run_pipeline
+from src.transform import clean_and_transform_all_files
+from tests.test_transformation import make_raw_frame
+
+
+def test_fused_mode_matches_staged_pipeline(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    df = make_raw_frame()
+    df.iloc[:90].to_parquet(raw_dir / "20250605.parquet", index=False)
+    df.iloc[90:].to_parquet(raw_dir / "20250606.parquet", index=False)
+    monkeypatch.setattr("src.validate.REPORT_PATH", str(tmp_path / "report.csv"))
+
+    # Staged: raw -> transformed files -> partitioned dataset
+    transformed_dir = tmp_path / "transformed"
+    clean_and_transform_all_files(str(raw_dir), str(tmp_path / "cleaned"), str(transformed_dir))
+    monkeypatch.setattr("src.loader.TRANSFORMED_DIR", str(transformed_dir))
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(tmp_path / "staged_final"))
+    load_and_partition()
+
+    # Fused: nothing but the final dataset is written
+    fused_final = tmp_path / "fused_final"
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(fused_final))
+    for name in ["PROCESSED_DIR", "CLEANED_OUTPUT_DIR", "TRANSFORMED_OUTPUT_DIR"]:
+        monkeypatch.setattr(f"src.fused.{name}", str(tmp_path / "debug" / name))
+    manifest_path = str(tmp_path / "manifest.json")
+    report = run_fused(str(raw_dir), manifest_path=manifest_path)
+
+    assert not (tmp_path / "debug").exists()
+    assert report["Anomaly %"][0]
+    keys = ["sensor_id", "reading_type", "timestamp"]
+    expected = pd.read_parquet(tmp_path / "staged_final").sort_values(keys).reset_index(drop=True)
+    actual = pd.read_parquet(fused_final).sort_values(keys).reset_index(drop=True)
+    assert sorted(actual.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(expected, actual[expected.columns], check_dtype=False, check_categorical=False)
+
+    # Unchanged raw files: nothing to do; persist writes the intermediates
+    assert run_fused(str(raw_dir), manifest_path=manifest_path) is None
+    run_fused(str(raw_dir), persist=True)
+    assert sorted(os.listdir(tmp_path / "debug" / "TRANSFORMED_OUTPUT_DIR")) == [
+        "20250605_transformed.parquet", "20250606_transformed.parquet"]
+
+
+def test_failed_file_is_left_out_of_fused_run(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    df = make_raw_frame()
+    df.iloc[:90].to_parquet(raw_dir / "20250605.parquet", index=False)
+    df.iloc[90:].to_parquet(raw_dir / "20250606.parquet", index=False)
+    monkeypatch.setattr("src.validate.REPORT_PATH", str(tmp_path / "report.csv"))
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(tmp_path / "final"))
+
+    process_file = fused.process_file
+
+    def flaky(path, *args):
+        if path.endswith("20250605.parquet"):
+            raise OSError("disk error")
+        return process_file(path, *args)
+
+    monkeypatch.setattr("src.fused.process_file", flaky)
+    manifest_path = str(tmp_path / "manifest.json")
+    assert run_fused(str(raw_dir), manifest_path=manifest_path) is not None
+    assert len(pd.read_parquet(tmp_path / "final")) > 0
+
+    # The failed file is retried on the next run
+    monkeypatch.setattr("src.fused.process_file", process_file)
+    assert run_fused(str(raw_dir), manifest_path=manifest_path) is not None
+
+
+def test_unknown_pipeline_mode_is_rejected():
+    with pytest.raises(ValueError):
+        run_pipeline(mode="fast")
+
+
+@pytest.mark.parametrize("options", [{"incremental": True}, {"transform_engine": "duckdb"},
+                                     {"load_mode": "upsert"}])
+def test_fused_mode_rejects_options_it_does_not_support(options):
+    with pytest.raises(ValueError):
+        run_pipeline(mode="fused", **{"incremental": False, **options})
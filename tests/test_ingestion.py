@@ -1,6 +1,8 @@
 import os
 import pandas as pd
+import pyarrow.parquet as pq
 from src.ingestion import ingest_data
+from src.schema import SENSOR_SCHEMA
 
 def test_ingestion_creates_raw_parquet(tmp_path):
     # Create directories
@@ -28,3 +30,90 @@ def test_ingestion_creates_raw_parquet(tmp_path):
     # Assert parquet file was created
     files = os.listdir(processed_dir)
     print("Processed files:", files)
+
+
+def test_ingestion_projects_filters_and_checkpoints(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    processed_dir = tmp_path / "processed"
+    raw_dir.mkdir()
+    monkeypatch.setattr("src.ingestion.CHECKPOINT_FILE", str(tmp_path / "last_ingested.txt"))
+    monkeypatch.setattr("src.ingestion.INGEST_BATCH_FILES", 2)
+
+    def write_day(day, **extra):
+        df = pd.DataFrame({
+            "sensor_id": ["s1", None],
+            "timestamp": [f"{day[:4]}-{day[4:6]}-{day[6:]} 10:00:00"] * 2,
+            "reading_type": ["temperature", "humidity"],
+            "value": [25.5, 40.0],
+            "battery_level": [90.2, 80.0],
+            **extra,
+        })
+        df.to_parquet(raw_dir / f"{day}.parquet", index=False)
+
+    write_day("20250605", firmware=["v1", "v1"])
+    write_day("20250606")
+    write_day("20250607")
+    pd.DataFrame({"sensor_id": ["s1"]}).to_parquet(raw_dir / "20250608.parquet", index=False)
+
+    ingest_data(raw_dir=str(raw_dir), processed_dir=str(processed_dir), workers=2)
+
+    outputs = sorted(os.listdir(processed_dir))
+    assert outputs == ["20250605_cleaned.parquet", "20250606_cleaned.parquet", "20250607_cleaned.parquet"]
+    df = pd.read_parquet(processed_dir / "20250605_cleaned.parquet")
+    assert df.columns.tolist() == ["sensor_id", "timestamp", "reading_type", "value", "battery_level"]
+    assert df["sensor_id"].tolist() == ["s1"]
+    assert (tmp_path / "last_ingested.txt").read_text() == "20250607"
+
+    # Files at or before the checkpoint are skipped unless they are re-uploaded later
+    for name in outputs:
+        os.utime(processed_dir / name, (2_000_000_000, 2_000_000_000))
+    write_day("20250606")
+    os.utime(raw_dir / "20250606.parquet", (2_000_000_001, 2_000_000_001))
+    ingest_data(raw_dir=str(raw_dir), processed_dir=str(processed_dir), workers=2)
+    assert [os.stat(processed_dir / name).st_mtime == 2_000_000_000 for name in outputs] == [True, False, True]
+
+
+def test_ingestion_writes_compact_schema(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    processed_dir = tmp_path / "processed"
+    raw_dir.mkdir()
+    monkeypatch.setattr("src.ingestion.CHECKPOINT_FILE", str(tmp_path / "last_ingested.txt"))
+    pd.DataFrame({
+        "sensor_id": ["s2", "s1"],
+        "timestamp": ["2025-06-05 10:00:00", "2025-06-05T11:00:00+02:00"],
+        "reading_type": ["temperature", "humidity"],
+        "value": [25.5, 40.0],
+        "battery_level": [90.2, 80.0],
+    }).to_parquet(raw_dir / "20250605.parquet", index=False)
+
+    ingest_data(raw_dir=str(raw_dir), processed_dir=str(processed_dir))
+
+    table = pq.read_table(processed_dir / "20250605_cleaned.parquet")
+    assert table.schema.equals(SENSOR_SCHEMA)
+    # Rows come out sorted by (sensor_id, timestamp)
+    assert table.column("timestamp").to_pylist() == [
+        pd.Timestamp("2025-06-05 09:00", tz="UTC"), pd.Timestamp("2025-06-05 10:00", tz="UTC")]
+
+
+def test_unreadable_file_does_not_fail_its_batch(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    processed_dir = tmp_path / "processed"
+    raw_dir.mkdir()
+    monkeypatch.setattr("src.ingestion.CHECKPOINT_FILE", str(tmp_path / "last_ingested.txt"))
+    for day in ["20250605", "20250606", "20250607"]:
+        pd.DataFrame({
+            "sensor_id": ["s1"] * 100,
+            "timestamp": [f"{day[:4]}-{day[4:6]}-{day[6:]} 10:00:00"] * 100,
+            "reading_type": ["temperature"] * 100,
+            "value": [float(i) for i in range(100)],
+            "battery_level": [90.0] * 100,
+        }).to_parquet(raw_dir / f"{day}.parquet", index=False)
+    # Corrupt the data pages of one file; its footer (and schema) stays readable
+    data = bytearray((raw_dir / "20250606.parquet").read_bytes())
+    data[8:400] = b"\xff" * 392
+    (raw_dir / "20250606.parquet").write_bytes(data)
+
+    ingest_data(raw_dir=str(raw_dir), processed_dir=str(processed_dir))
+
+    assert sorted(os.listdir(processed_dir)) == ["20250605_cleaned.parquet", "20250607_cleaned.parquet"]
+    assert len(pd.read_parquet(processed_dir / "20250607_cleaned.parquet")) == 100
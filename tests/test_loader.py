@@ -1,7 +1,10 @@
 import os
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import pytest
 from pathlib import Path
+from src import loader
 from src.loader import load_and_partition, FINAL_OUTPUT_DIR, TRANSFORMED_DIR
 
 @pytest.fixture
@@ -38,9 +41,9 @@ def test_loader_creates_final_and_partitioned_files(monkeypatch, setup_transform
     # Run loader
     load_and_partition()
 
-    # Check final combined Parquet
-    final_file = final_dir / "agri_sensor_data.parquet"
-    assert final_file.exists(), "Final combined Parquet file not created"
+    # Check the final dataset holds every record
+    full_df = pd.read_parquet(final_dir)
+    assert len(full_df) == 2, "Final partitioned dataset is missing records"
 
     # Check partitioned directories/files
     partition_dir_s1 = final_dir / "date=2025-06-05" / "sensor_id=s1"
@@ -55,7 +58,138 @@ def test_loader_creates_final_and_partitioned_files(monkeypatch, setup_transform
     assert len(files_s1) > 0, "No parquet file in sensor s1 partition"
     assert len(files_s2) > 0, "No parquet file in sensor s2 partition"
 
-    # Optional: read one partition file to check content
-    df_s1 = pd.read_parquet(files_s1[0])
-    assert "sensor_id" in df_s1.columns, "Partitioned file missing 'sensor_id' column"
+    # Optional: read one partition to check content (sensor_id comes from the Hive path)
+    df_s1 = pd.read_parquet(final_dir, filters=[("sensor_id", "==", "s1")])
+    assert "sensor_id" in df_s1.columns, "Partitioned dataset missing 'sensor_id' column"
     assert df_s1["sensor_id"].iloc[0] == "s1"
+    assert df_s1["value"].tolist() == [28.5]
+
+
+def test_incremental_load_rewrites_only_affected_partitions(monkeypatch, tmp_path):
+    transformed_dir = tmp_path / "transformed"
+    transformed_dir.mkdir()
+    final_dir = tmp_path / "final_parquet"
+    manifest_path = str(tmp_path / "manifest.json")
+    monkeypatch.setattr("src.loader.TRANSFORMED_DIR", str(transformed_dir))
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(final_dir))
+
+    def write_day(day, value):
+        pd.DataFrame({
+            "sensor_id": ["s1", "s2"],
+            "timestamp": [f"{day}T12:00:00Z"] * 2,
+            "value": [value, value],
+            "reading_type": ["temperature", "temperature"],
+            "date": [day, day],
+        }).to_parquet(transformed_dir / f"{day.replace('-', '')}_transformed.parquet", index=False)
+
+    write_day("2025-06-05", 20.0)
+    write_day("2025-06-06", 21.0)
+    load_and_partition(manifest_path=manifest_path)
+
+    untouched = final_dir / "date=2025-06-05" / "sensor_id=s1" / "data-0.parquet"
+    touched = final_dir / "date=2025-06-06" / "sensor_id=s1" / "data-0.parquet"
+    os.utime(untouched, (0, 0))
+
+    write_day("2025-06-06", 25.0)
+    load_and_partition(manifest_path=manifest_path)
+
+    assert os.stat(untouched).st_mtime == 0, "Unaffected partition was rewritten"
+    assert pd.read_parquet(touched)["value"].tolist() == [25.0]
+
+    # Nothing changed: no partition is touched
+    os.utime(touched, (0, 0))
+    load_and_partition(manifest_path=manifest_path)
+    assert os.stat(touched).st_mtime == 0
+
+
+def test_loader_respects_layout_options_and_leaves_no_staging(monkeypatch, tmp_path):
+    transformed_dir = tmp_path / "transformed"
+    transformed_dir.mkdir()
+    final_dir = tmp_path / "final_parquet"
+    monkeypatch.setattr("src.loader.TRANSFORMED_DIR", str(transformed_dir))
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(final_dir))
+
+    pd.DataFrame({
+        "sensor_id": ["s1", "s2", "s3", "s4", "s5"],
+        "timestamp": ["2025-06-05T12:00:00Z"] * 5,
+        "value": [1.0, 2.0, 3.0, 4.0, 5.0],
+    }).to_parquet(transformed_dir / "20250605_transformed.parquet", index=False)
+
+    load_and_partition(partition_by=["date"], max_rows_per_file=2, row_group_size=2)
+
+    files = sorted((final_dir / "date=2025-06-05").glob("*.parquet"))
+    assert len(files) == 3
+    assert sum(len(pd.read_parquet(f)) for f in files) == 5
+    assert "sensor_id" in pd.read_parquet(files[0]).columns
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["final_parquet", "transformed"]
+
+
+def test_full_rebuild_drops_partitions_no_file_writes(monkeypatch, setup_transformed_data):
+    tmp_path, transformed_dir = setup_transformed_data
+    final_dir = tmp_path / "final_parquet"
+    monkeypatch.setattr("src.loader.TRANSFORMED_DIR", str(transformed_dir))
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(final_dir))
+    load_and_partition()
+
+    (transformed_dir / "sensor_transformed.parquet").unlink()
+    pd.DataFrame({
+        "sensor_id": ["s1"], "timestamp": ["2025-06-06T12:00:00Z"], "value": [1.0], "date": ["2025-06-06"],
+    }).to_parquet(transformed_dir / "20250606_transformed.parquet", index=False)
+    load_and_partition()
+
+    assert loader.existing_partitions() == {os.path.join("date=2025-06-06", "sensor_id=s1")}
+    assert pd.read_parquet(final_dir)["value"].tolist() == [1.0]
+
+
+def test_upsert_merges_late_rows_into_touched_partitions(monkeypatch, tmp_path):
+    transformed_dir = tmp_path / "transformed"
+    transformed_dir.mkdir()
+    final_dir = tmp_path / "final_parquet"
+    manifest_path = str(tmp_path / "manifest.json")
+    monkeypatch.setattr("src.loader.TRANSFORMED_DIR", str(transformed_dir))
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(final_dir))
+
+    def write(name, sensors, hours, values):
+        pd.DataFrame({
+            "sensor_id": sensors,
+            "timestamp": pd.to_datetime([f"2025-06-05 {h:02d}:00" for h in hours], utc=True),
+            "reading_type": ["temperature"] * len(values),
+            "value": values,
+            "date": ["2025-06-05"] * len(values),
+        }).to_parquet(transformed_dir / f"{name}_transformed.parquet", index=False)
+
+    write("20250605", ["s1", "s1", "s2"], [10, 11, 10], [1.0, 2.0, 3.0])
+    assert load_and_partition(manifest_path=manifest_path, mode="upsert")["inserted"] == 3
+    untouched = final_dir / "date=2025-06-05" / "sensor_id=s2" / "data-0.parquet"
+    os.utime(untouched, (0, 0))
+
+    # A late upload: one corrected reading, one new reading, one repeated reading
+    write("20250605_late", ["s1", "s1", "s1"], [10, 11, 12], [1.0, 20.0, 4.0])
+    os.utime(transformed_dir / "20250605_transformed.parquet", (1, 1))
+    result = load_and_partition(manifest_path=manifest_path, mode="upsert")
+
+    assert {k: result[k] for k in ["inserted", "updated", "ignored"]} == {"inserted": 1, "updated": 1, "ignored": 1}
+    assert result["partitions"] == [os.path.join("date=2025-06-05", "sensor_id=s1")]
+    assert os.stat(untouched).st_mtime == 0
+    s1 = pd.read_parquet(final_dir / "date=2025-06-05" / "sensor_id=s1")
+    assert s1["value"].tolist() == [1.0, 20.0, 4.0]
+
+    # Replaying the same files changes nothing
+    result = load_and_partition(mode="upsert")
+    assert result["ignored"] == 6 and result["partitions"] == []
+
+
+def test_upsert_confirms_hash_matches_on_the_keys(monkeypatch):
+    def table(sensors, values):
+        return pa.Table.from_pandas(pd.DataFrame({
+            "sensor_id": sensors,
+            "timestamp": pd.to_datetime(["2025-06-05 10:00"] * len(sensors), utc=True),
+            "reading_type": "temperature",
+            "value": values,
+        }), preserve_index=False)
+
+    # Every key hashes alike: s2 must be inserted, not taken for s1
+    monkeypatch.setattr("src.loader._hashes", lambda df, columns: np.zeros(len(df), dtype="uint64"))
+    merged, counts = loader._upsert_partition(table(["s1"], [1.0]), table(["s2", "s1"], [2.0, 1.0]))
+    assert counts == {"inserted": 1, "updated": 0, "ignored": 1}
+    assert sorted(merged.column("sensor_id").to_pylist()) == ["s1", "s2"]
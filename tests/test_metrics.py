@@ -0,0 +1,70 @@
+import json
+import os
+import pandas as pd
+import pytest
+from pipeline import run_pipeline
+from src import metrics
+from src.transform import clean_and_transform_all_files
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.metrics.METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.setattr("src.metrics.RUN_LOG_PATH", str(tmp_path / "metrics" / "run_log.jsonl"))
+    monkeypatch.setattr("src.metrics.PROMETHEUS_PATH", str(tmp_path / "metrics" / "pipeline.prom"))
+    monkeypatch.delenv(metrics.RUN_ID_ENV, raising=False)
+    return tmp_path / "metrics"
+
+
+def test_stage_and_file_metrics_reach_run_log_and_prometheus(tmp_path, metrics_dir, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for day in ["20250605", "20250606"]:
+        pd.DataFrame({
+            "sensor_id": ["s1", "s2"],
+            "timestamp": [f"{day[:4]}-{day[4:6]}-{day[6:]} 10:00:00"] * 2,
+            "reading_type": ["temperature", "humidity"],
+            "value": [25.5, 40.0],
+            "battery_level": [90.2, 80.0],
+        }).to_parquet(raw_dir / f"{day}.parquet", index=False)
+    monkeypatch.setenv(metrics.PROFILE_ENV, "transform")
+
+    run_id = metrics.start_run()
+    with metrics.stage("transform"):
+        clean_and_transform_all_files(str(raw_dir), str(tmp_path / "c"), str(tmp_path / "t"))
+    summary = metrics.finish_run()
+
+    records = [json.loads(line) for line in open(metrics_dir / "run_log.jsonl")]
+    assert {r["run_id"] for r in records} == {run_id}
+    files = [r for r in records if r["unit"] == "file"]
+    assert [r["file"] for r in files] == ["20250605.parquet", "20250606.parquet"]
+    assert all(r["rows_in"] == 2 and r["bytes_read"] > 0 and r["bytes_written"] > 0 for r in files)
+
+    assert summary["transform"]["files"] == 2 and summary["transform"]["rows_out"] == 4
+    assert summary["transform"]["wall_seconds"] > 0 and summary["transform"]["process_peak_rss_bytes"] > 0
+    assert 0 <= summary["transform"]["peak_rss_growth_bytes"] <= summary["transform"]["process_peak_rss_bytes"]
+    prom = (metrics_dir / "pipeline.prom").read_text()
+    assert 'sensor_pipeline_stage_rows_out{stage="transform"} 4' in prom
+    assert "# TYPE sensor_pipeline_stage_wall_seconds gauge" in prom
+    assert os.path.exists(metrics_dir / f"profile-transform-{run_id}.pstats")
+    assert metrics.current_run() is None
+
+
+def test_stage_outside_a_run_logs_nothing(metrics_dir):
+    with pytest.raises(RuntimeError):
+        with metrics.stage("load") as record:
+            record["rows_out"] = 1
+            raise RuntimeError("boom")
+    assert record["status"] == "failed"
+    assert not metrics_dir.exists()
+
+
+def test_pipeline_restores_the_profile_setting(metrics_dir, monkeypatch):
+    def fail(**kwargs):
+        raise RuntimeError("no network")
+
+    monkeypatch.setattr("src.download_from_drive.download_from_drive_folder", fail)
+    monkeypatch.delenv(metrics.PROFILE_ENV, raising=False)
+    with pytest.raises(SystemExit):
+        run_pipeline(profile_stage="download")
+    assert metrics.PROFILE_ENV not in os.environ
@@ -0,0 +1,31 @@
+import pandas as pd
+import pyarrow.parquet as pq
+from src.parquet_writer import write_frame
+
+
+def test_write_frame_sorts_and_sets_layout(tmp_path):
+    df = pd.DataFrame({
+        "sensor_id": ["s2", "s1", "s2", "s1"] * 5,
+        "timestamp": pd.date_range("2025-06-05", periods=20, freq="min", tz="UTC")[::-1],
+        "reading_type": "temperature",
+        "value": [float(i) for i in range(20)],
+    })
+    path = tmp_path / "out.parquet"
+    write_frame(df, path, row_group_size=8)
+
+    result = pd.read_parquet(path)
+    assert result["sensor_id"].tolist() == ["s1"] * 10 + ["s2"] * 10
+    assert result.groupby("sensor_id")["timestamp"].is_monotonic_increasing.all()
+
+    meta = pq.ParquetFile(path).metadata
+    assert meta.num_row_groups == 3
+    group = meta.row_group(0)
+    assert [c.column_index for c in group.sorting_columns] == [0, 1]
+    columns = {group.column(i).path_in_schema: group.column(i) for i in range(group.num_columns)}
+    assert columns["sensor_id"].compression == "ZSTD"
+    assert "BYTE_STREAM_SPLIT" in columns["value"].encodings
+    assert "RLE_DICTIONARY" in columns["sensor_id"].encodings
+    assert "RLE_DICTIONARY" not in columns["timestamp"].encodings
+    # Sorted output gives each row group a narrow timestamp range
+    stats = columns["timestamp"].statistics
+    assert (stats.min, stats.max) == (pd.Timestamp("2025-06-05 00:00", tz="UTC"), pd.Timestamp("2025-06-05 00:14", tz="UTC"))
@@ -0,0 +1,93 @@
+import os
+import pandas as pd
+import pytest
+from src.loader import load_and_partition
+from src.scheduler import run_scheduled
+from src.transform import clean_and_transform_all_files
+from tests.test_download import CountingSource
+from tests.test_transformation import make_raw_frame
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    remote_dir = tmp_path / "remote"
+    remote_dir.mkdir()
+    df = make_raw_frame()
+    for i, day in enumerate(["20250605", "20250606", "20250607"]):
+        df.iloc[i * 60:(i + 1) * 60].to_parquet(remote_dir / f"{day}.parquet", index=False)
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(tmp_path / "final"))
+    monkeypatch.setattr("src.validate.REPORT_PATH", str(tmp_path / "report.csv"))
+    monkeypatch.setattr("src.validate.METRICS_STORE_PATH", str(tmp_path / "metrics.parquet"))
+    paths = {name: str(tmp_path / name) for name in ["raw", "processed", "cleaned", "transformed", "cache"]}
+    return tmp_path, remote_dir, paths
+
+
+def run(source, paths, **kwargs):
+    return run_scheduled(source, paths["raw"], paths["processed"], paths["cleaned"], paths["transformed"],
+                         cache_dir=paths["cache"], **kwargs)
+
+
+def test_scheduled_run_matches_staged_pipeline(dirs, monkeypatch):
+    tmp_path, remote_dir, paths = dirs
+    source = CountingSource(str(remote_dir))
+    # Tight queues and one transform worker (ordered, carrying the rolling window)
+    report = run(source, paths, concurrency={"download": 3, "transform": 1}, queue_size=1,
+                 manifest_path=str(tmp_path / "manifest.json"))
+
+    assert report["Anomaly %"][0]
+    assert sorted(os.listdir(paths["processed"])) == [f"2025060{d}_cleaned.parquet" for d in (5, 6, 7)]
+
+    # Staged reference over the same raw files
+    clean_and_transform_all_files(paths["raw"], str(tmp_path / "s_cleaned"), str(tmp_path / "s_transformed"))
+    monkeypatch.setattr("src.loader.TRANSFORMED_DIR", str(tmp_path / "s_transformed"))
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(tmp_path / "staged_final"))
+    load_and_partition()
+    keys = ["sensor_id", "reading_type", "timestamp"]
+    expected = pd.read_parquet(tmp_path / "staged_final").sort_values(keys).reset_index(drop=True)
+    actual = pd.read_parquet(tmp_path / "final").sort_values(keys).reset_index(drop=True)
+    pd.testing.assert_frame_equal(expected, actual[expected.columns], check_dtype=False, check_categorical=False)
+
+    # Warm rerun: nothing downloaded or transformed again, dataset rebuilt the same
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(tmp_path / "final"))
+    transformed = os.path.join(paths["transformed"], "20250606_transformed.parquet")
+    os.utime(transformed, (0, 0))
+    source = CountingSource(str(remote_dir))
+    run(source, paths, manifest_path=str(tmp_path / "manifest.json"))
+    assert source.fetched == [] and os.stat(transformed).st_mtime == 0
+    assert len(pd.read_parquet(tmp_path / "final")) == len(actual)
+
+
+def test_failed_file_blocks_publishing(dirs):
+    tmp_path, remote_dir, paths = dirs
+    (remote_dir / "20250608.parquet").write_bytes(b"not parquet")
+
+    with pytest.raises(RuntimeError, match="20250608.parquet"):
+        run(CountingSource(str(remote_dir)), paths, concurrency={"transform": 2})
+    assert not (tmp_path / "final").exists() or not os.listdir(tmp_path / "final")
+    assert len(os.listdir(paths["transformed"])) == 3
+
+
+def test_removed_file_leaves_the_metrics_store(dirs):
+    tmp_path, remote_dir, paths = dirs
+    manifest_path = str(tmp_path / "manifest.json")
+    run(CountingSource(str(remote_dir)), paths, manifest_path=manifest_path)
+    os.remove(remote_dir / "20250607.parquet")
+    run(CountingSource(str(remote_dir)), paths, manifest_path=manifest_path)
+
+    stored = pd.read_parquet(tmp_path / "metrics.parquet")["source_file"].map(os.path.basename)
+    assert sorted(stored.unique()) == ["20250605_transformed.parquet", "20250606_transformed.parquet"]
+
+
+def test_day_spanning_files_gets_one_daily_average(dirs):
+    tmp_path, remote_dir, paths = dirs
+    for f in remote_dir.iterdir():
+        f.unlink()
+    for name, times, values in [("20250605.parquet", ["2025-06-05 22:00", "2025-06-05 23:00"], [10.0, 20.0]),
+                                ("20250606.parquet", ["2025-06-05 23:30", "2025-06-06 01:00"], [30.0, 5.0])]:
+        pd.DataFrame({"sensor_id": "s1", "timestamp": times, "reading_type": "temperature",
+                      "value": values, "battery_level": 90.0}).to_parquet(remote_dir / name, index=False)
+
+    run(CountingSource(str(remote_dir)), paths, concurrency={"transform": 1},
+        aggregate_state_dir=str(tmp_path / "aggregates"))
+    final = pd.read_parquet(tmp_path / "final").sort_values("timestamp")
+    assert final["daily_avg_value"].tolist() == [20.0, 20.0, 20.0, 5.0]
@@ -0,0 +1,97 @@
+import os
+import pandas as pd
+import pytest
+from benchmarks.synthetic import generate_dataset
+from src.ingestion import ingest_data
+from src.loader import load_and_partition
+from pipeline import run_pipeline
+from src.sharding import _date_range, plan_shards, run_sharded, shard_paths
+from src.transform import clean_and_transform_all_files
+from src.validate import run_data_quality_validation
+
+
+def file_bytes(root):
+    "Relative path -> content of every Parquet file under root."
+    found = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(".parquet"):
+                path = os.path.join(dirpath, name)
+                with open(path, "rb") as f:
+                    found[os.path.relpath(path, root)] = f.read()
+    return found
+
+
+@pytest.fixture
+def raw_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.ingestion.CHECKPOINT_FILE", str(tmp_path / "last_ingested.txt"))
+    monkeypatch.setattr("src.validate.REPORT_PATH", str(tmp_path / "report.csv"))
+    generate_dataset(tmp_path / "raw", days=12, sensors=6, freq="1h", gap_rate=0.0)
+    return tmp_path / "raw"
+
+
+def run_dirs(root):
+    return {name: str(root / name) for name in ["processed", "cleaned", "transformed"]}
+
+
+def test_plan_shards_ranges_and_halo():
+    files = [f"202506{day:02d}.parquet" for day in range(1, 13)]
+    specs = plan_shards(files, 4, by="date")
+    assert [len(s["files"]) for s in specs] == [3, 3, 3, 3]
+    assert specs[3]["halo"] == files[1:9]      # the 8 days before 2025-06-10
+    assert [(s["date_from"], s["date_to"]) for s in specs] == [
+        (None, "2025-06-04"), ("2025-06-04", "2025-06-07"), ("2025-06-07", "2025-06-10"), ("2025-06-10", None)]
+    with pytest.raises(ValueError):
+        plan_shards(files, 2, by="hour")
+
+
+@pytest.mark.parametrize("by", ["date", "sensor"])
+def test_sharded_run_is_byte_identical_to_single_node(raw_dir, tmp_path, monkeypatch, by):
+    single = run_dirs(tmp_path / "single")
+    monkeypatch.setattr("src.loader.TRANSFORMED_DIR", single["transformed"])
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(tmp_path / "single" / "final"))
+    ingest_data(raw_dir=str(raw_dir), processed_dir=single["processed"])
+    clean_and_transform_all_files(raw_dir=str(raw_dir), cleaned_dir=single["cleaned"],
+                                  transformed_dir=single["transformed"])
+    monkeypatch.setattr("src.validate.TRANSFORMED_DIR", single["transformed"])
+    expected = run_data_quality_validation()
+    load_and_partition()
+
+    sharded = run_dirs(tmp_path / "sharded")
+    monkeypatch.setattr("src.ingestion.CHECKPOINT_FILE", str(tmp_path / "sharded_checkpoint.txt"))
+    monkeypatch.setattr("src.loader.FINAL_OUTPUT_DIR", str(tmp_path / "sharded" / "final"))
+    # A partition of an earlier run that no file writes to any more
+    stale = tmp_path / "sharded" / "final" / "date=2025-01-01"
+    stale.mkdir(parents=True)
+    (stale / "data-0.parquet").write_bytes(b"old")
+    report = run_sharded(shards=4, by=by, workers=2, raw_dir=str(raw_dir), processed_dir=sharded["processed"],
+                         cleaned_dir=sharded["cleaned"], transformed_dir=sharded["transformed"])
+
+    for name in ["transformed", "final"]:
+        single_files = file_bytes(tmp_path / "single" / name)
+        assert single_files and file_bytes(tmp_path / "sharded" / name) == single_files
+    assert report["Time Coverage"] == expected["Time Coverage"]
+    assert report["Gap Intervals"] == expected["Gap Intervals"]
+    assert (tmp_path / "sharded_checkpoint.txt").read_text() == "20250612"
+
+    # A rerun over older files must not move the checkpoint back
+    (tmp_path / "sharded_checkpoint.txt").write_text("20991231")
+    run_sharded(shards=4, by=by, workers=2, raw_dir=str(raw_dir), processed_dir=sharded["processed"],
+                cleaned_dir=sharded["cleaned"], transformed_dir=sharded["transformed"])
+    assert (tmp_path / "sharded_checkpoint.txt").read_text() == "20991231"
+
+
+def test_date_shards_read_only_overlapping_files(tmp_path):
+    for day in ["20250605", "20250606", "20250607"]:
+        pd.DataFrame({"date": pd.Series([pd.Timestamp(day).date()], dtype="date32[pyarrow]"),
+                      "value": [1.0]}).to_parquet(tmp_path / f"{day}_transformed.parquet", index=False)
+    paths = sorted(str(p) for p in tmp_path.iterdir())
+    ranges = {path: _date_range(path) for path in paths}
+    specs = plan_shards(["20250605.parquet", "20250606.parquet", "20250607.parquet"], 3, by="date")
+    assert [len(shard_paths(spec, paths, ranges)) for spec in specs] == [1, 1, 1]
+    assert shard_paths({**specs[1], "by": "sensor"}, paths, ranges) == paths
+
+
+def test_sharded_pipeline_rejects_incremental_runs():
+    with pytest.raises(ValueError):
+        run_pipeline(mode="sharded")
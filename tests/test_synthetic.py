@@ -0,0 +1,21 @@
+import pandas as pd
+from benchmarks.synthetic import READING_TYPES, generate_dataset, generate_day
+
+
+def test_generator_injects_configured_defects():
+    clean = generate_day("2025-06-01", sensors=4, freq="1min", null_rate=0, outlier_rate=0,
+                         duplicate_rate=0, gap_rate=0)
+    assert len(clean) == 4 * len(READING_TYPES) * 1440
+    assert not clean.duplicated().any() and clean["value"].notna().all()
+
+    df = generate_day("2025-06-01", sensors=4, freq="1min", null_rate=0.05, duplicate_rate=0.02, gap_rate=1.0)
+    assert 0.03 < df["value"].isna().mean() < 0.07
+    assert df.duplicated().sum() > 0
+    # every series lost at least an hour
+    assert (df.drop_duplicates().groupby(["sensor_id", "reading_type"]).size() <= 1440 - 60).all()
+
+
+def test_generate_dataset_writes_one_file_per_day(tmp_path):
+    paths = generate_dataset(str(tmp_path), days=3, sensors=2, freq="1h")
+    assert [p.rsplit("/", 1)[-1] for p in paths] == ["20250601.parquet", "20250602.parquet", "20250603.parquet"]
+    assert pd.read_parquet(paths[1])["timestamp"].str.startswith("2025-06-02").all()
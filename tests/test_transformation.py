@@ -1,4 +1,6 @@
 import pandas as pd
+import pytest
+from src.schema import read_sensor_frame
 from src.transform import clean_and_transform_all_files
 
 def test_clean_and_transform(tmp_path):
@@ -34,3 +36,158 @@ def test_clean_and_transform(tmp_path):
 
     assert cleaned_files, "No cleaned parquet files created"
     assert transformed_files, "No transformed parquet files created"
+
+
+def test_normalized_value_uses_calibration_table():
+    from src.calibrations import CALIBRATION
+    from src.transform import transform_dataframe
+
+    df = pd.DataFrame({
+        "sensor_id": ["s1", "s1", "s2"],
+        "timestamp": ["2025-06-05 10:00:00", "2025-06-05 11:00:00", "2025-06-05 10:00:00"],
+        "reading_type": ["temperature", "humidity", "pressure"],
+        "value": [25.0, 40.0, 1013.0],
+        "battery_level": [90, 90, 80],
+    })
+
+    result = transform_dataframe(df).set_index("reading_type")["normalized_value"]
+
+    temp, hum = CALIBRATION["temperature"], CALIBRATION["humidity"]
+    assert result["temperature"] == 25.0 * temp["multiplier"] + temp["offset"]
+    assert result["humidity"] == 40.0 * hum["multiplier"] + hum["offset"]
+    assert result["pressure"] == 1013.0
+
+
+def test_transform_adds_native_time_keys():
+    import datetime
+    from src.schema import iso_strings
+    from src.transform import transform_dataframe
+
+    df = pd.DataFrame({
+        "sensor_id": ["s1", "s1"],
+        "timestamp": ["2025-06-05 18:45:00", "2025-06-05 19:10:00"],
+        "reading_type": ["temperature", "temperature"],
+        "value": [25.0, 26.0],
+        "battery_level": [90, 90],
+    })
+
+    result = transform_dataframe(df)
+
+    assert "timestamp_iso" not in result.columns
+    assert str(result["timestamp"].dt.tz) == "UTC"
+    assert str(result["timestamp_local"].dt.tz) == "UTC+05:30"
+    assert result["timestamp_local"].dt.hour.tolist() == [0, 0]   # next local day
+    assert result["date"].tolist() == [datetime.date(2025, 6, 5)] * 2
+    assert result["hour"].tolist() == [pd.Timestamp("2025-06-05 18:00", tz="UTC"),
+                                       pd.Timestamp("2025-06-05 19:00", tz="UTC")]
+    assert iso_strings(result["timestamp"]).tolist() == ["2025-06-06T00:15:00+0530", "2025-06-06T00:40:00+0530"]
+
+
+def make_raw_frame():
+    "Two sensors x two reading types over 40 hours, with an outlier, a null and duplicates."
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    frames = []
+    for sensor in ["s1", "s2"]:
+        for reading_type in ["temperature", "humidity"]:
+            frames.append(pd.DataFrame({
+                "sensor_id": sensor,
+                "timestamp": pd.date_range("2025-06-05", periods=40, freq="h").astype(str),
+                "reading_type": reading_type,
+                "value": rng.normal(30, 2, 40),
+                "battery_level": 90.0,
+            }))
+    df = pd.concat(frames, ignore_index=True)
+    df.loc[5, "value"] = 500.0      # outlier
+    df.loc[7, "value"] = None       # dropped
+    return pd.concat([df, df.iloc[10:15]], ignore_index=True)  # duplicates
+
+
+def test_streaming_engine_matches_pandas_engine(tmp_path, monkeypatch):
+    import src.streaming as streaming
+    from src.transform import clean_and_transform_file
+
+    make_raw_frame().to_parquet(tmp_path / "20250605.parquet", index=False)
+
+    clean_and_transform_file(tmp_path / "20250605.parquet", tmp_path / "c1.parquet", tmp_path / "t1.parquet")
+    # Tiny batches and collect limit exercise carried state and histogram median selection
+    monkeypatch.setattr(streaming, "MEDIAN_COLLECT_LIMIT", 5)
+    counts = streaming.stream_clean_and_transform_file(
+        tmp_path / "20250605.parquet", tmp_path / "c2.parquet", tmp_path / "t2.parquet", batch_size=17)
+
+    assert counts == (165, 159)
+    keys = ["sensor_id", "reading_type", "timestamp"]
+    expected = read_sensor_frame(tmp_path / "t1.parquet").sort_values(keys).reset_index(drop=True)
+    actual = read_sensor_frame(tmp_path / "t2.parquet").sort_values(keys).reset_index(drop=True)
+    assert expected["is_outlier"].sum() == 1
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+
+
+def test_streaming_engine_sorts_unordered_files_and_writes_atomically(tmp_path, monkeypatch):
+    import src.streaming as streaming
+    from src.transform import clean_and_transform_file
+
+    make_raw_frame().iloc[::-1].to_parquet(tmp_path / "20250605.parquet", index=False)
+    clean_and_transform_file(tmp_path / "20250605.parquet", tmp_path / "c1.parquet", tmp_path / "t1.parquet")
+    streaming.stream_clean_and_transform_file(
+        tmp_path / "20250605.parquet", tmp_path / "c2.parquet", tmp_path / "t2.parquet", batch_size=17)
+
+    for pandas_output, streamed_output in [("c1", "c2"), ("t1", "t2")]:
+        pd.testing.assert_frame_equal(read_sensor_frame(tmp_path / f"{pandas_output}.parquet"),
+                                      read_sensor_frame(tmp_path / f"{streamed_output}.parquet"), check_dtype=False)
+
+    # A failure part way through leaves neither output behind
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(streaming, "apply_calibration", fail)
+    with pytest.raises(OSError):
+        streaming.stream_clean_and_transform_file(
+            tmp_path / "20250605.parquet", tmp_path / "c3.parquet", tmp_path / "t3.parquet", batch_size=17)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "20250605.parquet", "c1.parquet", "c2.parquet", "t1.parquet", "t2.parquet"]
+
+
+def test_duckdb_engine_matches_pandas_engine(tmp_path):
+    from src.transform import clean_and_transform_file
+    from src.transform_duckdb import duckdb_clean_and_transform_file
+
+    make_raw_frame().to_parquet(tmp_path / "20250605.parquet", index=False)
+
+    assert clean_and_transform_file(
+        tmp_path / "20250605.parquet", tmp_path / "c1.parquet", tmp_path / "t1.parquet") == (165, 159)
+    assert duckdb_clean_and_transform_file(
+        tmp_path / "20250605.parquet", tmp_path / "c2.parquet", tmp_path / "t2.parquet") == (165, 159)
+
+    for cleaned in [False, True]:
+        name = "c{}.parquet" if cleaned else "t{}.parquet"
+        expected = read_sensor_frame(tmp_path / name.format(1)).reset_index(drop=True)
+        actual = read_sensor_frame(tmp_path / name.format(2))
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+
+
+def test_parallel_workers_isolate_failures_and_keep_order(tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for day in ["20250607", "20250605", "20250606"]:
+        pd.DataFrame({
+            "sensor_id": ["s1", "s2"],
+            "timestamp": [f"{day[:4]}-{day[4:6]}-{day[6:]} 10:00:00"] * 2,
+            "reading_type": ["temperature", "humidity"],
+            "value": [25.5, 40.2],
+            "battery_level": [90, 80],
+        }).to_parquet(raw_dir / f"{day}.parquet", index=False)
+    (raw_dir / "20250606.parquet").write_bytes(b"not a parquet file")
+
+    summaries = clean_and_transform_all_files(
+        raw_dir=str(raw_dir),
+        cleaned_dir=str(tmp_path / "cleaned"),
+        transformed_dir=str(tmp_path / "transformed"),
+        workers=2,
+    )
+
+    assert [s["file"] for s in summaries] == ["20250605.parquet", "20250606.parquet", "20250607.parquet"]
+    assert [s["status"] for s in summaries] == ["ok", "failed", "ok"]
+    assert summaries[0]["records_in"] == 2 and summaries[0]["records_cleaned"] == 2
+    assert len(list((tmp_path / "transformed").glob("*_transformed.parquet"))) == 2
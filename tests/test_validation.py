@@ -1,3 +1,4 @@
+import os
 import duckdb
 import pandas as pd
 from src.validate import run_data_quality_validation
@@ -21,3 +22,90 @@ def test_validation_schema_pass(tmp_path, monkeypatch):
     run_data_quality_validation()
 
     assert (tmp_path / "report.csv").exists(), "Data quality report not generated"
+
+
+def test_validation_metrics_use_configured_ranges(tmp_path, monkeypatch):
+    transformed_dir = tmp_path / "transformed"
+    transformed_dir.mkdir()
+
+    pd.DataFrame({
+        "sensor_id": ["s1", "s1", "s1", "s2"],
+        "timestamp_iso": ["2025-06-05T10:00:00Z", "2025-06-05T11:15:00Z",
+                          "2025-06-05T14:00:00Z", "2025-06-05T10:00:00Z"],
+        "value": [28.5, 99.0, None, 5.0],
+        "reading_type": ["temperature", "temperature", "temperature", "soil_moisture"],
+        "battery_level": [85.0, 85.0, 85.0, None],
+        "is_outlier": [False, True, False, False],
+    }).to_parquet(transformed_dir / "sensor_transformed.parquet")
+
+    monkeypatch.setattr("src.validate.TRANSFORMED_DIR", str(transformed_dir))
+    monkeypatch.setattr("src.validate.REPORT_PATH", str(tmp_path / "report.csv"))
+
+    report = run_data_quality_validation(expected_ranges={"temperature": (15, 40), "soil_moisture": (10, 100)})
+
+    out_of_range = {r["reading_type"]: r["out_of_range_count"] for r in report["Out-of-Range Counts"][0]}
+    assert out_of_range == {"temperature": 1, "soil_moisture": 1}
+
+    missing = {r["reading_type"]: r for r in report["Missing Values %"][0]}
+    assert round(missing["temperature"]["pct_missing_value"], 2) == 33.33
+    assert missing["soil_moisture"]["pct_missing_battery"] == 100.0
+
+    anomalies = {r["reading_type"]: r["pct_anomalous"] for r in report["Anomaly %"][0]}
+    assert round(anomalies["temperature"], 2) == 33.33
+
+    gaps = report["Hourly Gaps"][0]
+    assert gaps == [{"sensor_id": "s1", "reading_type": "temperature", "missing_hours": 2}]
+
+
+def test_detect_hourly_gaps_returns_intervals():
+    from src.validate import detect_hourly_gaps
+
+    con = duckdb.connect()
+    con.execute("""
+        CREATE TABLE obs AS
+        SELECT 's1' AS sensor_id, 'temperature' AS reading_type, CAST(h AS TIMESTAMP) AS hour
+        FROM (VALUES ('2025-06-05 00:00'), ('2025-06-05 01:00'), ('2025-06-05 04:00'),
+                     ('2025-06-05 05:00'), ('2025-06-07 05:00')) t(h)
+    """)
+
+    gaps = detect_hourly_gaps(con, "obs")
+
+    assert gaps["missing_hours"].tolist() == [2, 47]
+    assert gaps["gap_start"].astype(str).tolist() == ["2025-06-05 02:00:00", "2025-06-05 06:00:00"]
+    assert gaps["gap_end"].astype(str).tolist() == ["2025-06-05 03:00:00", "2025-06-07 04:00:00"]
+
+
+def test_incremental_validation_merges_previous_metrics(tmp_path, monkeypatch):
+    import src.validate as validate
+
+    transformed_dir = tmp_path / "transformed"
+    transformed_dir.mkdir()
+    monkeypatch.setattr("src.validate.TRANSFORMED_DIR", str(transformed_dir))
+    monkeypatch.setattr("src.validate.REPORT_PATH", str(tmp_path / "report.csv"))
+    monkeypatch.setattr("src.validate.METRICS_STORE_PATH", str(tmp_path / "metrics.parquet"))
+    manifest_path = str(tmp_path / "manifest.json")
+
+    def write_day(day, value):
+        pd.DataFrame({
+            "sensor_id": ["s1"],
+            "timestamp_iso": [f"{day}T12:00:00Z"],
+            "value": [value],
+            "reading_type": ["temperature"],
+            "battery_level": [85.0],
+        }).to_parquet(transformed_dir / f"{day}_transformed.parquet")
+
+    write_day("2025-06-05", 28.5)
+    run_data_quality_validation(manifest_path=manifest_path)
+
+    write_day("2025-06-06", 99.0)
+    scanned = []
+    original_scan = validate.scan_files
+    monkeypatch.setattr(validate, "scan_files",
+                        lambda con, files, ranges: scanned.extend(files) or original_scan(con, files, ranges))
+    report = run_data_quality_validation(manifest_path=manifest_path)
+
+    assert [os.path.basename(f) for f in scanned] == ["2025-06-06_transformed.parquet"]
+    coverage = report["Time Coverage"][0][0]
+    assert str(coverage["first_record"]).startswith("2025-06-05")
+    assert str(coverage["last_record"]).startswith("2025-06-06")
+    assert report["Out-of-Range Counts"][0] == [{"reading_type": "temperature", "out_of_range_count": 1}]
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+import pandas as pd
+from src.transform import clean_and_transform_all_files
+from src.windows import RollingWindow
+
+
+def make_hourly(days=10, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = [pd.DataFrame({
+        "sensor_id": sensor,
+        "timestamp": pd.date_range("2025-06-01", periods=days * 24, freq="h"),
+        "reading_type": "temperature",
+        "value": rng.normal(25, 2, days * 24),
+        "battery_level": 90.0,
+    }) for sensor in ["s1", "s2"]]
+    return pd.concat(frames, ignore_index=True)
+
+
+def brute_force(df, window="7D"):
+    rows = []
+    for _, row in df.iterrows():
+        in_window = ((df["sensor_id"] == row["sensor_id"]) & (df["timestamp"] <= row["timestamp"])
+                     & (df["timestamp"] > row["timestamp"] - pd.Timedelta(window)))
+        values = df.loc[in_window, "value"]
+        rows.append((values.mean(), values.min(), values.max(), len(values)))
+    return pd.DataFrame(rows, index=df.index, columns=["mean", "min", "max", "count"])
+
+
+def test_rolling_window_is_time_based_and_batch_invariant():
+    df = make_hourly().sample(frac=1, random_state=3)
+    expected = brute_force(df)
+
+    whole = RollingWindow(aggregates=["mean", "min", "max", "count"]).apply(df)
+    pd.testing.assert_frame_equal(whole, expected, check_dtype=False)
+    assert whole["count"].max() == 7 * 24
+
+    window = RollingWindow("24h", aggregates=["count"])
+    ordered = df.sort_values("timestamp")
+    chunked = pd.concat([window.apply(ordered.iloc[i:i + 50]) for i in range(0, len(df), 50)])
+    assert chunked["count"].max() == 24
+    assert len(window.tail) == 2 * 24
+
+
+def test_rolling_average_carries_across_daily_files(tmp_path):
+    df = make_hourly()
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for day, part in df.groupby(df["timestamp"].dt.strftime("%Y%m%d")):
+        part.assign(timestamp=part["timestamp"].astype(str)).to_parquet(raw_dir / f"{day}.parquet", index=False)
+    state_dir = str(tmp_path / "state")
+
+    # Two runs: the second resumes the window state saved by the first
+    later = tmp_path / "later"
+    later.mkdir()
+    for name in sorted(p.name for p in raw_dir.iterdir())[6:]:
+        (raw_dir / name).rename(later / name)
+    clean_and_transform_all_files(str(raw_dir), str(tmp_path / "c"), str(tmp_path / "t"),
+                                  window_state_dir=state_dir)
+    clean_and_transform_all_files(str(later), str(tmp_path / "c"), str(tmp_path / "t"),
+                                  window_state_dir=state_dir)
+
+    actual = pd.concat(pd.read_parquet(p) for p in sorted((tmp_path / "t").iterdir()))
+    actual = actual.sort_values(["sensor_id", "timestamp"]).reset_index(drop=True)
+    # Compared on the cleaned values, which the rolling average is computed from
+    actual["timestamp"] = actual["timestamp"].dt.tz_localize(None)
+    expected = brute_force(actual)["mean"]
+    assert actual["7d_rolling_avg"].notna().all()
+    np.testing.assert_allclose(actual["7d_rolling_avg"], expected.to_numpy(), rtol=1e-5)
+
+
+def test_batches_of_a_file_must_keep_series_in_time_order():
+    df = make_hourly(days=2)
+    window = RollingWindow()
+    window.start("20250601.parquet")
+    window.apply(df.iloc[24:48])
+    with pytest.raises(ValueError):
+        window.apply(df.iloc[:24])
+
+    # A new file may fall before what the window holds
+    window.start("20250531.parquet")
+    window.apply(df.iloc[:24])
+
+
+def test_reprocessed_file_replaces_its_readings(tmp_path):
+    df = make_hourly(days=3)
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for day, part in df.groupby(df["timestamp"].dt.strftime("%Y%m%d")):
+        part.to_parquet(raw_dir / f"{day}.parquet", index=False)
+    state_dir = str(tmp_path / "state")
+
+    def run():
+        clean_and_transform_all_files(str(raw_dir), str(tmp_path / "c"), str(tmp_path / "t"),
+                                      window_state_dir=state_dir)
+        return pd.read_parquet(tmp_path / "t" / "20250603_transformed.parquet")
+
+    first = run()
+    tail = RollingWindow.load(state_dir).tail
+    assert len(tail) == len(df)
+    second = run()
+    pd.testing.assert_frame_equal(RollingWindow.load(state_dir).tail, tail)
+    pd.testing.assert_frame_equal(first, second)